@@ -0,0 +1,113 @@
+"""
+Import time of the entry points, each measured in a fresh interpreter.
+
+For every module it reports the median wall time of ``import module`` over the runs,
+which heavy third-party packages got loaded, and the modules that cost the most
+(``python -X importtime``, self time, cumulative over the runs). The dump directory
+points at a path that does not exist: importing must not create it.
+
+python3 benchmarks/bench_import.py
+python3 benchmarks/bench_import.py runs:20 top:10
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+MODULES = ["src.config", "src.cli", "src.qids", "src.editors", "src.by_site", "src.sitelinks", "src.pipeline", "start"]
+
+HEAVY = ["pymysql", "tqdm", "requests", "mwclient", "sqlite3"]
+
+PROBE = """
+import json, sys, time
+began = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - began
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def parse_args(argv) -> dict:
+    # ---
+    args = {"runs": 7, "top": 5}
+    # ---
+    for arg in argv:
+        key, _, value = arg.partition(":")
+        if key in args and value.isdigit():
+            args[key] = int(value)
+    # ---
+    return args
+
+
+def self_times(stderr) -> Counter:
+    """{module: self time in µs} from the ``-X importtime`` lines."""
+    # ---
+    times = Counter()
+    # ---
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        times[name.strip()] += int(self_us)
+    # ---
+    return times
+
+
+def measure(module, runs, dump_path) -> tuple:
+    # ---
+    env = {**os.environ, "EDITORS_STATS_PATH": str(dump_path)}
+    # ---
+    seconds = []
+    loaded = []
+    times = Counter()
+    # ---
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module, heavy=HEAVY)],
+            cwd=ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        data = json.loads(result.stdout.strip().splitlines()[-1])
+        seconds.append(data["seconds"])
+        loaded = data["loaded"]
+        times += self_times(result.stderr)
+    # ---
+    return statistics.median(seconds), loaded, times
+
+
+def main(argv) -> None:
+    # ---
+    args = parse_args(argv)
+    # ---
+    dump_path = Path(tempfile.mkdtemp(prefix="editors_stats_import_")) / "dump"
+    # ---
+    print(f"{args['runs']} runs per module, dump directory {dump_path}")
+    print(f"{'module':<16}{'median ms':>10}  heavy packages loaded")
+    # ---
+    slowest = {}
+    # ---
+    for module in MODULES:
+        seconds, loaded, times = measure(module, args["runs"], dump_path)
+        print(f"{module:<16}{seconds * 1000:>10.1f}  {', '.join(loaded) or '-'}")
+        slowest[module] = times
+        # ---
+        assert not dump_path.exists(), f"importing {module} created {dump_path}"
+    # ---
+    for module, times in slowest.items():
+        top = ", ".join(f"{name} {us / args['runs'] / 1000:.1f}" for name, us in times.most_common(args["top"]))
+        print(f"\n{module}: {top} (ms of self time)")
+    # ---
+    print("\nno directory created at import")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
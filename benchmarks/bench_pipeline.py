@@ -0,0 +1,217 @@
+"""
+Offline end-to-end benchmark of start.start(), with local stand-ins for the replicas,
+Wikidata and mdwiki (see benchmarks/offline.py).
+
+The pipeline runs three times on the same synthetic data: a cold run (empty dump
+directory), a warm run of every stage (``force``: checkpoints, sitelinks cache and publish
+ledger in place) and a plain rerun, where the pipeline skips what is up to date. For each
+stage it reports the wall time, SQL queries and rows, Wikidata and mdwiki requests and
+the peak of traced Python memory; the counted editors are checked against the data.
+
+python3 benchmarks/bench_pipeline.py
+python3 benchmarks/bench_pipeline.py articles:5000 wikis:30 revisions:20 --jobs 4
+python3 benchmarks/bench_pipeline.py by_qid notrace
+
+"""
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import offline  # noqa: E402
+
+SCALE = {"articles": 1000, "wikis": 12, "revisions": 10, "actors": 3000, "seed": 1}
+
+
+class Probe:
+    """Counters of the stand-ins, and the per-stage / hot-path measurements."""
+
+    def __init__(self, replicas, wikidata, mdwiki, trace=True):
+        self.replicas = replicas
+        self.wikidata = wikidata
+        self.mdwiki = mdwiki
+        self.trace = trace
+        self.stages = []
+        self.hot = {}
+        self._lock = threading.Lock()
+
+    def counters(self) -> dict:
+        return {
+            "sql": sum(self.replicas.queries.values()),
+            "rows": self.replicas.rows,
+            "wikidata": self.wikidata.calls,
+            "mdwiki": sum(self.mdwiki.requests.values()),
+        }
+
+    def stage(self, name, func):
+        def wrapper(*args, **kwargs):
+            # ---
+            before = self.counters()
+            if self.trace:
+                tracemalloc.reset_peak()
+            start = time.perf_counter()
+            # ---
+            result = func(*args, **kwargs)
+            # ---
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if self.trace else 0
+            after = self.counters()
+            # ---
+            self.stages.append((name, seconds, {k: after[k] - before[k] for k in after}, peak))
+            return result
+
+        return wrapper
+
+    def hot_path(self, name, func):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    calls, seconds = self.hot.get(name, (0, 0.0))
+                    self.hot[name] = (calls + 1, seconds + time.perf_counter() - start)
+
+        return wrapper
+
+
+def parse_args(argv) -> dict:
+    # ---
+    scale = dict(SCALE)
+    # ---
+    for arg in argv:
+        key, _, value = arg.partition(":")
+        if key in scale and value.isdigit():
+            scale[key] = int(value)
+    # ---
+    return scale
+
+
+def patch(probe):
+    """Point the pipeline at the stand-ins, and wrap its stages and hot paths."""
+    # ---
+    import start
+    from src import all2, by_site, editors, qids, sitelinks
+    from src.wiki import outbox
+    from src.api_sql import wiki_sql
+    from src.services import mysql_client
+    from src.wiki import publish
+    # ---
+    wiki_sql.GET_SQL = lambda: True
+    mysql_client.make_sql_connect = probe.replicas.make_sql_connect
+    mysql_client.iter_sql_rows = probe.replicas.iter_sql_rows
+    # ---
+    # no DNS: spread the wikis over 8 fake replica sections
+    by_site._site_replica = lambda site: f"s{sum(map(ord, site)) % 8 + 1}"
+    # ---
+    sitelinks.wikidataapi_post = probe.wikidata.post
+    sitelinks.ids_limit = probe.wikidata.ids_limit
+    publish.get_pages_revids = probe.mdwiki.get_pages_revids
+    publish.get_pages_texts = probe.mdwiki.get_pages_texts
+    publish.page = probe.mdwiki.page
+    # ---
+    # the functions the pipeline stages call
+    qids.get_qids_list = probe.stage("qids", qids.get_qids_list)
+    sitelinks.load_sitelink_data = probe.stage("sitelinks", sitelinks.load_sitelink_data)
+    by_site.work_in_all_sites = probe.stage("sites", by_site.work_in_all_sites)
+    all2.work_all_editors = probe.stage("all page", all2.work_all_editors)
+    outbox.drain = probe.stage("publish", outbox.drain)
+    # ---
+    editors.get_editors_sql = probe.hot_path("get_editors_sql", editors.get_editors_sql)
+    editors.get_editors_by_qids = probe.hot_path("get_editors_by_qids", editors.get_editors_by_qids)
+    all2.get_all_editors = probe.stage("all editors", all2.get_all_editors)
+    # ---
+    return start
+
+
+def run(start, probe, label, force=True) -> None:
+    # ---
+    from src.services import metrics
+    from src.utils.actors import get_bots, get_global_bots
+    # ---
+    # a new process would ask for the bots again
+    get_bots.cache_clear()
+    get_global_bots.cache_clear()
+    metrics.reset()
+    probe.stages.clear()
+    probe.hot.clear()
+    # ---
+    argv = list(sys.argv)
+    if force:
+        sys.argv.append("force")
+    # ---
+    began = time.perf_counter()
+    try:
+        start.start()
+    finally:
+        sys.argv[:] = argv
+    total = time.perf_counter() - began
+    # ---
+    print(f"\n{label}: {total:.2f} s")
+    print(f"{'stage':<14}{'wall s':>9}{'sql':>7}{'rows':>10}{'wikidata':>10}{'mdwiki':>8}{'peak MB':>9}")
+    for name, seconds, delta, peak in probe.stages:
+        print(
+            f"{name:<14}{seconds:>9.3f}{delta['sql']:>7}{delta['rows']:>10}"
+            f"{delta['wikidata']:>10}{delta['mdwiki']:>8}{peak / 2**20:>9.1f}"
+        )
+    for name, (calls, seconds) in sorted(probe.hot.items()):
+        print(f"  {name:<22}{calls:>5} calls {seconds:>9.3f} s")
+
+
+def check(expected, year, min_count=10) -> None:
+    """The stored counts that get published (>= min_count; by_qid trims the rest with HAVING) must be the data's."""
+    # ---
+    from src.services.local_store import get_store
+    # ---
+    for site, counts in expected.items():
+        got = {actor: n for actor, n in get_store().site_editors(site, year).items() if n >= min_count}
+        counts = {actor: n for actor, n in counts.items() if n >= min_count}
+        assert got == counts, f"{site}: {len(got)} editors counted, {len(counts)} expected"
+
+
+def main(argv) -> None:
+    # ---
+    scale = parse_args(argv)
+    trace = "notrace" not in argv
+    # ---
+    root = Path(tempfile.mkdtemp(prefix="editors_stats_bench_"))
+    # ---
+    # before src is imported: config reads these once
+    os.environ["EDITORS_STATS_PATH"] = str(root / "dump")
+    os.environ["EDITORS_STATS_PUBLISH_RATE"] = "0"
+    os.environ.setdefault("TQDM_DISABLE", "1")
+    (root / "dump").mkdir()
+    logging.basicConfig(level=logging.DEBUG if "verbose" in argv else logging.WARNING)
+    # ---
+    print(f"data: {scale}, in {root}")
+    # ---
+    began = time.perf_counter()
+    replicas, wikidata, expected = offline.build(root / "replicas", **scale)
+    print(f"generated in {time.perf_counter() - began:.2f} s")
+    # ---
+    probe = Probe(replicas, wikidata, offline.FakeMdwiki(), trace=trace)
+    start = patch(probe)
+    # ---
+    if trace:
+        tracemalloc.start()
+    # ---
+    run(start, probe, "cold run")
+    check(expected, offline.YEAR)
+    # ---
+    run(start, probe, "warm run")
+    check(expected, offline.YEAR)
+    # ---
+    run(start, probe, "resumed run", force=False)
+    # ---
+    print(f"\ncounts of {len(expected)} wikis match the data, {len(probe.mdwiki.pages)} pages published")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
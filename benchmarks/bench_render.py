@@ -0,0 +1,111 @@
+"""
+Micro-benchmark: src.render against the string-concatenation code it replaced.
+
+python3 benchmarks/bench_render.py
+python3 benchmarks/bench_render.py rows:20000
+
+"""
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import render  # noqa: E402
+
+YEAR = 2024
+
+
+def legacy_site_page(site, editors, links_count):
+    # by_site.work_in_one_site before src.render
+    text = "{{:WPM:WikiProject Medicine/Total medical articles}}\n"
+    text += f"{{{{Top medical editors by lang|{YEAR}}}}}\n"
+    if site != "ar":
+        text += f"Numbers of {YEAR}. There are {links_count:,} articles in {site}\n"
+    text += """{| class="sortable wikitable"\n!#\n!User\n!Count\n|-"""
+    for i, (user, count) in enumerate(editors.items(), start=1):
+        user = user.replace("_", " ")
+        text += f"\n|-\n!{i}\n|[[:w:{site}:user:{user}|{user}]]\n|{count:,}"
+        if i == 100:
+            break
+    text += "\n|}"
+    return text
+
+
+def legacy_targets_text(targets):
+    tt = '{| class="sortable wikitable floatright"\n|\n'
+    tt += '<div style="max-height:250px; overflow: auto;vertical-align:top;font-size:90%;max-width:400px">\n'
+    tt += "<pre>\n"
+    tt += targets
+    tt += "\n</pre>"
+    tt += "\n</div>"
+    tt += "\n|-\n|}"
+    return tt
+
+
+def legacy_all_page(editors):
+    # all2.work_all_editors before src.render
+    text = "{{:WPM:WikiProject Medicine/Total medical articles}}\n"
+    text += f"{{{{Top medical editors by lang|{YEAR}}}}}\n"
+    text += f"Numbers of {YEAR}.\n"
+    txt_table = """{| class="sortable wikitable"\n!#\n!User\n!Count\n"""
+    txt_table += """!Wiki\n"""
+    targets = ""
+    for i, (user, ta) in enumerate(editors.items(), start=1):
+        count = ta["count"]
+        wiki = ta["site"]
+        user = user.replace("_", " ")
+        targets += f"#{{{{#target:User:{user}|{wiki}.wikipedia.org}}}}\n"
+        txt_table += f"|-\n" f"!{i}\n" f"|[[:w:{wiki}:user:{user}|{user}]]\n" f"|{count:,}\n" f"|{wiki}\n"
+        if count < 10:
+            break
+    txt_table += "\n|}"
+    text += legacy_targets_text(targets)
+    text += f"\n==users==\n{txt_table}"
+    return text
+
+
+def make_data(rows, sites=300):
+    rng = random.Random(1)
+    wikis = [f"w{n}" for n in range(sites)]
+    users = {f"User_{n}": {"count": rng.randint(10, 5000), "site": rng.choice(wikis)} for n in range(rows)}
+    users = dict(render.ranked(users, count=lambda ta: ta["count"]))
+    # inputs come ranked (by_site.filter_editors, all2.get_all_editors), as in the pipeline
+    per_site = {
+        wiki: dict(render.ranked({f"User_{n}": rng.randint(10, 900) for n in range(rng.randint(10, 400))}))
+        for wiki in wikis
+    }
+    return users, per_site
+
+
+def main():
+    # ---
+    rows = 5000
+    for arg in sys.argv:
+        arg, _, value = arg.partition(":")
+        if arg == "rows" and value.isdigit():
+            rows = int(value)
+    # ---
+    users, per_site = make_data(rows)
+    # ---
+    assert render.all_page(users, YEAR) == legacy_all_page(users)
+    assert all(render.site_page(w, e, 1234, YEAR) == legacy_site_page(w, e, 1234) for w, e in per_site.items())
+    # ---
+    cases = [
+        (f"all page, {rows} rows", lambda: legacy_all_page(users), lambda: render.all_page(users, YEAR)),
+        (
+            f"{len(per_site)} site pages",
+            lambda: [legacy_site_page(w, e, 1234) for w, e in per_site.items()],
+            lambda: render.site_pages({w: (e, 1234) for w, e in per_site.items()}, YEAR),
+        ),
+    ]
+    # ---
+    for name, legacy, new in cases:
+        old_t = min(timeit.repeat(legacy, number=5, repeat=3)) / 5
+        new_t = min(timeit.repeat(new, number=5, repeat=3)) / 5
+        print(f"{name:<28} legacy {old_t * 1000:8.2f} ms   render {new_t * 1000:8.2f} ms   x{old_t / new_t:.2f}")
+
+
+if __name__ == "__main__":
+    main()
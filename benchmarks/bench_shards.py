@@ -0,0 +1,111 @@
+"""
+Offline benchmark of a sharded run (src/shards.py) against a single job, on the synthetic
+replicas of benchmarks/offline.py.
+
+Both start from the same site files. The single job counts every site
+(python3 -m src count); the sharded run plans N shards, counts them in N processes at
+once, then merges them. It reports the wall time of each, the expected and actual time of
+each shard, and checks the merged counts against the data.
+
+python3 benchmarks/bench_shards.py
+python3 benchmarks/bench_shards.py shards:4 articles:5000 wikis:40 revisions:20
+"""
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import bench_pipeline  # noqa: E402
+import offline  # noqa: E402
+
+
+def setup_env(dump) -> None:
+    # before src is imported: config reads these once
+    os.environ["EDITORS_STATS_PATH"] = str(dump)
+    os.environ["EDITORS_STATS_PUBLISH_RATE"] = "0"
+    os.environ.setdefault("TQDM_DISABLE", "1")
+
+
+def worker(root, dump, args) -> None:
+    """One job (``count``, ``count shard:I/N``) on the stand-ins, in its own process."""
+    # ---
+    setup_env(dump)
+    sys.argv = ["src", *args]
+    logging.basicConfig(level=logging.WARNING)
+    # ---
+    replicas = offline.Replicas(Path(root) / "replicas")
+    bench_pipeline.patch(bench_pipeline.Probe(replicas, offline.FakeWikidata({}), offline.FakeMdwiki(), trace=False))
+    # ---
+    from src import cli
+    # ---
+    cli.main()
+
+
+def spawn(root, dump, *args) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, __file__, "worker", str(root), str(dump), *args])
+
+
+def main(argv) -> None:
+    # ---
+    scale = bench_pipeline.parse_args(argv)
+    count = next((int(arg[7:]) for arg in argv if arg.startswith("shards:") and arg[7:].isdigit()), 3)
+    # ---
+    root = Path(tempfile.mkdtemp(prefix="editors_stats_shards_"))
+    sharded, single = root / "sharded", root / "single"
+    # ---
+    setup_env(sharded)
+    logging.basicConfig(level=logging.WARNING)
+    # ---
+    print(f"data: {scale}, {count} shards, in {root}")
+    # ---
+    replicas, wikidata, expected = offline.build(root / "replicas", **scale)
+    bench_pipeline.patch(bench_pipeline.Probe(replicas, wikidata, offline.FakeMdwiki(), trace=False))
+    # ---
+    from src import pipeline, shards
+    # ---
+    # the site files both runs count
+    pipeline.run(["bench", "stage:qids", "stage:sitelinks"])
+    shutil.copytree(sharded, single)
+    # ---
+    began = time.perf_counter()
+    assert spawn(root, single, "count").wait() == 0
+    single_seconds = time.perf_counter() - began
+    # ---
+    began = time.perf_counter()
+    plan = shards.make_plan(count)
+    # ---
+    jobs = [spawn(root, sharded, "count", f"shard:{index}/{count}") for index in range(1, count + 1)]
+    assert all(job.wait() == 0 for job in jobs)
+    counted = time.perf_counter()
+    # ---
+    merged = shards.merge_shards()
+    sharded_seconds = time.perf_counter() - began
+    # ---
+    print(f"\nsingle job  {single_seconds:8.2f} s")
+    print(
+        f"sharded     {sharded_seconds:8.2f} s"
+        f" (shards {counted - began:.2f} s, merge {began + sharded_seconds - counted:.2f} s: {merged})"
+    )
+    print(f"\n{'shard':<7}{'sites':>6}{'expected':>10}{'wall s':>9}")
+    for index, sites in enumerate(plan["shards"], start=1):
+        status = json.loads((shards.shard_path(index) / "shard.json").read_text(encoding="utf-8"))
+        expected_cost = sum(plan["costs"][site] for site in sites)
+        print(f"{index:<7}{len(sites):>6}{expected_cost:>10.0f}{status['finished'] - status['started']:>9.2f}")
+    # ---
+    bench_pipeline.check(expected, offline.YEAR)
+    print(f"\nmerged counts of {len(expected)} wikis match the data")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["worker"]:
+        worker(sys.argv[2], sys.argv[3], sys.argv[4:])
+    else:
+        main(sys.argv[1:])
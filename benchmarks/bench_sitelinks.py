@@ -0,0 +1,119 @@
+"""
+Offline benchmark of a full sitelinks refresh (sitelinks.refresh_sitelinks_cache) against
+a stand-in Wikidata API that takes time per request and per id, allows 500 or 50 ids per
+request, and can fail: requests with no reply (network) and replies that leave ids out.
+
+For each case it reports the wall time, requests and ids sent, and checks that every item
+reached the cache with its sitelinks.
+
+python3 benchmarks/bench_sitelinks.py
+python3 benchmarks/bench_sitelinks.py articles:20000 workers:8
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import bench_pipeline  # noqa: E402
+import offline  # noqa: E402
+
+
+class FlakyWikidata(offline.FakeWikidata):
+    """FakeWikidata with latency, and ``fail`` of the requests unanswered or trimmed by one id."""
+
+    def __init__(self, items, limit=500, fail=0.0, seconds=0.05, per_id=0.0004, seed=1):
+        super().__init__(items, limit=limit)
+        self.fail = fail
+        self.seconds = seconds
+        self.per_id = per_id
+        self.random = random.Random(seed)
+        self._draw = threading.Lock()
+
+    def post(self, params, max_tries=5):
+        # ---
+        ids = params["ids"].split("|")
+        time.sleep(self.seconds + self.per_id * len(ids))
+        # ---
+        with self._draw:
+            roll = self.random.random()
+        # ---
+        if roll < self.fail / 2:
+            with self._lock:
+                self.calls += 1
+            return None
+        # ---
+        data = super().post(params, max_tries)
+        # ---
+        if roll < self.fail and "entities" in data:
+            data["entities"].pop(ids[-1], None)
+        # ---
+        return data
+
+
+def main(argv) -> None:
+    # ---
+    scale = bench_pipeline.parse_args(argv)
+    workers = next((int(arg[8:]) for arg in argv if arg.startswith("workers:") and arg[8:].isdigit()), 4)
+    # ---
+    root = Path(tempfile.mkdtemp(prefix="editors_stats_sitelinks_"))
+    # ---
+    # before src is imported: config reads these once
+    os.environ["EDITORS_STATS_PATH"] = str(root / "dump")
+    os.environ["EDITORS_STATS_WIKIDATA_WORKERS"] = str(workers)
+    os.environ.setdefault("TQDM_DISABLE", "1")
+    logging.basicConfig(level=logging.ERROR)
+    # ---
+    print(f"data: {scale}, {workers} workers, in {root}")
+    # ---
+    replicas, wikidata, _ = offline.build(root / "replicas", **scale)
+    bench_pipeline.patch(bench_pipeline.Probe(replicas, wikidata, offline.FakeMdwiki(), trace=False))
+    # ---
+    from src import pipeline, sitelinks
+    from src.qids import load_qids_from_file
+    # ---
+    pipeline.run(["bench", "stage:qids"])
+    qids = list(load_qids_from_file())
+    # ---
+    expected = {
+        qid: {site: title for site, title in links.items() if sitelinks.is_processed_site(site)}
+        for qid, links in wikidata.items.items()
+        if qid in set(qids)
+    }
+    # ---
+    cases = [
+        ("apihighlimits", 500, 0.0),
+        ("no apihighlimits", 50, 0.0),
+        ("apihighlimits, 4% fail", 500, 0.04),
+        ("no apihighlimits, 4% fail", 50, 0.04),
+    ]
+    # ---
+    print(f"\n{len(qids)} items")
+    print(f"{'account':<28}{'wall s':>8}{'requests':>10}{'ids sent':>10}  complete")
+    # ---
+    for label, limit, fail in cases:
+        # ---
+        api = FlakyWikidata(wikidata.items, limit=limit, fail=fail)
+        sitelinks.wikidataapi_post = api.post
+        sitelinks.ids_limit = api.ids_limit
+        # ---
+        if sitelinks.sitelinks_cache_file.exists():
+            sitelinks.sitelinks_cache_file.unlink()
+        # ---
+        began = time.perf_counter()
+        cache = sitelinks.refresh_sitelinks_cache(qids)
+        seconds = time.perf_counter() - began
+        # ---
+        complete = {qid: item["sitelinks"] for qid, item in cache.items()} == expected
+        print(f"{label:<28}{seconds:>8.2f}{api.calls:>10}{api.ids:>10}  {complete}")
+        assert complete, f"{label}: {len(expected) - len(cache)} items missing"
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,99 @@
+"""
+Offline benchmark of a multi-year backfill: one query per chunk grouped by year
+(editors.get_editors_years) or by month (editors.get_editors_months, summed per year
+here) against one run of get_editors_sql per year, on the synthetic replicas of
+benchmarks/offline.py. All three must give the same counts.
+
+python3 benchmarks/bench_years.py
+python3 benchmarks/bench_years.py years:5 articles:5000 wikis:30
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import bench_pipeline  # noqa: E402
+import offline  # noqa: E402
+
+
+def timed(replicas, func) -> tuple:
+    # ---
+    queries, rows = sum(replicas.queries.values()), replicas.rows
+    began = time.perf_counter()
+    # ---
+    result = func()
+    # ---
+    seconds = time.perf_counter() - began
+    # ---
+    return result, seconds, sum(replicas.queries.values()) - queries, replicas.rows - rows
+
+
+def main(argv) -> None:
+    # ---
+    scale = bench_pipeline.parse_args(argv)
+    count = next((int(arg[6:]) for arg in argv if arg.startswith("years:") and arg[6:].isdigit()), 5)
+    years = list(range(offline.YEAR - count + 1, offline.YEAR + 1))
+    # ---
+    root = Path(tempfile.mkdtemp(prefix="editors_stats_years_"))
+    # ---
+    # before src is imported: config reads these once
+    os.environ["EDITORS_STATS_PATH"] = str(root / "dump")
+    os.environ.setdefault("TQDM_DISABLE", "1")
+    logging.basicConfig(level=logging.WARNING)
+    # ---
+    print(f"data: {scale}, years {years[0]}-{years[-1]}, in {root}")
+    # ---
+    replicas, wikidata, _ = offline.build(root / "replicas", **scale)
+    probe = bench_pipeline.Probe(replicas, wikidata, offline.FakeMdwiki(), trace=False)
+    bench_pipeline.patch(probe)
+    # ---
+    from src import by_site, editors, pipeline
+    # ---
+    pipeline.run(["bench", "stage:qids", "stage:sitelinks"])
+    sites = [(site[:-4], by_site.load_site_links(file)) for site, file in by_site.list_site_files()]
+    # ---
+    def per_year():
+        counts = {}
+        for site, links in sites:
+            for year in years:
+                ts_from, ts_to = editors.year_window(year)
+                counts[(site, year)] = editors.get_editors_sql(links, site, ts_from=ts_from, ts_to=ts_to)
+        return counts
+    # ---
+    def grouped():
+        counts = {}
+        for site, links in sites:
+            for year, editors_ in editors.get_editors_years(links, site, years, do_dump=False).items():
+                counts[(site, year)] = editors_
+        return counts
+    # ---
+    def by_month():
+        counts = {}
+        for site, links in sites:
+            for month, editors_ in editors.get_editors_months(links, site, f"{years[0]}01", do_dump=False).items():
+                year = counts.setdefault((site, int(month[:4])), {})
+                for actor, n in editors_.items():
+                    year[actor] = year.get(actor, 0) + n
+        # the years without edits, as the other two modes give them
+        return {(site, year): counts.get((site, year), {}) for site, _ in sites for year in years}
+    # ---
+    print(f"\n{len(sites)} wikis, {len(years)} years")
+    print(f"{'mode':<12}{'wall s':>9}{'queries':>9}{'rows':>10}")
+    # ---
+    results = {}
+    for label, func in (("per year", per_year), ("grouped", grouped), ("by month", by_month)):
+        results[label], seconds, queries, rows = timed(replicas, func)
+        print(f"{label:<12}{seconds:>9.3f}{queries:>9}{rows:>10}")
+    # ---
+    assert results["per year"] == results["grouped"], "grouped counts differ from the per-year counts"
+    assert results["per year"] == results["by month"], "monthly counts differ from the per-year counts"
+    print("\nthe grouped passes give the per-year counts")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,353 @@
+"""
+Local stand-ins for the services the pipeline talks to, for offline benchmarks.
+
+- ``Replicas``: one SQLite file per wiki with the replica tables the queries use
+  (page, revision, actor, user_groups, categorylinks, page_props, page_assessments, ...),
+  and centralauth.sqlite with the global groups,
+  filled with synthetic data. Its ``make_sql_connect`` / ``iter_sql_rows`` replace the
+  ones of src.services.mysql_client, after a small MySQL -> SQLite translation.
+- ``FakeWikidata``: answers wbgetentities (``props``, ``sitefilter``) from the same data.
+- ``FakeMdwiki``: an in-memory mdwiki for src.wiki.publish (revids, texts, saves).
+
+``build(root, ...)`` generates everything from a seed and also returns the expected
+per-site counts, so a benchmark run can check what it measured.
+"""
+import random
+import re
+import sqlite3
+import threading
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+YEAR = datetime.now().year - 1
+
+LANGS = ["ar", "fr", "de", "es", "it", "pt", "ru", "ja", "zh", "fa", "he", "tr", "pl", "nl", "sv", "uk", "vi", "id"]
+
+REPLICA_SCHEMA = """
+CREATE TABLE page (page_id INTEGER PRIMARY KEY, page_namespace INTEGER, page_title TEXT);
+CREATE TABLE actor (actor_id INTEGER PRIMARY KEY, actor_name TEXT, actor_user INTEGER);
+CREATE TABLE revision (rev_id INTEGER PRIMARY KEY, rev_page INTEGER, rev_actor INTEGER, rev_timestamp TEXT);
+CREATE TABLE user_groups (ug_user INTEGER, ug_group TEXT);
+CREATE TABLE user_former_groups (ufg_user INTEGER, ufg_group TEXT);
+CREATE TABLE categorylinks (cl_from INTEGER, cl_to TEXT);
+CREATE TABLE page_props (pp_page INTEGER, pp_propname TEXT, pp_value TEXT);
+CREATE TABLE page_assessments (pa_page_id INTEGER, pa_project_id INTEGER);
+CREATE TABLE page_assessments_projects (pap_project_id INTEGER, pap_project_title TEXT);
+"""
+
+CENTRALAUTH_SCHEMA = """
+CREATE TABLE globaluser (gu_id INTEGER PRIMARY KEY, gu_name TEXT);
+CREATE TABLE global_user_groups (gug_user INTEGER, gug_group TEXT);
+"""
+
+# the indexes the replicas have for these queries
+REPLICA_INDEXES = """
+CREATE INDEX page_name_title ON page (page_namespace, page_title);
+CREATE INDEX page_title ON page (page_title);
+CREATE INDEX rev_page_timestamp ON revision (rev_page, rev_timestamp);
+CREATE INDEX pp_propname_page ON page_props (pp_propname, pp_page);
+CREATE INDEX pp_value ON page_props (pp_value);
+CREATE INDEX cl_to ON categorylinks (cl_to, cl_from);
+CREATE INDEX pp_page ON page_props (pp_page, pp_propname);
+ANALYZE;
+"""
+
+_DOUBLE_QUOTED = re.compile(r'"((?:[^"\\]|\\.)*)"')
+_HASH_COMMENT = re.compile(r"(?m)^\s*#.*$")
+_BACKSLASH = re.compile(r"\\(.)")
+# LEFT is a keyword (LEFT JOIN) in SQLite, not a function
+_LEFT = re.compile(r"\bLEFT\(([\w.]+),\s*(\d+)\)", re.IGNORECASE)
+
+
+def to_sqlite(query, values=None) -> str:
+    """Rewrite the MySQL dialect of the pipeline's queries for SQLite."""
+    # ---
+    query = _HASH_COMMENT.sub("", query)
+    query = _LEFT.sub(r"substr(\1, 1, \2)", query)
+    # ---
+    # "escaped \"strings\"" -> 'escaped "strings"'
+    query = _DOUBLE_QUOTED.sub(lambda m: "'" + _BACKSLASH.sub(r"\1", m.group(1)).replace("'", "''") + "'", query)
+    # ---
+    if values is not None:
+        query = query.replace("%s", "?").replace("%%", "%")
+    # ---
+    return query
+
+
+class Replicas:
+    """SQLite stand-in of the analytics replicas, one database file per wiki."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.queries = Counter()
+        self.rows = 0
+
+    def db_file(self, db: str) -> Path:
+        # "frwiki_p" -> frwiki.sqlite
+        return self.root / f"{db[:-2] if db.endswith('_p') else db}.sqlite"
+
+    def create(self, wiki: str, schema=REPLICA_SCHEMA) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_file(wiki)))
+        conn.executescript(schema)
+        return conn
+
+    def _connect(self, db):
+        return sqlite3.connect(f"file:{self.db_file(db)}?mode=ro", uri=True)
+
+    def _record(self, db, rows) -> None:
+        with self._lock:
+            self.queries[db] += 1
+            self.rows += rows
+
+    def iter_sql_rows(self, query, db="", host="", values=None, batch_size=1000, as_tuples=False, raise_errors=False):
+        # ---
+        conn = self._connect(db)
+        count = 0
+        # ---
+        try:
+            cursor = conn.execute(to_sqlite(query, values), tuple(values or ()))
+            names = [d[0] for d in cursor.description or []]
+            # ---
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                count += len(batch)
+                for row in batch:
+                    yield row if as_tuples else dict(zip(names, row))
+        finally:
+            conn.close()
+            self._record(db, count)
+
+    def make_sql_connect(self, query, db="", host="", values=None, as_tuples=False, raise_errors=False):
+        return list(self.iter_sql_rows(query, db=db, host=host, values=values, as_tuples=as_tuples))
+
+
+class FakeWikidata:
+    """wbgetentities over {qid: {site: title}}, for an account that may ask for ``limit`` ids at once."""
+
+    def __init__(self, items: dict, limit=500):
+        self.items = items
+        self.limit = limit
+        self.calls = 0
+        self.ids = 0
+        self._lock = threading.Lock()
+
+    def ids_limit(self) -> int:
+        # what src.wiki.wikidata.ids_limit reads from meta=userinfo
+        return self.limit
+
+    def post(self, params, max_tries=5):
+        # ---
+        ids = params["ids"].split("|")
+        # ---
+        if len(ids) > self.limit:
+            with self._lock:
+                self.calls += 1
+            info = f'Too many values supplied for parameter "ids". The limit is {self.limit}.'
+            return {"error": {"code": "toomanyvalues", "info": info}}
+        props = params.get("props", "").split("|")
+        sitefilter = set(params["sitefilter"].split("|")) if params.get("sitefilter") else None
+        # ---
+        with self._lock:
+            self.calls += 1
+            self.ids += len(ids)
+        # ---
+        entities = {}
+        for qid in ids:
+            links = self.items.get(qid)
+            if links is None:
+                entities[qid] = {"id": qid, "missing": ""}
+                continue
+            entity = {"id": qid}
+            if "info" in props:
+                entity["lastrevid"] = int(qid[1:]) * 10
+            if "sitelinks" in props:
+                entity["sitelinks"] = {
+                    site: {"site": site, "title": title, "badges": []}
+                    for site, title in links.items()
+                    if sitefilter is None or site in sitefilter
+                }
+            entities[qid] = entity
+        # ---
+        return {"entities": entities, "success": 1}
+
+
+class FakeMdwiki:
+    """In-memory mdwiki: what src.wiki.publish needs from mdwiki_page_mwclient."""
+
+    def __init__(self):
+        self.pages = {}  # title -> (revid, text)
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._revid = 0
+
+    def get_pages_revids(self, titles, batch_size=50):
+        titles = list(titles)
+        with self._lock:
+            self.requests["info"] += -(-len(titles) // batch_size)
+            return {title: self.pages.get(title, (0, ""))[0] for title in titles}
+
+    def get_pages_texts(self, titles, batch_size=50):
+        titles = list(titles)
+        with self._lock:
+            self.requests["revisions"] += -(-len(titles) // batch_size)
+            return {title: self.pages.get(title, (0, ""))[1] for title in titles}
+
+    def page(self, title, text=None):
+        return _FakePage(self, title, text)
+
+    def _save(self, title, text) -> int:
+        with self._lock:
+            self.requests["edit"] += 1
+            self._revid += 1
+            self.pages[title] = (self._revid, text)
+            return self._revid
+
+
+class _FakePage:
+    def __init__(self, wiki: FakeMdwiki, title: str, text: str = None):
+        self.wiki = wiki
+        self.title = title
+        self._text = text
+
+    def get_text(self):
+        if self._text is None:
+            self._text = self.wiki.get_pages_texts([self.title])[self.title]
+        return self._text
+
+    def revision(self):
+        return self.wiki.pages.get(self.title, (0, ""))[0]
+
+    def save(self, newtext, summary, minor=False, nocreate=0):
+        self._text = newtext
+        return {"result": "Success", "newrevid": self.wiki._save(self.title, newtext)}
+
+
+def _actor_names(actors, rng) -> list:
+    """[(name, is_bot)]: mostly registered editors, a few bots, IPs and temporary accounts."""
+    # ---
+    names = []
+    for n in range(1, actors + 1):
+        kind = rng.random()
+        if kind < 0.03:
+            names.append((f"Helper_{n}_bot", True))
+        elif kind < 0.10:
+            names.append((f"10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}", False))
+        elif kind < 0.13:
+            names.append((f"~{YEAR}-{n:05d}-1", False))
+        else:
+            names.append((f"Editor_{n}", False))
+    # ---
+    names.append(("CommonsDelinker", False))
+    # ---
+    return names
+
+
+def build(root, articles=1000, wikis=12, revisions=10, actors=3000, seed=1) -> tuple:
+    """
+    Generate the replicas and the Wikidata items.
+
+    Returns (Replicas, FakeWikidata, expected) where expected is {site: {actor: count}}
+    of the revisions in YEAR on each wiki's linked articles, without bots, IPs,
+    temporary accounts and excluded accounts (the ``ar`` wiki is counted differently
+    and is not included).
+    """
+    # ---
+    rng = random.Random(seed)
+    replicas = Replicas(root)
+    # ---
+    langs = (LANGS + [f"x{n}" for n in range(len(LANGS), wikis)])[:wikis]
+    # ---
+    names = _actor_names(actors, rng)
+    uncounted = {name for name, is_bot in names if is_bot or not name.startswith("Editor_")}
+    # ---
+    # every other bot is a global bot, flagged in no wiki
+    global_bots = {n for n, (_, is_bot) in enumerate(names, start=1) if is_bot and n % 2}
+    conn = replicas.create("centralauth", CENTRALAUTH_SCHEMA)
+    conn.executemany("INSERT INTO globaluser VALUES (?, ?)", [(n, names[n - 1][0]) for n in sorted(global_bots)])
+    conn.executemany("INSERT INTO global_user_groups VALUES (?, 'global-bot')", [(n,) for n in sorted(global_bots)])
+    conn.commit()
+    conn.close()
+    # ---
+    # enwiki: the WikiProject Medicine talk pages and the items of their articles
+    conn = replicas.create("enwiki")
+    conn.executemany(
+        "INSERT INTO page VALUES (?, ?, ?)",
+        [(2 * i + ns, ns, f"Article_{i}") for i in range(1, articles + 1) for ns in (0, 1)],
+    )
+    conn.executemany(
+        "INSERT INTO categorylinks VALUES (?, 'All_WikiProject_Medicine_pages')",
+        [(2 * i + 1,) for i in range(1, articles + 1)],
+    )
+    conn.executemany(
+        "INSERT INTO page_props VALUES (?, 'wikibase_item', ?)", [(2 * i, f"Q{i}") for i in range(1, articles + 1)]
+    )
+    conn.executescript(REPLICA_INDEXES)
+    conn.commit()
+    conn.close()
+    # ---
+    items = {f"Q{i}": {"enwiki": f"Article {i}"} for i in range(1, articles + 1)}
+    expected = {}
+    # ---
+    for w, lang in enumerate(langs):
+        # ---
+        site = f"{lang}wiki"
+        coverage = 0.9 * (1 - w / (len(langs) + 1))
+        # ---
+        conn = replicas.create(site)
+        conn.executemany(
+            "INSERT INTO actor VALUES (?, ?, ?)",
+            [(n, name, n) for n, (name, _) in enumerate(names, start=1)],
+        )
+        conn.executemany(
+            "INSERT INTO user_groups VALUES (?, 'bot')",
+            [(n,) for n, (_, is_bot) in enumerate(names, start=1) if is_bot and n not in global_bots],
+        )
+        conn.execute("INSERT INTO page_assessments_projects VALUES (1, 'طب')")
+        # ---
+        pages, props, assessed, revs = [], [], [], []
+        counts = Counter()
+        page_id = 0
+        # ---
+        for i in range(1, articles + 1):
+            # ---
+            if rng.random() > coverage:
+                continue
+            # ---
+            title = f"{lang} Article {i}"
+            items[f"Q{i}"][site] = title
+            # ---
+            # the article, its talk page (same title, never counted) and an unrelated page
+            page_id += 3
+            pages += [(page_id, 0, title.replace(" ", "_")), (page_id + 1, 1, title.replace(" ", "_"))]
+            pages.append((page_id + 2, 0, f"Other_{lang}_{i}"))
+            props.append((page_id, "wikibase_item", f"Q{i}"))
+            assessed.append((page_id, 1))
+            # ---
+            for p in (page_id, page_id + 1, page_id + 2):
+                for _ in range(rng.randint(0, 2 * revisions)):
+                    # a few very active editors, a long tail of occasional ones
+                    actor = min(int(rng.paretovariate(0.8)), len(names))
+                    year = YEAR if rng.random() < 0.8 else YEAR - 1
+                    ts = f"{year}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}{rng.randint(0, 235959):06d}"
+                    revs.append((p, actor, ts))
+                    # ---
+                    if p == page_id and year == YEAR and names[actor - 1][0] not in uncounted:
+                        counts[names[actor - 1][0]] += 1
+        # ---
+        conn.executemany("INSERT INTO page VALUES (?, ?, ?)", pages)
+        conn.executemany("INSERT INTO page_props VALUES (?, ?, ?)", props)
+        conn.executemany("INSERT INTO page_assessments VALUES (?, ?)", assessed)
+        conn.executemany("INSERT INTO revision (rev_page, rev_actor, rev_timestamp) VALUES (?, ?, ?)", revs)
+        conn.executescript(REPLICA_INDEXES)
+        conn.commit()
+        conn.close()
+        # ---
+        if lang != "ar":
+            expected[lang] = dict(counts)
+    # ---
+    return replicas, FakeWikidata(items), expected
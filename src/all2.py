@@ -1,44 +1,34 @@
 """
 
 """
+import heapq
 import json
 import logging
 import os
 from datetime import datetime
 
-from .config import editors_dump_path
-from .editors import validate_ip
-from .wiki import page
+from .config import editors_dump_path, ensure_dir, skip_sites
+from .render import all_page, all_title
+from .services.local_store import get_store
+from .utils.actors import is_excluded
+from .wiki import outbox
 
 logger = logging.getLogger(__name__)
 last_year = datetime.now().year - 1
-skip_sites = ["enwiki", "wikidatawiki", "commonswiki", "specieswiki"]
-
-
-def targets_text(targets):
-    tt = '{| class="sortable wikitable floatright"\n|\n'
-    tt += '<div style="max-height:250px; overflow: auto;vertical-align:top;font-size:90%;max-width:400px">\n'
-    tt += "<pre>\n"
-    # ---
-    tt += targets
-    # ---
-    tt += "\n</pre>"
-    tt += "\n</div>"
-    tt += "\n|-\n|}"
-    # ---
-    return tt
 
 
 def filter_editors(editors, site):
     # ---
-    for x in list(editors.keys()):
-        if validate_ip(x):
+    # bots are already left out of the per-site counts; the home-wiki rule (Mr. Ibrahem
+    # only on ar) is for the site pages, the all page lists every wiki
+    for x in list(editors):
+        if is_excluded(x):
             del editors[x]
     # ---
     return editors
 
 
-def work_all_editors(editors):
+def work_all_editors(editors, publish=True, year=None, caption=None):
     # ---
     editors = filter_editors(editors, "all")
     # ---
@@ -46,58 +36,42 @@ def work_all_editors(editors):
         logger.info("<<red>> no editors")
         return
     # ---
-    title = f"WikiProjectMed:WikiProject_Medicine/Stats/Top_medical_editors_{last_year}_(all)"
-    # ---
-    text = "{{:WPM:WikiProject Medicine/Total medical articles}}\n"
-    text += f"{{{{Top medical editors by lang|{last_year}}}}}\n"
-    # ---
-    text += f"Numbers of {last_year}.\n"
-    # ---
-    txt_table = """{| class="sortable wikitable"\n!#\n!User\n!Count\n"""
-    txt_table += """!Wiki\n"""
-    # ---
-    targets = ""
-    # ---
-    for i, (user, ta) in enumerate(editors.items(), start=1):
-        # ---
-        count = ta["count"]
-        # ---
-        wiki = ta["site"]
-        # ---
-        user = user.replace("_", " ")
-        # ---
-        # #{{#target:User:{User}|{wiki}.wikipedia.org}}
-        targets += f"#{{{{#target:User:{user}|{wiki}.wikipedia.org}}}}\n"
-        # ---
-        txt_table += f"|-\n" f"!{i}\n" f"|[[:w:{wiki}:user:{user}|{user}]]\n" f"|{count:,}\n" f"|{wiki}\n"
-        # ---
-        # if i == 1000: break
-        # ---
-        if count < 10:
-            break
-        # ---
-    # ---
-    txt_table += "\n|}"
+    title = all_title(year or last_year)
     # ---
-    # add targets section
-    text += targets_text(targets)
+    text = all_page(editors, year or last_year, caption=caption)
     # ---
-    text += f"\n==users==\n{txt_table}"
+    outbox.put(title, text)
     # ---
-    page_obj = page(title)
-    p_text = page_obj.get_text()
-    # ---
-    if p_text != text:
-        page_obj.save(newtext=text, summary="update", nocreate=0, minor="")
-    else:
-        logger.info("<<green>> no changes")
+    if publish:
+        outbox.drain()
     # ---
     return editors
 
 
-def get_all_editors(files) -> dict:
+def get_all_editors(files, min_count=10, top=None, year=None) -> dict:
+    """
+    Merge the per-site counts into {user: {"count", "site"}} with each user's best wiki
+    (the first by name when several have the same count).
+
+    Files are read one at a time and only counts >= ``min_count`` are kept (a user's
+    best count can't qualify otherwise), so memory follows the qualifying editors.
+    With ``top`` only the ``top`` biggest are ranked, through a heap.
+
+    When the local store holds counts for these sites, the merge is one indexed query.
+    Other years than last_year (``year``) are only in the store.
+    """
     # ---
-    all_editors = {}
+    sites = [file[:-5] for file in files if file.endswith(".json") and f"{file[:-5]}wiki" not in skip_sites]
+    # ---
+    year = year or last_year
+    stored = get_store().count_sites(year)
+    # ---
+    if year != last_year or sites and set(sites) <= set(stored):
+        rows = get_store().top_editors(year, min_count=min_count, limit=top, sites=sites)
+        return {user: {"count": count, "site": site} for user, count, site in rows}
+    # ---
+    # user -> (count, site)
+    best = {}
     # ---
     for numb, file in enumerate(files, start=1):
         # ---
@@ -113,25 +87,36 @@ def get_all_editors(files) -> dict:
         if f"{site}wiki" in skip_sites:
             continue
         # ---
-        with open(editors_dump_path / f"{site}.json", "r", encoding="utf-8") as f:
+        # no dump: no editors counted there (yet)
+        if not os.path.exists(editors_dump_path / file):
+            logger.info(f"<<yellow>> {file}: no counts, skipped")
+            continue
+        # ---
+        with open(editors_dump_path / file, "r", encoding="utf-8") as f:
             editors = json.load(f)
         # ---
         for user, count in editors.items():
-            if user not in all_editors:
-                all_editors[user] = {"count": count, "site": site}
-            else:
-                if all_editors[user]["count"] < count:
-                    all_editors[user]["count"] = count
-                    all_editors[user]["site"] = site
-    # ---
-    all_editors = dict(sorted(all_editors.items(), key=lambda x: x[1]["count"], reverse=True))
+            # ---
+            if count < min_count:
+                continue
+            # ---
+            # ties go to the first wiki by name, whatever the order of the files (the store does the same)
+            old_count, old_site = best.get(user, (0, ""))
+            if count > old_count or count == old_count and site < old_site:
+                best[user] = (count, site)
+    # ---
+    # biggest first, ties by name (the store query orders the same way)
+    if top:
+        rows = heapq.nsmallest(top, best.items(), key=lambda x: (-x[1][0], x[0]))
+    else:
+        rows = sorted(best.items(), key=lambda x: (-x[1][0], x[0]))
     # ---
-    return all_editors
+    return {user: {"count": count, "site": site} for user, (count, site) in rows}
 
 
 def start():
     # ---
-    files = os.listdir(editors_dump_path)
+    files = os.listdir(ensure_dir(editors_dump_path))
     # ---
     all_editors = get_all_editors(files)
     # ---
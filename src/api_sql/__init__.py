@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 """
 """
-from .wiki_sql import GET_SQL, retrieve_sql_results
+from .wiki_sql import GET_SQL, iter_sql_results, retrieve_sql_results
 
 __all__ = [
     "GET_SQL",
+    "iter_sql_results",
     "retrieve_sql_results",
 ]
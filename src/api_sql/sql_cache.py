@@ -0,0 +1,123 @@
+"""
+Opt-in disk cache of replica query results, for wiki_sql.
+
+Turned on with the ``sqlcache`` argument or EDITORS_STATS_SQL_CACHE=1. A result is
+stored as gzip-compressed JSON under main_dump_path/sql_cache, keyed by the wiki, the
+query text (whitespace-normalized) and its parameters. Entries older than
+SQL_CACHE_TTL seconds are ignored, and the oldest entries are removed once the
+directory is over SQL_CACHE_MAX_MB. ``nosqlcache`` on the command line (or ``refresh``
+per call) runs the queries again and overwrites what is stored; it leaves the sitelinks
+cache alone (``nocache``, see sitelinks.refresh_sitelinks_cache), a costly refetch.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from ..config import SQL_CACHE, SQL_CACHE_MAX_MB, SQL_CACHE_TTL, ensure_dir, main_dump_path
+from ..services import metrics
+
+logger = logging.getLogger(__name__)
+
+cache_path = main_dump_path / "sql_cache"
+
+_lock = threading.Lock()
+# total size of the cache directory, scanned on the first write
+_size = None
+
+
+def enabled() -> bool:
+    return SQL_CACHE or "sqlcache" in sys.argv
+
+
+def refreshing() -> bool:
+    return "nosqlcache" in sys.argv
+
+
+def cache_key(wiki, query, values=None, as_tuples=False) -> str:
+    # only the key is normalized: whitespace differences in the query text don't count
+    text = json.dumps([wiki, " ".join(query.split()), values, as_tuples], default=str, ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _file(key):
+    return cache_path / f"{key}.json.gz"
+
+
+def load(key, as_tuples=False):
+    """The stored rows, or None when missing or expired."""
+    # ---
+    file = _file(key)
+    # ---
+    try:
+        age = time.time() - os.stat(file).st_mtime
+        if age > SQL_CACHE_TTL:
+            metrics.record_cache("sql", hit=False)
+            return None
+        with gzip.open(file, "rt", encoding="utf-8") as f:
+            rows = json.load(f)
+    except (OSError, ValueError):
+        metrics.record_cache("sql", hit=False)
+        return None
+    # ---
+    metrics.record_cache("sql", hit=True)
+    # ---
+    return [tuple(row) for row in rows] if as_tuples else rows
+
+
+def store(key, rows) -> None:
+    # ---
+    global _size
+    # ---
+    ensure_dir(cache_path)
+    # ---
+    file = _file(key)
+    tmp_file = cache_path / f"{key}.{threading.get_ident()}.tmp"
+    # ---
+    with gzip.open(tmp_file, "wt", encoding="utf-8", compresslevel=6) as f:
+        json.dump(rows, f, default=str, ensure_ascii=False, separators=(",", ":"))
+    # ---
+    with _lock:
+        # ---
+        if _size is None:
+            _size = sum(entry.stat().st_size for entry in os.scandir(cache_path) if entry.name.endswith(".gz"))
+        # ---
+        old = os.stat(file).st_size if os.path.exists(file) else 0
+        os.replace(tmp_file, file)
+        _size += os.stat(file).st_size - old
+        # ---
+        if _size > SQL_CACHE_MAX_MB * 2**20:
+            _evict()
+
+
+def _evict() -> None:
+    """Remove expired entries, then the oldest ones, down to 90% of the size limit."""
+    # ---
+    global _size
+    # ---
+    entries = sorted(
+        (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+        for entry in os.scandir(cache_path)
+        if entry.name.endswith(".gz")
+    )
+    # ---
+    _size = sum(size for _, size, _ in entries)
+    limit = SQL_CACHE_MAX_MB * 2**20 * 0.9
+    now = time.time()
+    removed = 0
+    # ---
+    for mtime, size, path in entries:
+        if _size <= limit and now - mtime <= SQL_CACHE_TTL:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        _size -= size
+        removed += 1
+    # ---
+    logger.info(f"<<yellow>> sql cache: removed {removed} entries, {_size / 2**20:.1f} MB left")
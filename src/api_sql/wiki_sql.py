@@ -7,7 +7,10 @@ import logging
 import os
 import time
 
-from ..services import mysql_client
+import pymysql
+
+from ..services import metrics, mysql_client
+from . import sql_cache
 
 logger = logging.getLogger(__name__)
 
@@ -54,6 +57,8 @@ def make_labsdb_dbs_p(wiki):
     # ---
     valid_ends = [
         "wiktionary",
+        # global accounts: centralauth_p
+        "centralauth",
     ]
     # ---
     if not (any((wiki.endswith(x)) for x in valid_ends)) and wiki.find("wiki") == -1:
@@ -68,7 +73,23 @@ def make_labsdb_dbs_p(wiki):
     return host, dbs_p
 
 
-def retrieve_sql_results(queries, wiki="", values=None):
+def row_bytes(row) -> int:
+    # approximate size of a row: its text values
+    values = row.values() if isinstance(row, dict) else row
+    return sum(len(v) for v in values if isinstance(v, (str, bytes)))
+
+
+def _cache_key(queries, wiki, values, as_tuples, cache) -> str:
+    # "" when the result is not cached
+    if not (sql_cache.enabled() if cache is None else cache):
+        return ""
+    # ---
+    query = queries if isinstance(queries, str) else "\n".join(queries)
+    # ---
+    return sql_cache.cache_key(wiki, query, values, as_tuples)
+
+
+def retrieve_sql_results(queries, wiki="", values=None, as_tuples=False, cache=None, refresh=False):
     # ---
     """
     Retrieve SQL query results for a specified wiki's analytics database.
@@ -79,9 +100,12 @@ def retrieve_sql_results(queries, wiki="", values=None):
         queries (str | list): SQL query string or list of query strings to execute.
         wiki (str): Wiki identifier used to derive the analytics host and database (e.g., "enwiki", "wikidata").
         values (dict | list | None): Optional parameter values for a parameterized query.
+        as_tuples (bool): Return plain tuples in SELECT order instead of dicts (faster for large results).
+        cache (bool | None): Use the disk cache of results (see sql_cache); None follows the ``sqlcache`` switch.
+        refresh (bool): Run the query even when it is cached, and store the new result.
 
     Returns:
-        list: Rows returned by the database client (structure as provided by mysql_client), or an empty list if SQL execution is skipped.
+        list: Rows returned by the database client (structure as provided by mysql_client), or an empty list if SQL execution is skipped or fails.
     """
     logger.debug(f"wiki_sql.py retrieve_sql_results wiki '{wiki}'")
     # ---
@@ -89,16 +113,112 @@ def retrieve_sql_results(queries, wiki="", values=None):
     # ---
     logger.debug(queries)
     # ---
+    key = _cache_key(queries, wiki, values, as_tuples, cache)
+    # ---
+    if key and not (refresh or sql_cache.refreshing()):
+        rows = sql_cache.load(key, as_tuples=as_tuples)
+        if rows is not None:
+            logger.debug(f"wiki_sql.py retrieve_sql_results: {len(rows)} rows from the cache")
+            return rows
+    # ---
     if not GET_SQL():
         logger.info("no GET_SQL()")
         return []
     # ---
     start = time.perf_counter()
     # ---
-    rows = mysql_client.make_sql_connect(queries, db=dbs_p, host=host, values=values)
+    try:
+        rows = mysql_client.make_sql_connect(
+            queries, db=dbs_p, host=host, values=values, as_tuples=as_tuples, raise_errors=True
+        )
+    except pymysql.Error as e:
+        # skip sql errors, and never cache them
+        logger.exception(e)
+        metrics.record_sql(wiki, 0, 0, time.perf_counter() - start, error=str(e))
+        return []
     # ---
     delta = time.perf_counter() - start
     # ---
+    metrics.record_sql(wiki, len(rows), sum(map(row_bytes, rows)), delta)
+    # ---
     logger.debug(f'wiki_sql.py retrieve_sql_results len(rows) = "{len(rows)}", in {delta:.2f} seconds')
     # ---
+    if key:
+        sql_cache.store(key, rows)
+    # ---
     return rows
+
+
+def iter_sql_results(
+    queries,
+    wiki="",
+    values=None,
+    batch_size=1000,
+    as_tuples=False,
+    chunk=None,
+    cache=None,
+    refresh=False,
+    raise_errors=False,
+):
+    """
+    Stream the rows of a query on a wiki's analytics database, like retrieve_sql_results
+    but from a server-side cursor: rows are fetched ``batch_size`` at a time and can be
+    processed as they arrive, with constant memory. ``as_tuples`` yields plain tuples.
+    ``chunk`` is the index of the query in a chunked count, for the run metrics.
+    SQL errors end the stream, or are raised with ``raise_errors``.
+
+    With the disk cache (``cache``, ``refresh`` as in retrieve_sql_results) the rows are
+    also kept in memory, and stored once the whole result has been read.
+    """
+    logger.debug(f"wiki_sql.py iter_sql_results wiki '{wiki}'")
+    # ---
+    host, dbs_p = make_labsdb_dbs_p(wiki)
+    # ---
+    logger.debug(queries)
+    # ---
+    key = _cache_key(queries, wiki, values, as_tuples, cache)
+    # ---
+    if key and not (refresh or sql_cache.refreshing()):
+        rows = sql_cache.load(key, as_tuples=as_tuples)
+        if rows is not None:
+            yield from rows
+            return
+    # ---
+    if not GET_SQL():
+        logger.info("no GET_SQL()")
+        return
+    # ---
+    start = time.perf_counter()
+    count = 0
+    nbytes = 0
+    kept = [] if key else None
+    # ---
+    rows = mysql_client.iter_sql_rows(
+        queries, db=dbs_p, host=host, values=values, batch_size=batch_size, as_tuples=as_tuples, raise_errors=True
+    )
+    # ---
+    try:
+        for row in rows:
+            count += 1
+            nbytes += row_bytes(row)
+            if kept is not None:
+                kept.append(row)
+            yield row
+    except pymysql.Error as e:
+        # the stream ends here, as it did before; a partial result is not cached
+        metrics.record_sql(wiki, count, nbytes, time.perf_counter() - start, chunk=chunk, error=str(e))
+        # ---
+        if raise_errors:
+            raise
+        # ---
+        logger.exception(e)
+        return
+    # ---
+    delta = time.perf_counter() - start
+    # ---
+    metrics.record_sql(wiki, count, nbytes, delta, chunk=chunk)
+    # ---
+    logger.debug(f'wiki_sql.py iter_sql_results rows = "{count}", in {delta:.2f} seconds')
+    # ---
+    if key:
+        sql_cache.store(key, kept)
@@ -1,6 +1,13 @@
 """
 
 python3 core8/pwb.py stats/by_site
+python3 -m src.by_site site:ar
+python3 -m src.by_site --jobs 8
+python3 -m src.by_site by_qid
+python3 -m src.by_site site:ar dry
+python3 -m src.by_site years:2019-2023 --jobs 4
+python3 -m src.by_site months --jobs 4
+python3 -m src.by_site months:202401 site:ar
 tfj run stats2 --image python3.9 --command "$HOME/local/bin/python3 core8/pwb.py stats/by_site"
 
 """
@@ -9,51 +16,63 @@ import logging
 import os
 import re
 import sys
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 
-from .config import sites_path
-from .editors import get_editors, validate_ip
-from .wiki import page
+from .api_sql.wiki_sql import make_labsdb_dbs_p
+from .config import SITES_PER_HOST, ensure_dir, site_qids_path, sites_path, skip_sites
+from . import all2, months
+from .editors import get_editors, get_editors_months, get_editors_years
+from .services import metrics
+from .services.local_store import get_store
+from .services.mysql_client import replica_key
+from .utils.actors import drop_excluded, get_bots
+from .render import ranked, site_page, site_title
+from .wiki import outbox
 
 logger = logging.getLogger(__name__)
 last_year = datetime.now().year - 1
-skip_sites = ["enwiki", "wikidatawiki", "commonswiki", "specieswiki"]
 
 
 def filter_editors(editors, site):
     # ---
-    editors = dict(sorted(editors.items(), key=lambda x: x[1], reverse=True))
+    # del editor with less then 10 edits
+    editors = {x: v for x, v in editors.items() if v >= 10}
     # ---
-    for x, v in editors.copy().items():
-        if validate_ip(x):
-            del editors[x]
+    # del IPs, bots, excluded accounts, and Mr. Ibrahem if site != 'arwiki'
+    editors = drop_excluded(editors, site, bots=get_bots(site) if editors else frozenset())
     # ---
-    # del editor with less then 100 edits
-    for x, v in editors.copy().items():
-        if v < 10:
-            del editors[x]
-    # ---
-    # del Mr. Ibrahem if site != 'arwiki'
-    if site != "ar":
-        if "Mr._Ibrahem" in editors:
-            del editors["Mr._Ibrahem"]
-        if "Mr. Ibrahem" in editors:
-            del editors["Mr. Ibrahem"]
-    # ---
-    return editors
+    return dict(ranked(editors))
+
+
+def page_title(site) -> str:
+    site = re.sub(r"wiki$", "", site)
+    return site_title(site, last_year)
 
 
-def work_in_one_site(site, links):
+def work_in_one_site(site, links, qids=None, years=None, since=""):
     # ---
     site = re.sub(r"wiki$", "", site)
     # ---
     logger.info(f"<<green>> site:{site} links: {len(links)}")
     # ---
+    if years:
+        # stored per year, the pages are rendered from the store by render_years
+        with metrics.stage("count", site=site):
+            return get_editors_years(links, site, years, qids=qids)
+    # ---
+    if since:
+        # stored per month, the pages of each window are rendered from the store by render_months
+        with metrics.stage("count", site=site):
+            return get_editors_months(links, site, since, qids=qids)
+    # ---
     if len(links) < 100:
         logger.info("<<red>> less than 100 articles")
         # return
     # ---
-    editors = get_editors(links, site)
+    with metrics.stage("count", site=site):
+        editors = get_editors(links, site, qids=qids)
     # ---
     editors = filter_editors(editors, site)
     # ---
@@ -61,54 +80,32 @@ def work_in_one_site(site, links):
         logger.info("<<red>> no editors")
         return
     # ---
-    if "dump" in sys.argv:
-        logger.debug("json.dumps(editors, indent=2)")
-        return
-    # ---
-    title = f"WikiProjectMed:WikiProject_Medicine/Stats/Top_medical_editors_{last_year}/{site}"
-    # ---
-    text = "{{:WPM:WikiProject Medicine/Total medical articles}}\n"
-    text += f"{{{{Top medical editors by lang|{last_year}}}}}\n"
-    # ---
-    if site != "ar":
-        text += f"Numbers of {last_year}. There are {len(links):,} articles in {site}\n"
+    title = page_title(site)
     # ---
-    text += """{| class="sortable wikitable"\n!#\n!User\n!Count\n|-"""
+    text = site_page(site, editors, len(links), last_year)
     # ---
-    for i, (user, count) in enumerate(editors.items(), start=1):
-        # ---
-        user = user.replace("_", " ")
-        # ---
-        text += f"\n|-\n!{i}\n|[[:w:{site}:user:{user}|{user}]]\n|{count:,}"
-        # ---
-        if i == 100:
-            break
-        # ---
-    # ---
-    text += "\n|}"
-    # ---
-    page_obj = page(title)
-    p_text = page_obj.get_text()
-    # ---
-    if p_text != text:
-        page_obj.save(newtext=text, summary="update", nocreate=0, minor="")
-    else:
-        logger.info("<<green>> no changes")
+    # published by outbox.drain() once all sites are rendered
+    outbox.put(title, text)
     # ---
     return editors
 
 
-def work_in_all_sites(p_site="") -> None:
+def list_site_files(p_site="") -> list:
     # ---
     # read json files in sites_path
-    files = os.listdir(sites_path)
+    files = os.listdir(ensure_dir(sites_path))
     # ---
-    # sort files by biggest size
-    files = sorted(files, key=lambda x: os.stat(sites_path / x).st_size, reverse=True)
+    # sort files by biggest site: title counts from the store, file sizes before it is filled
+    sizes = {f"{site}.json": n for site, n in get_store().site_sizes()}
     # ---
-    for numb, file in enumerate(files, start=1):
-        # ---
-        logger.info(f"<<green>> n: {numb} file: {file}:")
+    if sizes:
+        files = sorted(files, key=lambda x: sizes.get(x, 0), reverse=True)
+    else:
+        files = sorted(files, key=lambda x: os.stat(sites_path / x).st_size, reverse=True)
+    # ---
+    sites = []
+    # ---
+    for file in files:
         # ---
         if not file.endswith("wiki.json"):
             continue
@@ -121,10 +118,278 @@ def work_in_all_sites(p_site="") -> None:
         if p_site and f"{p_site}wiki" != site:
             continue
         # ---
-        with open(sites_path / file, "r", encoding="utf-8") as f:
-            links = json.load(f)
+        sites.append((site, file))
+    # ---
+    return sites
+
+
+def load_site_links(file) -> list:
+    with open(sites_path / file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_site_qids(site):
+    """QIDs of the site's articles for the by_qid counting mode, None when not in that mode."""
+    # ---
+    if "by_qid" not in sys.argv:
+        return None
+    # ---
+    if not os.path.exists(site_qids_path / f"{site}.json"):
+        logger.info(f"<<yellow>> no qids file for {site}, counting by titles")
+        return None
+    # ---
+    # {qid: title}
+    with open(site_qids_path / f"{site}.json", "r", encoding="utf-8") as f:
+        return list(json.load(f))
+
+
+def _run_one_site(site, file, years=None, since=""):
+    # ---
+    links = load_site_links(file)
+    # ---
+    return work_in_one_site(site, links, qids=load_site_qids(site), years=years, since=since)
+
+
+def _site_replica(site) -> str:
+    host, _ = make_labsdb_dbs_p(site)
+    return replica_key(host)
+
+
+def work_in_sites_parallel(sites, jobs, per_host=SITES_PER_HOST, on_done=None, years=None, since="") -> dict:
+    """
+    Process sites with at most ``jobs`` running at once and at most ``per_host``
+    of them on the same replica section.
+
+    Sites are started in the given order (biggest first) as soon as a worker and
+    their replica have room; a failing site is logged and does not stop the others.
+    Result lines are logged in the original order. ``on_done(site, error)`` is called
+    as each site finishes (error None on success).
+    """
+    # ---
+    pending = [(numb, site, file, _site_replica(site)) for numb, (site, file) in enumerate(sites, start=1)]
+    # ---
+    running = {}
+    host_running = Counter()
+    results = {}
+    next_to_log = 1
+    # ---
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="site") as executor:
+        while pending or running:
+            # ---
+            for item in list(pending):
+                if len(running) >= jobs:
+                    break
+                # ---
+                numb, site, file, key = item
+                # ---
+                if host_running[key] >= per_host:
+                    continue
+                # ---
+                pending.remove(item)
+                host_running[key] += 1
+                running[executor.submit(_run_one_site, site, file, years, since)] = item
+            # ---
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            # ---
+            for future in done:
+                numb, site, file, key = running.pop(future)
+                host_running[key] -= 1
+                # ---
+                try:
+                    results[numb] = (site, future.result(), None)
+                except Exception as e:
+                    logger.exception(f"site:{site} failed")
+                    results[numb] = (site, None, e)
+                # ---
+                if on_done:
+                    on_done(site, results[numb][2])
+            # ---
+            while next_to_log in results:
+                site, editors, error = results[next_to_log]
+                # ---
+                if error is not None:
+                    logger.info(f"<<red>> n: {next_to_log} site:{site} failed: {error}")
+                else:
+                    logger.info(f"<<green>> n: {next_to_log} site:{site} editors: {len(editors or {})}")
+                # ---
+                next_to_log += 1
+    # ---
+    return {site: editors for site, editors, _ in results.values()}
+
+
+def work_in_all_sites(p_site="", jobs=1, publish=True, skip=(), on_done=None, years=None, since="") -> list:
+    """
+    Count and render every site (or only ``p_site``), leaving out the sites in ``skip``.
+
+    With ``years`` every site counts those years in one pass (get_editors_years) and
+    the pages of each year are rendered from the store once all sites are counted. With
+    ``since`` ("YYYYMM") the months from then on are counted in one pass, and the pages of
+    the windows they cover (year to date, last 12 months) rendered from them.
+
+    ``on_done(site, error)`` is called as each site finishes; returns the failed sites.
+    """
+    # ---
+    sites = [(site, file) for site, file in list_site_files(p_site) if site not in skip]
+    # ---
+    if skip:
+        logger.info(f"<<green>> {len(skip)} sites already done, {len(sites)} to go")
+    # ---
+    failed = []
+    # ---
+    def done(site, error):
+        if error is not None:
+            failed.append(site)
+        if on_done:
+            on_done(site, error)
+    # ---
+    if jobs > 1 and len(sites) > 1:
+        work_in_sites_parallel(sites, jobs, on_done=done, years=years, since=since)
+    else:
+        for numb, (site, file) in enumerate(sites, start=1):
+            # ---
+            logger.info(f"<<green>> n: {numb} file: {file}:")
+            # ---
+            # a failing site is logged and does not stop the others, as in work_in_sites_parallel
+            try:
+                _run_one_site(site, file, years, since)
+            except Exception as e:
+                logger.exception(f"site:{site} failed")
+                done(site, e)
+                continue
+            # ---
+            done(site, None)
+    # ---
+    if years:
+        render_years(years, p_site)
+    # ---
+    if since:
+        render_months(since, p_site)
+    # ---
+    # rendered pages wait in the outbox; "dry" leaves them there
+    if publish:
+        outbox.drain()
+    # ---
+    return failed
+
+
+def render_stored(token, sites, site_editors, all_editors, p_site="", caption=None) -> int:
+    """
+    Queue the site pages and the all page of ``token`` (a year, or a window of months, see
+    src/months.py) from counts in the store: ``site_editors(site)`` -> {actor: count} and
+    ``all_editors()`` -> {user: {"count", "site"}}. Returns the number of pages.
+    """
+    # ---
+    links_counts = {re.sub(r"wiki$", "", site): n for site, n in get_store().site_sizes()}
+    pages = 0
+    # ---
+    for site in sites:
+        # ---
+        if p_site and site != p_site:
+            continue
+        # ---
+        editors = filter_editors(site_editors(site), site)
+        # ---
+        if editors:
+            text = site_page(site, editors, links_counts.get(site, 0), token, caption=caption)
+            outbox.put(site_title(site, token), text)
+            pages += 1
+    # ---
+    # one site alone does not change the all page
+    if sites and not p_site:
+        all2.work_all_editors(all_editors(), publish=False, year=token, caption=caption)
+        pages += 1
+    # ---
+    return pages
+
+
+def render_years(years, p_site="") -> int:
+    """Queue the pages of ``years`` from the yearly counts in the store; returns the pages."""
+    # ---
+    store = get_store()
+    pages = 0
+    # ---
+    for year in years:
+        sites = sorted(store.count_sites(year))
+        pages += render_stored(
+            year,
+            sites,
+            lambda site: store.site_editors(site, year),
+            lambda: all2.get_all_editors([f"{site}.json" for site in sites], year=year),
+            p_site,
+        )
+    # ---
+    logger.info(f"<<green>> {pages} pages of {', '.join(map(str, years))} rendered from the store")
+    # ---
+    return pages
+
+
+def render_months(since, p_site="") -> int:
+    """Queue the pages of the windows covered by the months stored from ``since``; returns the pages."""
+    # ---
+    store = get_store()
+    pages = 0
+    # ---
+    for window in months.windows(since):
+        pages += render_stored(
+            window.token,
+            sorted(store.month_sites(window.first, window.last)),
+            lambda site: store.month_editors(site, window.first, window.last),
+            lambda: {
+                user: {"count": n, "site": site} for user, n, site in store.top_month_editors(window.first, window.last)
+            },
+            p_site,
+            caption=window.caption,
+        )
+        logger.info(f"<<green>> {window.token}: months {window.first}-{window.last} rendered from the store")
+    # ---
+    return pages
+
+
+def get_years_arg(argv=None) -> list:
+    """Read ``years:2019-2023`` (or ``years:2021``) from the command line; [] when not given."""
+    # ---
+    argv = sys.argv if argv is None else argv
+    # ---
+    for arg in argv:
+        key, _, value = arg.partition(":")
+        first, _, last = value.partition("-")
+        if key == "years" and first.isdigit() and (last or first).isdigit():
+            return list(range(int(first), int(last or first) + 1))
+    # ---
+    return []
+
+
+def get_months_arg(argv=None) -> str:
+    """Read ``months`` (from January of last year) or ``months:YYYYMM`` from the command line; "" when not given."""
+    # ---
+    argv = sys.argv if argv is None else argv
+    # ---
+    for arg in argv:
+        key, _, value = arg.partition(":")
+        if key == "months" and not value:
+            return f"{last_year}01"
+        if key == "months" and len(value) == 6 and value.isdigit():
+            return value
+    # ---
+    return ""
+
+
+def get_jobs_arg(argv=None) -> int:
+    """Read ``--jobs N`` (or ``--jobs=N``) from the command line, default 1."""
+    # ---
+    argv = sys.argv if argv is None else argv
+    # ---
+    for i, arg in enumerate(argv):
+        value = ""
+        if arg == "--jobs" and i + 1 < len(argv):
+            value = argv[i + 1]
+        elif arg.startswith("--jobs="):
+            value = arg.partition("=")[2]
         # ---
-        work_in_one_site(site, links)
+        if value.isdigit():
+            return max(1, int(value))
+    # ---
+    return 1
 
 
 def start():
@@ -135,7 +400,9 @@ def start():
         if arg == "site":
             p_site = value
     # ---
-    work_in_all_sites(p_site)
+    work_in_all_sites(p_site, jobs=get_jobs_arg(), years=get_years_arg(), since=get_months_arg())
+    # ---
+    metrics.write_report()
 
 
 if __name__ == "__main__":
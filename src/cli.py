@@ -0,0 +1,104 @@
+"""
+One command line for the stages of the run. Each command imports only the modules it
+needs, so a rerun of one site does not load the Wikidata or mdwiki clients.
+
+python3 -m src qids                         # medicine articles of enwiki -> qids.json
+python3 -m src sitelinks [site:ar]          # their sitelinks -> sites/*.json
+python3 -m src count site:ar [by_qid] [dry] # count (and publish) one site, or all of them with --jobs N
+python3 -m src count years:2019-2023        # backfill these years in one pass, pages from the store
+python3 -m src merge                        # the all-wikis page
+python3 -m src plan shards:4                # split the sites over 4 jobs (see src/shards.py)
+python3 -m src count shard:1/4 --jobs 4     # count the sites of one of them
+python3 -m src merge shards                 # once all are done: merge their results, all page, publish
+python3 -m src publish [dry]                # the pages waiting in the outbox
+python3 -m src all [stage:sites] [force]    # the pipeline, as start.py
+"""
+import sys
+
+
+def cmd_qids() -> None:
+    from .qids import get_qids_list
+
+    get_qids_list()
+
+
+def cmd_sitelinks() -> None:
+    from . import sitelinks
+
+    sitelinks.start()
+
+
+def cmd_count() -> None:
+    from .config import SHARD_INDEX
+
+    if SHARD_INDEX:
+        from . import shards
+
+        shards.run_shard()
+        return
+
+    from . import by_site
+
+    by_site.start()
+
+
+def cmd_merge() -> None:
+    if "shards" in sys.argv:
+        from . import shards
+
+        shards.merge_shards()
+        return
+
+    from . import all2
+
+    all2.start()
+
+
+def cmd_plan() -> None:
+    from . import shards
+
+    shards.make_plan(shards.get_shards_arg() or 2)
+
+
+def cmd_publish() -> None:
+    from .wiki import outbox
+
+    outbox.start()
+
+
+def cmd_all() -> None:
+    from . import pipeline
+
+    pipeline.run()
+
+
+COMMANDS = {
+    "qids": cmd_qids,
+    "sitelinks": cmd_sitelinks,
+    "count": cmd_count,
+    "merge": cmd_merge,
+    "plan": cmd_plan,
+    "publish": cmd_publish,
+    "all": cmd_all,
+}
+
+
+def get_command(argv=None) -> str:
+    """The first argument naming a command; the other arguments stay in sys.argv for the stages."""
+    # ---
+    argv = sys.argv[1:] if argv is None else argv
+    # ---
+    return next((arg for arg in argv if arg in COMMANDS), "")
+
+
+def main(argv=None) -> int:
+    # ---
+    command = get_command(argv)
+    # ---
+    if not command:
+        print(__doc__.strip())
+        return 2
+    # ---
+    COMMANDS[command]()
+    # ---
+    return 0
@@ -1,4 +1,6 @@
+import functools
 import os
+import sys
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -12,9 +14,97 @@ MAIN_PATH = os.getenv("EDITORS_STATS_PATH", "")
 
 main_dump_path = Path(MAIN_PATH).expanduser() if MAIN_PATH else Path("/tmp") / "editors_stats_dump"
 
+
+def get_shard_arg(argv=None) -> tuple:
+    """(index, count) of ``shard:I/N`` on the command line (or EDITORS_STATS_SHARD=I/N); (0, 0) when not sharded."""
+    # ---
+    argv = sys.argv if argv is None else argv
+    # ---
+    values = [arg.partition(":")[2] for arg in argv if arg.startswith("shard:")]
+    index, _, count = (values[0] if values else os.getenv("EDITORS_STATS_SHARD", "")).partition("/")
+    # ---
+    if index.isdigit() and count.isdigit() and 1 <= int(index) <= int(count):
+        return int(index), int(count)
+    # ---
+    return 0, 0
+
+
+SHARD_INDEX, SHARD_COUNT = get_shard_arg()
+
+# the job of shard I (src/shards.py) keeps the files every job would write to in shards/I:
+# the local store, the outbox, the run reports and the pipeline state. The per-site files
+# (sites/, editors/, checkpoints/) stay shared, a site belongs to one shard.
+shards_path = main_dump_path / "shards"
+job_path = shards_path / str(SHARD_INDEX) if SHARD_INDEX else main_dump_path
+
 editors_dump_path = main_dump_path / "editors"
 sites_path = main_dump_path / "sites"
+site_qids_path = main_dump_path / "site_qids"
+checkpoints_path = main_dump_path / "checkpoints"
+outbox_path = job_path / "outbox"
+reports_path = job_path / "reports"
+
+# wikis that are never counted or published
+skip_sites = ["enwiki", "wikidatawiki", "commonswiki", "specieswiki"]
+
+# accounts never listed, and accounts only listed on their home wiki
+excluded_actors = ["CommonsDelinker"]
+home_wiki_actors = {"Mr._Ibrahem": "ar", "Mr. Ibrahem": "ar"}
+
+
+@functools.lru_cache(maxsize=None)
+def ensure_dir(path: Path) -> Path:
+    """Create a dump directory the first time something is written there (never at import); returns it."""
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+# replica connection pool: max open connections per replica section, and the idle
+# time (seconds) after which a pooled connection is pinged / dropped before reuse
+SQL_POOL_MAX_PER_HOST = int(os.getenv("EDITORS_STATS_SQL_POOL_MAX_PER_HOST", "2"))
+SQL_POOL_PING_AFTER = float(os.getenv("EDITORS_STATS_SQL_POOL_PING_AFTER", "30"))
+SQL_POOL_MAX_IDLE = float(os.getenv("EDITORS_STATS_SQL_POOL_MAX_IDLE", "300"))
+
+# how many sites work_in_all_sites --jobs N may run at once against one replica section
+SITES_PER_HOST = int(os.getenv("EDITORS_STATS_SITES_PER_HOST", str(SQL_POOL_MAX_PER_HOST)))
+
+# parallel wbgetentities requests in sitelinks.get_sitelinks, and the maxlag sent with them
+WIKIDATA_WORKERS = int(os.getenv("EDITORS_STATS_WIKIDATA_WORKERS", "4"))
+WIKIDATA_MAXLAG = int(os.getenv("EDITORS_STATS_WIKIDATA_MAXLAG", "5"))
+
+# ids per wbgetentities request: the most asked for (500 with apihighlimits, else the API
+# allows 50) and the least a batch is cut down to when requests keep failing
+WIKIDATA_BATCH_MAX = int(os.getenv("EDITORS_STATS_WIKIDATA_BATCH_MAX", "500"))
+WIKIDATA_BATCH_MIN = int(os.getenv("EDITORS_STATS_WIKIDATA_BATCH_MIN", "50"))
+
+# sent with every API request: who runs the tool and how to reach them
+# (https://meta.wikimedia.org/wiki/User-Agent_policy)
+USER_AGENT = os.getenv(
+    "EDITORS_STATS_USER_AGENT",
+    f"editors_stats/1.0 (https://mdwiki.org/wiki/User:{my_username or 'Mr._Ibrahem'}; medicine editors statistics)",
+)
+
+# outbox publisher: parallel saves, saves per second (token bucket) and tries per page
+PUBLISH_WORKERS = int(os.getenv("EDITORS_STATS_PUBLISH_WORKERS", "2"))
+PUBLISH_RATE = float(os.getenv("EDITORS_STATS_PUBLISH_RATE", "1"))
+PUBLISH_MAX_TRIES = int(os.getenv("EDITORS_STATS_PUBLISH_MAX_TRIES", "4"))
+
+# run metrics: where write_report() puts the Prometheus textfile (default reports/editors_stats.prom)
+PROM_FILE = os.getenv("EDITORS_STATS_PROM_FILE", "")
+
+# title chunks of editors.get_editors_sql: first size, bounds, the query time the
+# size adapts to (seconds), and the most bytes of titles in one query (below max_allowed_packet)
+SQL_CHUNK_START = int(os.getenv("EDITORS_STATS_SQL_CHUNK_START", "150"))
+SQL_CHUNK_MIN = int(os.getenv("EDITORS_STATS_SQL_CHUNK_MIN", "10"))
+SQL_CHUNK_MAX = int(os.getenv("EDITORS_STATS_SQL_CHUNK_MAX", "2000"))
+SQL_CHUNK_SECONDS = float(os.getenv("EDITORS_STATS_SQL_CHUNK_SECONDS", "20"))
+SQL_QUERY_MAX_BYTES = int(os.getenv("EDITORS_STATS_SQL_QUERY_MAX_BYTES", str(1024 * 1024)))
+
+# pipeline runner: stages that read replicas or APIs run again once their last run is this old (seconds)
+STAGE_MAX_AGE = float(os.getenv("EDITORS_STATS_STAGE_MAX_AGE", str(20 * 3600)))
 
-main_dump_path.mkdir(exist_ok=True)
-editors_dump_path.mkdir(exist_ok=True)
-sites_path.mkdir(exist_ok=True)
+# disk cache of replica query results (api_sql/sql_cache.py): on/off, entry lifetime
+# in seconds and size of the cache directory
+SQL_CACHE = os.getenv("EDITORS_STATS_SQL_CACHE", "") not in ("", "0")
+SQL_CACHE_TTL = float(os.getenv("EDITORS_STATS_SQL_CACHE_TTL", str(24 * 3600)))
+SQL_CACHE_MAX_MB = float(os.getenv("EDITORS_STATS_SQL_CACHE_MAX_MB", "512"))
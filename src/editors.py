@@ -1,39 +1,96 @@
 """
 
 """
+import hashlib
 import json
+import logging
 import os
 import sys
-import ipaddress
-from datetime import datetime
+import time
+from datetime import datetime, timedelta, timezone
 
+import pymysql
 import tqdm
 from pymysql.converters import escape_string
 
-from .api_sql import retrieve_sql_results
-from .config import editors_dump_path
+from .api_sql import iter_sql_results
+from .services import metrics
+from .services.local_store import get_store
+from .services.mysql_client import is_too_big
+from .config import (
+    SQL_CHUNK_MAX,
+    SQL_CHUNK_MIN,
+    SQL_CHUNK_SECONDS,
+    SQL_CHUNK_START,
+    SQL_QUERY_MAX_BYTES,
+    checkpoints_path,
+    editors_dump_path,
+    ensure_dir,
+)
+from .utils.actors import get_bots, is_excluded
 from .utils.ar import get_ar_results
+from .utils.periods import period_sql, timestamp_filter, year_window
 
+logger = logging.getLogger(__name__)
 last_year = datetime.now().year - 1
 
+# QIDs per query of get_editors_by_qids
+QIDS_CHUNK = 2000
+
+# chunk size that last worked per site, for the next get_editors_sql of the run
+_chunk_sizes = {}
+
+# revisions newer than this may not be on the replicas yet, checkpoints stop before them
+REPLICA_LAG = timedelta(hours=1)
+
 
 def validate_ip(ip_address):
-    if ip_address == "CommonsDelinker":
-        return True
-    try:
-        ipaddress.ip_address(ip_address)
-        return True
-    except ValueError:
-        return False
+    # IPs, temporary accounts and excluded accounts (kept for old callers, see utils.actors)
+    return is_excluded(ip_address)
+
+
+def chunk_end(titles, start, size, budget) -> int:
+    """End of the chunk from ``start``: at most ``size`` titles and ``budget`` bytes (at least one title)."""
+    # ---
+    end, used = start, 0
+    # ---
+    while end < len(titles) and end - start < size:
+        used += len(titles[end].encode("utf-8")) + 1
+        if used > budget and end > start:
+            break
+        end += 1
+    # ---
+    return end
+
 
+def next_chunk_size(done, seconds) -> int:
+    # aim at SQL_CHUNK_SECONDS per query, growing at most x2 and shrinking at most /2 at a time
+    factor = min(2.0, max(0.5, SQL_CHUNK_SECONDS / max(seconds, 0.001)))
+    # ---
+    return max(SQL_CHUNK_MIN, min(SQL_CHUNK_MAX, int(done * factor)))
+
+
+def get_editors_sql(links, site, split_by=None, ts_from=None, ts_to=None, period=None):
+    """
+    Count the editors of the titles, a chunk of titles per query.
+
+    With ``period`` ("year", "month") the counts are grouped in the same query and returned
+    as {period: {actor: count}}, e.g. {"2023": {...}, "2024": {...}} or {"202401": {...}}.
 
-def get_editors_sql(links, site, split_by=100):
+    Chunks start at ``split_by`` titles (default: the size that last worked for the site,
+    or SQL_CHUNK_START) and then follow the query time toward SQL_CHUNK_SECONDS, within
+    SQL_CHUNK_MIN..SQL_CHUNK_MAX titles and SQL_QUERY_MAX_BYTES of query text. A chunk
+    that times out or is too big is split in two and retried; when a single title still
+    fails the error is raised, so no counts go missing silently.
+    """
+    # ---
+    period_column, period_group = period_sql(period)
     # ---
     qua = f"""
-        SELECT actor_name, count(*) as count from revision
+        SELECT actor_name, {period_column}count(*) as count from revision
             join actor on rev_actor = actor_id
             join page on rev_page = page_id
-            WHERE lower(cast(actor_name as CHAR)) NOT LIKE '%bot%' AND page_namespace = 0 AND rev_timestamp like '{last_year}%'
+            WHERE page_namespace = 0 AND {timestamp_filter(ts_from, ts_to)}
             and page_id in (
             select page_id
             from page
@@ -41,64 +98,369 @@ def get_editors_sql(links, site, split_by=100):
                     %s
                 )
             )
-        group by actor_id
+        group by actor_id{period_group}
         order by count(*) desc
     """
     # ---
     editors = {}
+    bots = get_bots(site)
     # ---
-    for i in tqdm.tqdm(
-        range(0, len(links), split_by), desc=f"get_editors_sql site:{site}", total=len(links) // split_by
-    ):
-        # ---
-        pages = links[i : i + split_by]
-        # ---
-        # lim = ' , '.join(['?' for x in pages])
-        lim = ",".join([f'"{escape_string(x)}"' for x in pages])
-        # ---
-        qua2 = qua.replace("%s", lim)
-        # ---
-        # logger.debug(qua2)
-        # ---
-        edits = retrieve_sql_results(qua2, site)
-        # ---
-        for x in edits:
+    # sitelinks have spaces, page_title has underscores
+    titles = [f'"{escape_string(x.replace(" ", "_"))}"' for x in links]
+    # ---
+    budget = SQL_QUERY_MAX_BYTES - len(qua.encode("utf-8"))
+    size = split_by or _chunk_sizes.get(site, SQL_CHUNK_START)
+    # chunks never grow back to a size that failed
+    ceiling = SQL_CHUNK_MAX
+    # ---
+    i = 0
+    queries = 0
+    # halves of failed chunks, retried first
+    retry = []
+    # ---
+    with tqdm.tqdm(total=len(titles), desc=f"get_editors_sql site:{site}", unit="title") as bar:
+        while retry or i < len(titles):
+            # ---
+            if retry:
+                start, end = retry.pop()
+            else:
+                start, end = i, chunk_end(titles, i, size, budget)
+                i = end
+            # ---
+            qua2 = qua.replace("%s", ",".join(titles[start:end]))
             # ---
-            actor_name = x["actor_name"]
+            began = time.perf_counter()
             # ---
-            # skip if actor_name iis IP address
-            if validate_ip(actor_name):
+            try:
+                # read the whole chunk before counting it: a failed chunk adds nothing
+                edits = list(iter_sql_results(qua2, site, as_tuples=True, chunk=queries, raise_errors=True))
+            except pymysql.Error as e:
+                # ---
+                if not is_too_big(e) or end - start == 1:
+                    raise
+                # ---
+                middle = (start + end) // 2
+                retry += [(middle, end), (start, middle)]
+                ceiling = max(1, min(ceiling, end - start - 1))
+                size = max(1, min(size, (end - start) // 2))
+                # ---
+                logger.warning(f"<<yellow>> site:{site} chunk of {end - start} titles failed ({e}), splitting it")
                 continue
+            finally:
+                queries += 1
             # ---
-            if actor_name not in editors:
-                editors[actor_name] = 0
+            seconds = time.perf_counter() - began
             # ---
-            editors[actor_name] += x["count"]
+            if period:
+                add_period_counts(editors, edits, bots)
+            else:
+                add_counts(editors, edits, bots)
+            bar.update(end - start)
             # ---
+            # a short last chunk says little about the size, unless it was slow
+            if end - start >= size or seconds > SQL_CHUNK_SECONDS:
+                size = min(ceiling, next_chunk_size(end - start, seconds))
+    # ---
+    _chunk_sizes[site] = size
+    # ---
+    logger.debug(f"get_editors_sql site:{site}: {len(titles)} titles in {queries} queries, next chunk: {size}")
+    # ---
+    return editors
+
+
+def add_counts(editors, edits, bots=frozenset()):
+    # edits: (actor_name, count) rows
+    for actor_name, count in edits:
+        # ---
+        # skip IP addresses, temporary accounts, excluded accounts and bots
+        if actor_name in bots or is_excluded(actor_name):
+            continue
+        # ---
+        if actor_name not in editors:
+            editors[actor_name] = 0
         # ---
+        editors[actor_name] += count
+    # ---
     return editors
 
 
-def dumpit(editors, site):
-    with open(editors_dump_path / f"{site}.json", "w", encoding="utf-8") as f:
-        json.dump(editors, f, sort_keys=True)
+def add_period_counts(periods, edits, bots=frozenset()):
+    # edits: (actor_name, period, count) rows
+    for actor_name, period, count in edits:
+        # ---
+        if actor_name in bots or is_excluded(actor_name):
+            continue
+        # ---
+        editors = periods.setdefault(str(period), {})
+        editors[actor_name] = editors.get(actor_name, 0) + count
+    # ---
+    return periods
 
 
-def get_editors(links, site, do_dump=True):
+def qid_sort_key(qid):
+    return int(qid[1:]) if qid[1:].isdigit() else 0
+
+
+def get_editors_by_qids(qids, site, split_by=QIDS_CHUNK, min_count=10, ts_from=None, ts_to=None, period=None):
+    """
+    Count editors of the articles linked to the given Wikidata items.
+
+    The items are matched on the wiki's own replica through page_props (wikibase_item),
+    so only QIDs travel in the query, as parameters. When all QIDs fit in one query the
+    ``min_count`` threshold is applied there with HAVING; with several chunks the partial
+    counts are summed here and the caller filters them. ``period`` groups the counts as
+    in get_editors_sql (and turns HAVING off: it would apply per period).
+    """
+    # ---
+    period_column, period_group = period_sql(period)
+    # ---
+    # literal % are doubled: the query goes through pymysql's parameter formatting
+    qua = f"""
+        SELECT actor_name, {period_column}count(*) as count from revision
+            join actor on rev_actor = actor_id
+            join page on rev_page = page_id
+            join page_props on pp_page = page_id and pp_propname = 'wikibase_item'
+            WHERE page_namespace = 0 AND {timestamp_filter(ts_from, ts_to, percent="%%")}
+            and pp_value in (PLACEHOLDERS)
+        group by actor_id{period_group}
+        HAVING_CLAUSE
+    """
+    # ---
+    qids = sorted(set(qids), key=qid_sort_key)
+    # ---
+    chunks = [qids[i : i + split_by] for i in range(0, len(qids), split_by)]
+    # ---
+    having = f"HAVING count(*) >= {int(min_count)}" if len(chunks) == 1 and min_count and not period else ""
+    # ---
     editors = {}
+    bots = get_bots(site)
     # ---
-    if os.path.exists(editors_dump_path / f"{site}.json"):
-        with open(editors_dump_path / f"{site}.json", "r", encoding="utf-8") as f:
-            editors = json.load(f)
-            return editors
+    for n, chunk in enumerate(tqdm.tqdm(chunks, desc=f"get_editors_by_qids site:{site}")):
+        # ---
+        qua2 = qua.replace("PLACEHOLDERS", ",".join(["%s"] * len(chunk))).replace("HAVING_CLAUSE", having)
+        # ---
+        # a failed chunk fails the site (no dump, no checkpoint) rather than undercounting it
+        edits = iter_sql_results(qua2, site, values=tuple(chunk), as_tuples=True, chunk=n, raise_errors=True)
+        # ---
+        if period:
+            add_period_counts(editors, edits, bots)
+        else:
+            add_counts(editors, edits, bots)
+    # ---
+    return editors
+
+
+def dumpit(editors, site, year=None):
+    with open(ensure_dir(editors_dump_path) / f"{site}.json", "w", encoding="utf-8") as f:
+        json.dump(editors, f, sort_keys=True)
+    # ---
+    get_store().replace_editor_counts(site, year or last_year, editors)
+
+
+def load_dump(site) -> dict:
+    with open(editors_dump_path / f"{site}.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def keys_hash(keys) -> str:
+    return hashlib.sha1("\n".join(sorted(keys)).encode("utf-8")).hexdigest()
+
+
+def load_checkpoint(site) -> dict:
+    # ---
+    if not os.path.exists(checkpoints_path / f"{site}.json"):
+        return {}
+    # ---
+    with open(checkpoints_path / f"{site}.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def dump_checkpoint(site, checkpoint) -> None:
+    with open(ensure_dir(checkpoints_path) / f"{site}.json", "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, sort_keys=True)
+
+
+def checkpoint_until(year) -> str:
+    # ---
+    _, year_end = year_window(year)
+    # ---
+    now = (datetime.now(timezone.utc) - REPLICA_LAG).strftime("%Y%m%d%H%M%S")
+    # ---
+    return min(now, year_end)
+
+
+def count_editors(keys, site, mode, ts_from, ts_to, min_count=10) -> dict:
+    # ---
+    if mode == "ar":
+        return get_ar_results(ts_from, ts_to)
+    # ---
+    if mode == "qids":
+        return get_editors_by_qids(keys, site, min_count=min_count, ts_from=ts_from, ts_to=ts_to)
+    # ---
+    return get_editors_sql(keys, site, ts_from=ts_from, ts_to=ts_to)
+
+
+def update_editors(site, keys, mode, checkpoint, year_start, until):
+    """
+    Bring the dumped counts of a site from its checkpoint up to ``until``.
+
+    Returns None when the checkpoint can't be extended (other year or mode, removed
+    titles, counts trimmed by HAVING that new titles would need), so the caller
+    recounts the whole window.
+    """
+    # ---
+    if checkpoint.get("from") != year_start or checkpoint.get("mode") != mode:
+        return None
+    # ---
+    if not os.path.exists(editors_dump_path / f"{site}.json"):
+        return None
+    # ---
+    old_keys = set(checkpoint.get("keys", []))
+    new_keys = [x for x in keys if x not in old_keys]
+    # ---
+    if old_keys - set(keys):
+        logger.info(f"<<yellow>> site:{site} titles were removed, recounting")
+        return None
+    # ---
+    if mode == "ar" and checkpoint["until"] < until:
+        return None
+    # ---
+    if new_keys and checkpoint.get("min_count"):
+        return None
+    # ---
+    editors = load_dump(site)
+    # ---
+    # revisions of the known titles made since the checkpoint
+    if checkpoint["until"] < until and old_keys:
+        logger.info(f"<<green>> site:{site} counting revisions since {checkpoint['until']}")
+        delta = count_editors(sorted(old_keys), site, mode, checkpoint["until"], until, min_count=0)
+        for actor, count in delta.items():
+            editors[actor] = editors.get(actor, 0) + count
+    # ---
+    # the whole window for titles added since the checkpoint
+    if new_keys:
+        logger.info(f"<<green>> site:{site} counting {len(new_keys)} new titles")
+        delta = count_editors(new_keys, site, mode, year_start, until, min_count=0)
+        for actor, count in delta.items():
+            editors[actor] = editors.get(actor, 0) + count
+    # ---
+    return editors
+
+
+def get_editors(links, site, do_dump=True, qids=None, year=None):
+    """
+    Return {actor: count} of the site's articles for ``year`` (default last_year).
+
+    Counts are dumped with a checkpoint of the covered rev_timestamp window and
+    the title (or QID) set, so a rerun only queries revisions made since the
+    checkpoint and titles added since then.
+    """
+    # ---
+    year = year or last_year
+    year_start, _ = year_window(year)
+    until = checkpoint_until(year)
     # ---
     if site == "ar":
-        editors = get_ar_results()
+        mode, keys = "ar", []
+    elif qids is not None:
+        mode, keys = "qids", list(dict.fromkeys(qids))
     else:
-        editors = get_editors_sql(links, site, split_by=150)
+        mode, keys = "titles", list(dict.fromkeys(links))
+    # ---
+    checkpoint = load_checkpoint(site)
+    # ---
+    if checkpoint.get("until") == until and checkpoint.get("keys_hash") == keys_hash(keys):
+        if checkpoint.get("from") == year_start and checkpoint.get("mode") == mode:
+            if os.path.exists(editors_dump_path / f"{site}.json"):
+                logger.info(f"<<green>> site:{site} counts are up to date")
+                metrics.record_cache("checkpoints", hit=True)
+                return load_dump(site)
+    # ---
+    editors = update_editors(site, keys, mode, checkpoint, year_start, until)
+    # an extended checkpoint counts as a hit, a full recount as a miss
+    metrics.record_cache("checkpoints", hit=editors is not None)
+    min_count = checkpoint.get("min_count", 0) if editors is not None else 0
+    # ---
+    if editors is None:
+        # HAVING can only trim counts that will never get deltas: a finished year
+        min_count = 10 if until == year_window(year)[1] and mode == "qids" and len(keys) <= QIDS_CHUNK else 0
+        editors = count_editors(keys, site, mode, year_start, until, min_count=min_count)
     # ---
     if ("dump" in sys.argv or do_dump) and editors:
-        dumpit(editors, site)
+        dumpit(editors, site, year)
+        dump_checkpoint(
+            site,
+            {
+                "mode": mode,
+                "from": year_start,
+                "until": until,
+                "keys_hash": keys_hash(keys),
+                "keys": sorted(keys),
+                "min_count": min_count,
+            },
+        )
         return editors
     # ---
     return editors
+
+
+def count_periods(links, site, qids, ts_from, ts_to, period) -> dict:
+    """{period: {actor: count}} of the site's articles in the window, grouped by the replica."""
+    # ---
+    if site == "ar":
+        return get_ar_results(ts_from, ts_to, period=period)
+    # ---
+    if qids is not None:
+        keys = list(dict.fromkeys(qids))
+        return get_editors_by_qids(keys, site, min_count=0, ts_from=ts_from, ts_to=ts_to, period=period)
+    # ---
+    return get_editors_sql(list(dict.fromkeys(links)), site, ts_from=ts_from, ts_to=ts_to, period=period)
+
+
+def get_editors_years(links, site, years, qids=None, do_dump=True) -> dict:
+    """
+    Return {year: {actor: count}} for ``years``, counted in one pass over the replica:
+    one query per chunk grouped by LEFT(rev_timestamp, 4) instead of one run per year.
+
+    Each year is stored in the local store (editor_counts), where year pages are rendered
+    from; the JSON dump and the checkpoint of the yearly run are left alone.
+    """
+    # ---
+    years = sorted(set(int(year) for year in years))
+    ts_from, _ = year_window(years[0])
+    ts_to = checkpoint_until(years[-1])
+    # ---
+    logger.info(f"<<green>> site:{site} counting {years[0]}-{years[-1]} in one pass")
+    # ---
+    counts = count_periods(links, site, qids, ts_from, ts_to, "year")
+    # ---
+    by_year = {year: counts.get(str(year), {}) for year in years}
+    # ---
+    if do_dump:
+        for year, editors in by_year.items():
+            get_store().replace_editor_counts(site, year, editors)
+    # ---
+    return by_year
+
+
+def get_editors_months(links, site, since, qids=None, do_dump=True) -> dict:
+    """
+    Return {month: {actor: count}} ("YYYYMM") from the month ``since`` up to now, from one
+    pass grouped by LEFT(rev_timestamp, 6).
+
+    The months are stored in the local store (editor_months), replacing what it held for
+    the site from ``since`` on; year-to-date, trailing and calendar-year tables are sums
+    of them (see src/months.py).
+    """
+    # ---
+    ts_from = f"{since}01000000"
+    ts_to = (datetime.now(timezone.utc) - REPLICA_LAG).strftime("%Y%m%d%H%M%S")
+    # ---
+    logger.info(f"<<green>> site:{site} counting months since {since} in one pass")
+    # ---
+    by_month = count_periods(links, site, qids, ts_from, ts_to, "month")
+    # ---
+    if do_dump:
+        get_store().replace_editor_months(site, since, by_month)
+    # ---
+    return by_month
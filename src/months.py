@@ -0,0 +1,63 @@
+"""
+Windows of months that stats pages are built from, summed from the monthly counts of
+the local store (editors.get_editors_months) without querying the replicas again.
+
+Months are "YYYYMM", as LEFT(rev_timestamp, 6) gives them. A window has the token used
+in the page titles (render.site_title / all_title) and the caption shown on the page.
+Tokens are never a bare year: the calendar years have their own pages, counted per year
+(by_site.render_years), and the "Top medical editors by lang" template only knows those.
+
+token            months                                 e.g. in October 2026
+YYYY_to_date     January..the current month             2026_to_date: 202601..202610
+last_12_months   the 12 full months before this one     202510..202609
+"""
+import calendar
+from datetime import date
+from typing import NamedTuple, Optional
+
+
+class Window(NamedTuple):
+    token: str
+    first: str
+    last: str
+    caption: str
+
+
+def month_of(day) -> str:
+    return f"{day.year}{day.month:02d}"
+
+
+def shift(month, n) -> str:
+    """The month ``n`` months after ``month`` (before it when negative)."""
+    index = int(month[:4]) * 12 + int(month[4:]) - 1 + n
+    return f"{index // 12}{index % 12 + 1:02d}"
+
+
+def month_name(month) -> str:
+    return f"{calendar.month_name[int(month[4:])]} {month[:4]}"
+
+
+def year_to_date(today: Optional[date] = None) -> Window:
+    # ---
+    today = today or date.today()
+    current = month_of(today)
+    # ---
+    return Window(f"{today.year}_to_date", f"{today.year}01", current, f"{today.year}, up to {month_name(current)}")
+
+
+def trailing_12(today: Optional[date] = None) -> Window:
+    # ---
+    current = month_of(today or date.today())
+    first, last = shift(current, -12), shift(current, -1)
+    # ---
+    return Window("last_12_months", first, last, f"{month_name(first)} to {month_name(last)}")
+
+
+def windows(since, today: Optional[date] = None) -> list:
+    """The windows whose months are all counted when the months from ``since`` are stored."""
+    # ---
+    today = today or date.today()
+    # ---
+    candidates = [year_to_date(today), trailing_12(today)]
+    # ---
+    return [window for window in candidates if window.first >= since]
@@ -0,0 +1,259 @@
+"""
+Stages of the nightly run, and a runner that skips the ones that are up to date and
+resumes the site loop where it stopped.
+
+stage       runs                                    inputs (fingerprint)
+qids        qids.get_qids_list                      enwiki replica (re-run after STAGE_MAX_AGE)
+sitelinks   sitelinks.load_sitelink_data            qids.json, Wikidata (re-run after STAGE_MAX_AGE)
+sites       by_site.work_in_all_sites               sites/*.json, year, counting mode, replicas (STAGE_MAX_AGE)
+merge       all2.get_all_editors, the all page      editors/*.json, year
+publish     outbox.drain                            the pages waiting in the outbox (always runs)
+
+pipeline.json keeps the fingerprint and end time of each stage's last successful run,
+and the sites already done in an unfinished run of the sites stage, so a run stopped by
+a job time limit picks up at the next site. That list is cleared when the stage
+finishes, is named with stage:sites, or was started more than STAGE_MAX_AGE ago. A stage
+whose fingerprint changed, or that is older than STAGE_MAX_AGE when it reads outside
+data, runs again.
+
+python3 start.py                    # the stages that are due
+python3 start.py stage:sites        # only these stages (repeatable), whatever their state
+python3 start.py force              # every stage, from scratch
+"""
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Callable, NamedTuple, Optional
+
+from . import all2, by_site, qids, sitelinks
+from .config import STAGE_MAX_AGE, editors_dump_path, ensure_dir, job_path, sites_path
+from .services import metrics
+from .wiki import outbox
+
+logger = logging.getLogger(__name__)
+
+state_file = job_path / "pipeline.json"
+
+_state_lock = threading.Lock()
+
+last_year = datetime.now().year - 1
+
+
+class Stage(NamedTuple):
+    name: str
+    # run(fingerprint, state) -> True when the stage finished completely
+    run: Callable
+    # inputs() -> fingerprint of what the stage reads; None: the stage always runs
+    inputs: Optional[Callable]
+    # reads data from outside (replicas, APIs): goes stale after STAGE_MAX_AGE
+    external: bool = False
+
+
+def load_state() -> dict:
+    # ---
+    if not os.path.exists(state_file):
+        return {"stages": {}, "sites": {}}
+    # ---
+    with open(state_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state) -> None:
+    # ---
+    with _state_lock:
+        ensure_dir(state_file.parent)
+        tmp_file = state_file.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(state, f, sort_keys=True, indent=1)
+        os.replace(tmp_file, state_file)
+
+
+def fingerprint(*parts) -> str:
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def file_hash(file) -> str:
+    # ---
+    if not os.path.exists(file):
+        return ""
+    # ---
+    with open(file, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def dir_hashes(path) -> dict:
+    """{file name: sha1} of the json files in a directory."""
+    return {name: file_hash(path / name) for name in sorted(os.listdir(ensure_dir(path))) if name.endswith(".json")}
+
+
+# --- stages
+
+
+def run_qids(_fingerprint, _state) -> bool:
+    with metrics.stage("qids"):
+        qids_list = qids.get_qids_list()
+    logger.info(f"<<green>> len qids_list: {len(qids_list)}")
+    return True
+
+
+def run_sitelinks(_fingerprint, _state) -> bool:
+    # ---
+    failed = []
+    # ---
+    with metrics.stage("sitelinks"):
+        data = sitelinks.load_sitelink_data(qids.load_qids_from_file(), failed=failed)
+    logger.info(f"<<green>> len sitelinks: {len(data)}")
+    # ---
+    # the items that failed kept their last sitelinks; the stage runs again next time
+    return not failed
+
+
+def sites_inputs() -> str:
+    return fingerprint(dir_hashes(sites_path), last_year, "by_qid" in sys.argv)
+
+
+def run_sites(fingerprint_, state) -> bool:
+    """Count the sites not done yet in this run of the stage; True when none failed."""
+    # ---
+    run = state["sites"]
+    # ---
+    # new inputs, or a run left unfinished longer than STAGE_MAX_AGE: a new run of the stage, every site again
+    if run.get("fingerprint") != fingerprint_ or time.time() - run.get("started", 0) > STAGE_MAX_AGE:
+        run.clear()
+        run.update(fingerprint=fingerprint_, done=[], started=time.time())
+    # ---
+    def on_done(site, error):
+        if error is None:
+            with _state_lock:
+                run["done"].append(site)
+            save_state(state)
+    # ---
+    with metrics.stage("sites"):
+        failed = by_site.work_in_all_sites(
+            jobs=by_site.get_jobs_arg(), publish=False, skip=set(run["done"]), on_done=on_done
+        )
+    # ---
+    if failed:
+        logger.info(f"<<red>> {len(failed)} sites failed: {', '.join(failed)}; they run again next time")
+        return False
+    # ---
+    # finished: the next run of the stage counts every site again
+    run.clear()
+    # ---
+    return True
+
+
+def merge_inputs() -> str:
+    return fingerprint(dir_hashes(editors_dump_path), last_year)
+
+
+def run_merge(_fingerprint, _state) -> bool:
+    # ---
+    files = os.listdir(ensure_dir(editors_dump_path))
+    # ---
+    with metrics.stage("merge"):
+        all_editors = all2.get_all_editors(files)
+    logger.info(f"<<green>> len all_editors: {len(all_editors)}")
+    # ---
+    with metrics.stage("all page"):
+        all2.work_all_editors(all_editors, publish=False)
+    # ---
+    return True
+
+
+def run_publish(_fingerprint, _state) -> bool:
+    # timed as the "publish" stage by drain() itself
+    stats = outbox.drain()
+    return not stats["failed"]
+
+
+STAGES = [
+    Stage("qids", run_qids, lambda: "", external=True),
+    Stage("sitelinks", run_sitelinks, lambda: file_hash(qids.qids_file), external=True),
+    Stage("sites", run_sites, sites_inputs, external=True),
+    Stage("merge", run_merge, merge_inputs),
+    # drain() only does something when pages are pending
+    Stage("publish", run_publish, None),
+]
+
+
+def is_fresh(stage, last, fingerprint_, now=None) -> bool:
+    """The last successful run of the stage had the same inputs, and is recent enough."""
+    # ---
+    if stage.inputs is None or not last or last.get("fingerprint") != fingerprint_:
+        return False
+    # ---
+    if stage.external and (now or time.time()) - last.get("finished", 0) > STAGE_MAX_AGE:
+        return False
+    # ---
+    return True
+
+
+def get_stages_arg(argv=None) -> list:
+    """The stages named with ``stage:NAME`` on the command line."""
+    # ---
+    argv = sys.argv if argv is None else argv
+    # ---
+    names = [arg.partition(":")[2] for arg in argv if arg.startswith("stage:")]
+    # ---
+    unknown = set(names) - {stage.name for stage in STAGES}
+    if unknown:
+        raise ValueError(f"unknown stages: {', '.join(sorted(unknown))}")
+    # ---
+    return names
+
+
+def run(argv=None) -> dict:
+    """Run the stages that are due (or the ones named with stage:NAME); returns {stage: status}."""
+    # ---
+    argv = sys.argv if argv is None else argv
+    # ---
+    only = get_stages_arg(argv)
+    force = "force" in argv
+    # ---
+    state = load_state()
+    state.setdefault("stages", {})
+    state.setdefault("sites", {})
+    # ---
+    # asked for by name: a new run of the stage, not the rest of an unfinished one
+    if force or "sites" in only:
+        state["sites"].clear()
+    # ---
+    statuses = {}
+    # ---
+    for stage in STAGES:
+        # ---
+        if only and stage.name not in only:
+            continue
+        # ---
+        fingerprint_ = stage.inputs() if stage.inputs else ""
+        # ---
+        if not (only or force) and is_fresh(stage, state["stages"].get(stage.name), fingerprint_):
+            logger.info(f"<<green>> stage {stage.name}: up to date, skipped")
+            metrics.record_cache("pipeline", hit=True)
+            statuses[stage.name] = "skipped"
+            continue
+        # ---
+        metrics.record_cache("pipeline", hit=False)
+        logger.info(f"<<green>> stage {stage.name}: running")
+        # ---
+        complete = stage.run(fingerprint_, state)
+        # ---
+        if not complete:
+            # not recorded: the stage runs again next time (the sites stage only for what is left)
+            statuses[stage.name] = "incomplete"
+            save_state(state)
+            continue
+        # ---
+        state["stages"][stage.name] = {"fingerprint": fingerprint_, "finished": time.time()}
+        save_state(state)
+        statuses[stage.name] = "done"
+    # ---
+    metrics.write_report()
+    # ---
+    return statuses
@@ -4,20 +4,21 @@ import json
 import os
 import logging
 
-from .api_sql import retrieve_sql_results
-from .config import main_dump_path
+from .api_sql import iter_sql_results
+from .config import ensure_dir, main_dump_path
+from .services.local_store import get_store
 
 qids_file = main_dump_path / "qids.json"
 logger = logging.getLogger(__name__)
 
-if not os.path.exists(qids_file):
-    with open(qids_file, "w", encoding="utf-8") as f:
-        json.dump({}, f, sort_keys=True)
-
 
 def load_qids_from_file():
     qids_list = {}
 
+    # nothing listed yet (qids.json is written by get_qids_list)
+    if not os.path.exists(qids_file):
+        return qids_list
+
     with open(qids_file, "r", encoding="utf-8") as f:
         qids_list = json.load(f)
     return qids_list
@@ -38,7 +39,8 @@ def get_en_articles():
         and pp_page = p2.page_id
     """
     # ---
-    result = retrieve_sql_results(query, "enwiki")
+    # a stream cut partway must fail the stage: a short list would replace qids.json and prune the caches
+    result = iter_sql_results(query, "enwiki", raise_errors=True)
     return {x["page_title"]: x["pp_value"] for x in result}
 
 
@@ -50,6 +52,9 @@ def get_qids_list():
     # ---
     qids_list = list(articles.values())
     # ---
+    get_store().replace_qids(articles)
+    # ---
+    ensure_dir(qids_file.parent)
     with open(qids_file, "w", encoding="utf-8") as f:
         json.dump(qids_list, f, sort_keys=True)
 
@@ -0,0 +1,117 @@
+"""
+Wikitext of the stats pages.
+
+Pages are built as lists of parts joined once, so rendering stays linear in the number
+of rows. Editors are rendered in the order given: rank them with ranked() (count, then
+name) so the same data always gives the same text (the outbox and the publish ledger
+compare texts).
+
+"""
+import itertools
+from datetime import datetime
+from operator import itemgetter
+
+last_year = datetime.now().year - 1
+
+SITE_LIMIT = 100
+
+
+def site_title(site, year=None) -> str:
+    return f"WikiProjectMed:WikiProject_Medicine/Stats/Top_medical_editors_{year or last_year}/{site}"
+
+
+def all_title(year=None) -> str:
+    return f"WikiProjectMed:WikiProject_Medicine/Stats/Top_medical_editors_{year or last_year}_(all)"
+
+
+def header(year) -> list:
+    # ---
+    parts = ["{{:WPM:WikiProject Medicine/Total medical articles}}\n"]
+    # ---
+    # the template links the pages of a year; windows of months (src/months.py) have none
+    if str(year).isdigit():
+        parts.append(f"{{{{Top medical editors by lang|{year}}}}}\n")
+    # ---
+    return parts
+
+
+def targets_text(targets):
+    parts = [
+        '{| class="sortable wikitable floatright"\n|\n',
+        '<div style="max-height:250px; overflow: auto;vertical-align:top;font-size:90%;max-width:400px">\n',
+        "<pre>\n",
+        targets,
+        "\n</pre>",
+        "\n</div>",
+        "\n|-\n|}",
+    ]
+    return "".join(parts)
+
+
+def ranked(editors, count=None) -> list:
+    """Items by count (descending), then name: two stable sorts, cheaper than a tuple key."""
+    # ---
+    items = sorted(editors.items())
+    # ---
+    if count is None:
+        return sorted(items, key=itemgetter(1), reverse=True)
+    # ---
+    return sorted(items, key=lambda x: count(x[1]), reverse=True)
+
+
+def site_page(site, editors, links_count, year=None, limit=SITE_LIMIT, caption=None) -> str:
+    """Page of one wiki: ranked {user: count} -> top ``limit`` table (``caption``: the period shown, default year)."""
+    # ---
+    year = year or last_year
+    # ---
+    parts = header(year)
+    # ---
+    if site != "ar":
+        parts.append(f"Numbers of {caption or year}. There are {links_count:,} articles in {site}\n")
+    # ---
+    parts.append("""{| class="sortable wikitable"\n!#\n!User\n!Count\n|-""")
+    # ---
+    for i, (user, count) in enumerate(itertools.islice(editors.items(), limit), start=1):
+        user = user.replace("_", " ")
+        parts.append(f"\n|-\n!{i}\n|[[:w:{site}:user:{user}|{user}]]\n|{count:,}")
+    # ---
+    parts.append("\n|}")
+    # ---
+    return "".join(parts)
+
+
+def all_page(editors, year=None, min_count=10, caption=None) -> str:
+    """Cross-wiki page: ranked {user: {"count", "site"}} -> #target list and table."""
+    # ---
+    year = year or last_year
+    # ---
+    parts = header(year)
+    parts.append(f"Numbers of {caption or year}.\n")
+    # ---
+    table = ["""{| class="sortable wikitable"\n!#\n!User\n!Count\n""", """!Wiki\n"""]
+    targets = []
+    # ---
+    for i, (user, ta) in enumerate(editors.items(), start=1):
+        # ---
+        count = ta["count"]
+        wiki = ta["site"]
+        user = user.replace("_", " ")
+        # ---
+        targets.append(f"#{{{{#target:User:{user}|{wiki}.wikipedia.org}}}}\n")
+        table.append(f"|-\n!{i}\n|[[:w:{wiki}:user:{user}|{user}]]\n|{count:,}\n|{wiki}\n")
+        # ---
+        if count < min_count:
+            break
+    # ---
+    table.append("\n|}")
+    # ---
+    parts.append(targets_text("".join(targets)))
+    parts.append("\n==users==\n")
+    parts.extend(table)
+    # ---
+    return "".join(parts)
+
+
+def site_pages(sites, year=None) -> dict:
+    """Render many wikis in one pass: {site: (editors, links_count)} -> {title: text}."""
+    return {site_title(site, year): site_page(site, editors, n, year) for site, (editors, n) in sorted(sites.items())}
@@ -0,0 +1,324 @@
+#!/usr/bin/python3
+"""
+Indexed local store (SQLite) for the run state: qids, sitelinks and per-(site, year, actor) counts,
+and per-(site, month, actor) counts that windows of any months are summed from.
+
+The JSON dumps (qids.json, sites/, site_qids/, editors/) are still written; the store is
+kept in step with them and answers the cross-wiki questions with single indexed queries.
+
+python3 -m src.services.local_store import
+python3 -m src.services.local_store export
+"""
+import functools
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from ..config import editors_dump_path, ensure_dir, job_path, main_dump_path, site_qids_path, sites_path
+
+logger = logging.getLogger(__name__)
+
+store_file = job_path / "editors_stats.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS qids (
+    qid TEXT PRIMARY KEY,
+    en_title TEXT
+);
+CREATE TABLE IF NOT EXISTS sitelinks (
+    site TEXT NOT NULL,
+    title TEXT NOT NULL,
+    qid TEXT,
+    PRIMARY KEY (site, title)
+);
+CREATE INDEX IF NOT EXISTS sitelinks_qid ON sitelinks (qid);
+CREATE TABLE IF NOT EXISTS editor_counts (
+    site TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    actor TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (site, year, actor)
+);
+CREATE INDEX IF NOT EXISTS editor_counts_year_count ON editor_counts (year, count);
+CREATE TABLE IF NOT EXISTS editor_months (
+    site TEXT NOT NULL,
+    month TEXT NOT NULL,
+    actor TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (site, month, actor)
+);
+CREATE INDEX IF NOT EXISTS editor_months_month ON editor_months (month);
+"""
+
+
+class LocalStore:
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def _write(self, statements) -> None:
+        # statements: [(sql, rows)], run in one transaction
+        with self._lock, self._conn:
+            for sql, rows in statements:
+                if isinstance(rows, list):
+                    self._conn.executemany(sql, rows)
+                else:
+                    self._conn.execute(sql, rows)
+
+    def _read(self, sql, params=()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # --- qids
+
+    def replace_qids(self, articles) -> None:
+        """articles: {en_title: qid} as returned by qids.get_en_articles, or a list of qids."""
+        # ---
+        if isinstance(articles, dict):
+            rows = [(qid, title) for title, qid in articles.items()]
+        else:
+            rows = [(qid, None) for qid in articles]
+        # ---
+        self._write([("DELETE FROM qids", ()), ("INSERT OR REPLACE INTO qids (qid, en_title) VALUES (?, ?)", rows)])
+
+    def get_qids(self) -> list:
+        return [row[0] for row in self._read("SELECT qid FROM qids ORDER BY qid")]
+
+    # --- sitelinks
+
+    def replace_site_links(self, site: str, links) -> None:
+        """links: {qid: title}, or a list of titles when the QIDs are unknown."""
+        # ---
+        if isinstance(links, dict):
+            rows = [(site, title, qid) for qid, title in links.items()]
+        else:
+            rows = [(site, title, None) for title in links]
+        # ---
+        self._write(
+            [
+                ("DELETE FROM sitelinks WHERE site = ?", (site,)),
+                ("INSERT OR REPLACE INTO sitelinks (site, title, qid) VALUES (?, ?, ?)", rows),
+            ]
+        )
+
+    def replace_sitelinks(self, by_site: dict) -> None:
+        for site, links in by_site.items():
+            self.replace_site_links(site, links)
+
+    def site_links(self, site: str) -> dict:
+        """{title: qid} of the site."""
+        return dict(self._read("SELECT title, qid FROM sitelinks WHERE site = ?", (site,)))
+
+    def site_sizes(self) -> list:
+        """[(site, number of titles)], largest first."""
+        return self._read("SELECT site, count(*) AS n FROM sitelinks GROUP BY site ORDER BY n DESC, site")
+
+    # --- editor counts
+
+    def replace_editor_counts(self, site: str, year: int, editors: dict) -> None:
+        rows = [(site, int(year), actor, count) for actor, count in editors.items()]
+        self._write(
+            [
+                ("DELETE FROM editor_counts WHERE site = ? AND year = ?", (site, int(year))),
+                ("INSERT OR REPLACE INTO editor_counts (site, year, actor, count) VALUES (?, ?, ?, ?)", rows),
+            ]
+        )
+
+    def site_editors(self, site: str, year: int) -> dict:
+        rows = self._read(
+            "SELECT actor, count FROM editor_counts WHERE site = ? AND year = ? ORDER BY count DESC, actor",
+            (site, int(year)),
+        )
+        return dict(rows)
+
+    def count_sites(self, year: int) -> list:
+        return [row[0] for row in self._read("SELECT DISTINCT site FROM editor_counts WHERE year = ?", (int(year),))]
+
+    def top_editors(self, year: int, min_count: int = 10, limit: int = None, sites=None) -> list:
+        """
+        [(actor, count, site)] with each actor's best wiki for the year, biggest first.
+
+        ``sites`` limits the merge to these sites. Between wikis with the same count the
+        first by name is the best, as in all2.get_all_editors.
+        """
+        # ---
+        where = "year = ? AND count >= ?"
+        params = [int(year), min_count]
+        # ---
+        if sites is not None:
+            sites = list(sites)
+            where += f" AND site IN ({','.join('?' * len(sites))})"
+            params.extend(sites)
+        # ---
+        sql = (
+            "SELECT actor, count, site FROM ("
+            " SELECT actor, count, site, ROW_NUMBER() OVER (PARTITION BY actor ORDER BY count DESC, site) AS n"
+            f" FROM editor_counts WHERE {where}"
+            ") WHERE n = 1 ORDER BY count DESC, actor"
+        )
+        # ---
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        # ---
+        return self._read(sql, params)
+
+    # --- monthly counts ("YYYYMM")
+
+    def replace_editor_months(self, site: str, since: str, by_month: dict) -> None:
+        """by_month: {month: {actor: count}}, replacing the site's months from ``since`` on."""
+        # ---
+        rows = [(site, month, actor, count) for month, editors in by_month.items() for actor, count in editors.items()]
+        # ---
+        self._write(
+            [
+                ("DELETE FROM editor_months WHERE site = ? AND month >= ?", (site, since)),
+                ("INSERT OR REPLACE INTO editor_months (site, month, actor, count) VALUES (?, ?, ?, ?)", rows),
+            ]
+        )
+
+    def month_editors(self, site: str, first: str, last: str) -> dict:
+        """{actor: count} of the site summed over the months ``first``..``last``, biggest first."""
+        rows = self._read(
+            "SELECT actor, SUM(count) AS total FROM editor_months WHERE site = ? AND month >= ? AND month <= ?"
+            " GROUP BY actor ORDER BY total DESC, actor",
+            (site, first, last),
+        )
+        return dict(rows)
+
+    def month_sites(self, first: str, last: str) -> list:
+        rows = self._read("SELECT DISTINCT site FROM editor_months WHERE month >= ? AND month <= ?", (first, last))
+        return [row[0] for row in rows]
+
+    def first_month(self, site: str = None) -> str:
+        """The earliest month stored (for ``site``), "" when none."""
+        # ---
+        if site is None:
+            rows = self._read("SELECT MIN(month) FROM editor_months")
+        else:
+            rows = self._read("SELECT MIN(month) FROM editor_months WHERE site = ?", (site,))
+        # ---
+        return rows[0][0] or ""
+
+    def top_month_editors(self, first: str, last: str, min_count: int = 10, limit: int = None) -> list:
+        """[(actor, count, site)] as top_editors, for the counts summed over the months ``first``..``last``."""
+        # ---
+        sql = (
+            "SELECT actor, total, site FROM ("
+            " SELECT actor, total, site, ROW_NUMBER() OVER (PARTITION BY actor ORDER BY total DESC, site) AS n FROM ("
+            "  SELECT site, actor, SUM(count) AS total FROM editor_months WHERE month >= ? AND month <= ?"
+            "  GROUP BY site, actor"
+            " ) WHERE total >= ?"
+            ") WHERE n = 1 ORDER BY total DESC, actor"
+        )
+        params = [first, last, min_count]
+        # ---
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        # ---
+        return self._read(sql, params)
+
+    # --- JSON layout
+
+    def import_json(self, year: int) -> None:
+        """Load qids.json, sites/, site_qids/ and editors/ (as counts of ``year``) into the store."""
+        # ---
+        qids_file = main_dump_path / "qids.json"
+        if os.path.exists(qids_file):
+            with open(qids_file, "r", encoding="utf-8") as f:
+                qids = json.load(f)
+            self.replace_qids(qids)
+        # ---
+        for file in sorted(os.listdir(ensure_dir(sites_path))):
+            # ---
+            if not file.endswith(".json"):
+                continue
+            # ---
+            site = file[:-5]
+            links = _load(sites_path / file)
+            # ---
+            # {qid: title}, when it lists the same titles (older layouts: titles only)
+            qids_file = site_qids_path / file
+            by_qid = _load(qids_file) if os.path.exists(qids_file) else {}
+            # ---
+            if isinstance(by_qid, dict) and sorted(by_qid.values()) == sorted(links):
+                links = by_qid
+            # ---
+            self.replace_site_links(site, links)
+        # ---
+        for file in sorted(os.listdir(ensure_dir(editors_dump_path))):
+            if file.endswith(".json"):
+                self.replace_editor_counts(file[:-5], year, _load(editors_dump_path / file))
+
+    def export_json(self, year: int) -> None:
+        """Write the store back to the JSON layout (editors/ holds the counts of ``year``)."""
+        # ---
+        qids = self.get_qids()
+        if qids:
+            with open(ensure_dir(main_dump_path) / "qids.json", "w", encoding="utf-8") as f:
+                json.dump(qids, f, sort_keys=True)
+        # ---
+        for site, _ in self.site_sizes():
+            # ---
+            links = self.site_links(site)
+            # ---
+            _dump(sites_path / f"{site}.json", list(links.keys()))
+            # ---
+            if all(links.values()):
+                _dump(site_qids_path / f"{site}.json", {qid: title for title, qid in links.items()})
+        # ---
+        for site in self.count_sites(year):
+            _dump(editors_dump_path / f"{site}.json", self.site_editors(site, year))
+
+
+def _load(file):
+    with open(file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _dump(file, data):
+    ensure_dir(file.parent)
+    with open(file, "w", encoding="utf-8") as f:
+        json.dump(data, f, sort_keys=True)
+
+
+@functools.lru_cache(maxsize=1)
+def get_store() -> LocalStore:
+    ensure_dir(store_file.parent)
+    return LocalStore(store_file)
+
+
+def start():
+    # ---
+    year = datetime.now().year - 1
+    # ---
+    for arg in sys.argv:
+        arg, _, value = arg.partition(":")
+        if arg == "year" and value.isdigit():
+            year = int(value)
+    # ---
+    if "import" in sys.argv:
+        get_store().import_json(year)
+    elif "export" in sys.argv:
+        get_store().export_json(year)
+    # ---
+    for site, n in get_store().site_sizes()[:10]:
+        logger.info(f"{site}: {n}")
+
+
+if __name__ == "__main__":
+    start()
@@ -0,0 +1,295 @@
+"""
+Run metrics: stage timers, SQL / HTTP call records and cache hits.
+
+Everything is kept in memory for the current process and written at the end of a run
+by write_report(): a JSON report (every call, per-stage and per-site totals, the
+slowest wikis first) and a Prometheus textfile with latency histograms, both under
+main_dump_path/reports (EDITORS_STATS_PROM_FILE moves the textfile, e.g. into the
+node_exporter textfile directory).
+
+    with metrics.stage("sitelinks"):
+        ...
+    metrics.record_sql(wiki, rows, nbytes, seconds, chunk=i)
+    metrics.record_http("wikidata", "wbgetentities", seconds, status=200, nbytes=len(body))
+    metrics.record_cache("checkpoints", hit=True)
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from ..config import PROM_FILE, ensure_dir, reports_path
+
+logger = logging.getLogger(__name__)
+
+# seconds
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# call records kept for the JSON report; totals and histograms count all of them
+MAX_CALLS = 200_000
+
+_lock = threading.Lock()
+_state = {}
+
+
+def reset() -> None:
+    """Start a new run."""
+    with _lock:
+        _state.clear()
+        _state.update(
+            started=time.time(),
+            stages=[],
+            sql=[],
+            http=[],
+            dropped=0,
+            cache=defaultdict(lambda: {"hits": 0, "misses": 0}),
+            histograms=defaultdict(lambda: [0] * (len(BUCKETS) + 1)),
+            sums=defaultdict(float),
+        )
+
+
+reset()
+
+
+def _observe(name, seconds) -> None:
+    # called with _lock held
+    counts = _state["histograms"][name]
+    for i, le in enumerate(BUCKETS):
+        if seconds <= le:
+            counts[i] += 1
+            break
+    else:
+        counts[-1] += 1
+    _state["sums"][name] += seconds
+
+
+def _keep(kind, call) -> None:
+    # called with _lock held
+    if len(_state["sql"]) + len(_state["http"]) < MAX_CALLS:
+        _state[kind].append(call)
+    else:
+        _state["dropped"] += 1
+
+
+@contextmanager
+def stage(name, site=""):
+    """Time a pipeline stage (``site`` for the per-site counting stage)."""
+    # ---
+    start = time.perf_counter()
+    error = ""
+    # ---
+    try:
+        yield
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        with _lock:
+            _state["stages"].append({"stage": name, "site": site, "seconds": seconds, "error": error})
+            _observe(f"stage:{name}", seconds)
+
+
+def site_of(wiki) -> str:
+    # "frwiki" and "fr" are the same site in the report
+    return wiki[:-4] if wiki.endswith("wiki") else wiki
+
+
+def record_sql(wiki, rows, nbytes, seconds, chunk=None, error="") -> None:
+    """One query: rows returned, approximate bytes of their text values, latency."""
+    with _lock:
+        _keep("sql", {"wiki": wiki, "rows": rows, "bytes": nbytes, "seconds": seconds, "chunk": chunk, "error": error})
+        _observe("sql", seconds)
+
+
+def record_http(service, action, seconds, status=0, nbytes=0, error="") -> None:
+    """One HTTP request to ``service`` ("wikidata", "mdwiki")."""
+    with _lock:
+        call = {"service": service, "action": action, "seconds": seconds, "status": status, "bytes": nbytes}
+        _keep("http", {**call, "error": error})
+        _observe(f"http:{service}", seconds)
+
+
+@contextmanager
+def http_call(service, action):
+    """Time a request made through a client that hides the response (mwclient)."""
+    # ---
+    start = time.perf_counter()
+    error = ""
+    # ---
+    try:
+        yield
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record_http(service, action, time.perf_counter() - start, error=error)
+
+
+def record_cache(name, hit=True, count=1) -> None:
+    with _lock:
+        _state["cache"][name]["hits" if hit else "misses"] += count
+
+
+def _totals(calls) -> dict:
+    return {
+        "calls": len(calls),
+        "rows": sum(c.get("rows", 0) for c in calls),
+        "bytes": sum(c.get("bytes", 0) for c in calls),
+        "seconds": round(sum(c["seconds"] for c in calls), 3),
+        "errors": sum(1 for c in calls if c.get("error")),
+    }
+
+
+def report() -> dict:
+    """The run so far as a JSON-serialisable dict."""
+    # ---
+    with _lock:
+        stages = list(_state["stages"])
+        sql = list(_state["sql"])
+        http = list(_state["http"])
+        cache = {name: dict(v) for name, v in _state["cache"].items()}
+        dropped = _state["dropped"]
+        started = _state["started"]
+    # ---
+    by_stage = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "errors": 0})
+    sites = defaultdict(lambda: {"seconds": 0.0, "sql_calls": 0, "sql_rows": 0, "sql_seconds": 0.0})
+    # ---
+    for s in stages:
+        by_stage[s["stage"]]["calls"] += 1
+        by_stage[s["stage"]]["seconds"] += s["seconds"]
+        by_stage[s["stage"]]["errors"] += bool(s["error"])
+        if s["site"]:
+            sites[site_of(s["site"])]["seconds"] += s["seconds"]
+    # ---
+    for c in sql:
+        site = sites[site_of(c["wiki"])]
+        site["sql_calls"] += 1
+        site["sql_rows"] += c["rows"]
+        site["sql_seconds"] += c["seconds"]
+    # ---
+    services = defaultdict(list)
+    for c in http:
+        services[c["service"]].append(c)
+    # ---
+    return {
+        "started": datetime.fromtimestamp(started, timezone.utc).isoformat(),
+        "seconds": round(time.time() - started, 3),
+        "stages": {name: {**v, "seconds": round(v["seconds"], 3)} for name, v in by_stage.items()},
+        # the wikis that take the longest first
+        "sites": {
+            site: {**v, "seconds": round(v["seconds"], 3), "sql_seconds": round(v["sql_seconds"], 3)}
+            for site, v in sorted(sites.items(), key=lambda x: (-x[1]["seconds"], -x[1]["sql_seconds"], x[0]))
+        },
+        "sql": _totals(sql),
+        "http": {service: _totals(calls) for service, calls in services.items()},
+        "cache": cache,
+        "dropped_calls": dropped,
+        "calls": {"stages": stages, "sql": sql, "http": http},
+    }
+
+
+def _labels(**labels) -> str:
+    # label values escape backslashes and double quotes
+    inner = ",".join(f'{k}="{json.dumps(str(v), ensure_ascii=False)[1:-1]}"' for k, v in labels.items())
+    return "{" + inner + "}" if inner else ""
+
+
+def prometheus_text(data=None) -> str:
+    """The run in the Prometheus text exposition format."""
+    # ---
+    data = data or report()
+    # ---
+    with _lock:
+        histograms = {name: list(counts) for name, counts in _state["histograms"].items()}
+        sums = dict(_state["sums"])
+    # ---
+    lines = []
+    # ---
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP editors_stats_{name} {help_text}")
+        lines.append(f"# TYPE editors_stats_{name} {kind}")
+        for labels, value in samples:
+            lines.append(f"editors_stats_{name}{_labels(**labels)} {value}")
+    # ---
+    def histogram(name, help_text, keys):
+        lines.append(f"# HELP editors_stats_{name} {help_text}")
+        lines.append(f"# TYPE editors_stats_{name} histogram")
+        for labels, key in keys:
+            counts = histograms.get(key, [0] * (len(BUCKETS) + 1))
+            total = 0
+            for le, n in zip(list(BUCKETS) + ["+Inf"], counts):
+                total += n
+                lines.append(f"editors_stats_{name}_bucket{_labels(**labels, le=le)} {total}")
+            lines.append(f"editors_stats_{name}_sum{_labels(**labels)} {sums.get(key, 0.0):.6f}")
+            lines.append(f"editors_stats_{name}_count{_labels(**labels)} {total}")
+    # ---
+    metric("run_seconds", "gauge", "Wall time of the run.", [({}, data["seconds"])])
+    metric("last_run_timestamp_seconds", "gauge", "End of the run.", [({}, round(time.time()))])
+    metric(
+        "stage_seconds",
+        "gauge",
+        "Total wall time per stage.",
+        [({"stage": name}, v["seconds"]) for name, v in data["stages"].items()],
+    )
+    metric(
+        "site_seconds",
+        "gauge",
+        "Counting wall time per site.",
+        [({"site": site}, round(v["seconds"], 3)) for site, v in data["sites"].items() if v["seconds"]],
+    )
+    metric("sql_rows_total", "counter", "Rows returned by replica queries.", [({}, data["sql"]["rows"])])
+    metric("sql_bytes_total", "counter", "Approximate bytes of the rows returned.", [({}, data["sql"]["bytes"])])
+    metric("sql_errors_total", "counter", "Replica queries that failed.", [({}, data["sql"]["errors"])])
+    histogram(
+        "stage_duration_seconds",
+        "Duration of each run of a stage (one per site for count).",
+        [({"stage": name[6:]}, name) for name in sorted(histograms) if name.startswith("stage:")],
+    )
+    histogram("sql_query_seconds", "Latency of replica queries.", [({}, "sql")])
+    histogram(
+        "http_request_seconds",
+        "Latency of API requests.",
+        [({"service": name[5:]}, name) for name in sorted(histograms) if name.startswith("http:")],
+    )
+    metric(
+        "cache_hits_total",
+        "counter",
+        "Cache hits.",
+        [({"cache": name}, v["hits"]) for name, v in sorted(data["cache"].items())],
+    )
+    metric(
+        "cache_misses_total",
+        "counter",
+        "Cache misses.",
+        [({"cache": name}, v["misses"]) for name, v in sorted(data["cache"].items())],
+    )
+    # ---
+    return "\n".join(lines) + "\n"
+
+
+def _write(file, text) -> None:
+    # textfile collectors may read at any time: write aside, then rename
+    tmp_file = f"{file}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_file, file)
+
+
+def write_report() -> dict:
+    """Write run_report.json and the Prometheus textfile; returns the report."""
+    # ---
+    data = report()
+    # ---
+    _write(ensure_dir(reports_path) / "run_report.json", json.dumps(data, indent=1))
+    _write(PROM_FILE or reports_path / "editors_stats.prom", prometheus_text(data))
+    # ---
+    slowest = ", ".join(f"{site} {v['seconds']:.1f}s" for site, v in list(data["sites"].items())[:10])
+    logger.info(f"<<green>> run report: {data['seconds']:.1f}s, {data['sql']['calls']} queries")
+    logger.info(f"<<green>> slowest sites: {slowest}")
+    # ---
+    return data
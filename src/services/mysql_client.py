@@ -2,16 +2,44 @@
 """
 
 """
+import atexit
+import contextlib
 import functools
 import logging
+import socket
+import threading
+import time
+from collections import defaultdict
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator, Optional
 
 import pymysql
-from pymysql.cursors import DictCursor
+from pymysql.constants import FIELD_TYPE
+from pymysql.cursors import Cursor, DictCursor, SSCursor, SSDictCursor
+
+from ..config import SQL_POOL_MAX_IDLE, SQL_POOL_MAX_PER_HOST, SQL_POOL_PING_AFTER
 
 logger = logging.getLogger(__name__)
 
+# CR_SERVER_GONE_ERROR, CR_SERVER_LOST, CR_SERVER_LOST_EXTENDED
+GONE_AWAY_ERRORS = (2006, 2013, 2055)
+
+# ER_NET_PACKET_TOO_LARGE, ER_QUERY_INTERRUPTED, ER_STATEMENT_TIMEOUT (MariaDB), ER_QUERY_TIMEOUT (MySQL),
+# and the server dropping the connection under a query that is killed or too large
+SPLIT_ERRORS = (1153, 1317, 1969, 3024, 2006, 2013)
+
+# columns of these types with the binary charset come back as bytes (page_title, actor_name, ...)
+BINARY_CHARSET = 63
+BYTES_TYPES = {
+    FIELD_TYPE.STRING,
+    FIELD_TYPE.VAR_STRING,
+    FIELD_TYPE.VARCHAR,
+    FIELD_TYPE.BLOB,
+    FIELD_TYPE.TINY_BLOB,
+    FIELD_TYPE.MEDIUM_BLOB,
+    FIELD_TYPE.LONG_BLOB,
+}
+
 
 @functools.lru_cache(maxsize=1)
 def load_db_config(db: str, host: str) -> dict[str, Any]:
@@ -45,7 +73,161 @@ def load_db_config(db: str, host: str) -> dict[str, Any]:
     }
 
 
-def _sql_connect_pymysql(query: str, db: str = "", host: str = "", values: tuple = None) -> list:
+@functools.lru_cache(maxsize=None)
+def replica_key(host: str) -> str:
+    """
+    Resolve a replica host name to the address of the section server behind it.
+
+    On Toolforge every ``<wiki>.analytics.db.svc.wikimedia.cloud`` name is an alias of
+    its section host (s1..s8), so wikis that resolve to the same address can share one
+    connection and switch databases with ``USE <db>_p``.
+    """
+    try:
+        return socket.gethostbyname(host)
+    except OSError:
+        return host
+
+
+def is_gone_away(error: Exception) -> bool:
+    return isinstance(error, pymysql.OperationalError) and bool(error.args) and error.args[0] in GONE_AWAY_ERRORS
+
+
+def is_too_big(error: Exception) -> bool:
+    """The query timed out, was killed or did not fit in a packet: a smaller one may pass."""
+    return isinstance(error, pymysql.Error) and bool(error.args) and error.args[0] in SPLIT_ERRORS
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "db", "last_used")
+
+    def __init__(self, conn, db: str):
+        self.conn = conn
+        self.db = db
+        self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    Keep-alive pool of replica connections keyed by replica section.
+
+    At most ``max_per_host`` connections are open per section; callers wait for a free
+    one once the cap is reached. Connections idle for more than ``ping_after`` seconds
+    are pinged before reuse, and ones idle for more than ``max_idle`` seconds are
+    replaced, since the replicas drop idle sessions on their own.
+    """
+
+    def __init__(self, max_per_host: int = 2, ping_after: float = 30.0, max_idle: float = 300.0):
+        self.max_per_host = max(1, max_per_host)
+        self.ping_after = ping_after
+        self.max_idle = max_idle
+        # ---
+        self._cond = threading.Condition()
+        self._idle: dict[str, list[_PooledConnection]] = defaultdict(list)
+        self._open: dict[str, int] = defaultdict(int)
+
+    def _connect(self, db: str, host: str) -> _PooledConnection:
+        DB_CONFIG = load_db_config(db, host)
+        return _PooledConnection(pymysql.connect(**DB_CONFIG), db)
+
+    def _checkout(self, key: str) -> Optional[_PooledConnection]:
+        with self._cond:
+            while True:
+                if self._idle[key]:
+                    return self._idle[key].pop()
+                # ---
+                if self._open[key] < self.max_per_host:
+                    self._open[key] += 1
+                    return None
+                # ---
+                self._cond.wait()
+
+    def _release(self, key: str, entry: Optional[_PooledConnection], discard: bool = False) -> None:
+        with self._cond:
+            if entry is None or discard:
+                self._open[key] -= 1
+                if entry is not None:
+                    _close_quietly(entry.conn)
+            else:
+                entry.last_used = time.monotonic()
+                self._idle[key].append(entry)
+            # ---
+            self._cond.notify()
+
+    def _is_alive(self, entry: _PooledConnection) -> bool:
+        idle_for = time.monotonic() - entry.last_used
+        # ---
+        if idle_for > self.max_idle:
+            return False
+        # ---
+        if idle_for > self.ping_after:
+            try:
+                entry.conn.ping(reconnect=False)
+            except pymysql.Error:
+                return False
+        # ---
+        return True
+
+    @contextlib.contextmanager
+    def connection(self, db: str, host: str) -> Iterator[pymysql.connections.Connection]:
+        key = replica_key(host)
+        entry = self._checkout(key)
+        # ---
+        try:
+            if entry is not None and not self._is_alive(entry):
+                logger.debug(f"replacing stale connection to {key}")
+                _close_quietly(entry.conn)
+                entry = None
+            # ---
+            if entry is None:
+                entry = self._connect(db, host)
+            elif entry.db != db:
+                entry.conn.select_db(db)
+                entry.db = db
+        except BaseException:
+            self._release(key, entry, discard=True)
+            raise
+        # ---
+        try:
+            yield entry.conn
+        except pymysql.OperationalError:
+            self._release(key, entry, discard=True)
+            raise
+        except BaseException:
+            self._release(key, entry)
+            raise
+        else:
+            self._release(key, entry)
+
+    def close_all(self) -> None:
+        with self._cond:
+            for key, entries in self._idle.items():
+                for entry in entries:
+                    _close_quietly(entry.conn)
+                self._open[key] -= len(entries)
+            self._idle.clear()
+
+
+def _close_quietly(conn) -> None:
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+@functools.lru_cache(maxsize=1)
+def get_pool() -> ConnectionPool:
+    pool = ConnectionPool(
+        max_per_host=SQL_POOL_MAX_PER_HOST,
+        ping_after=SQL_POOL_PING_AFTER,
+        max_idle=SQL_POOL_MAX_IDLE,
+    )
+    atexit.register(pool.close_all)
+    return pool
+
+
+def _sql_connect_pymysql(
+    query: str, db: str = "", host: str = "", values: tuple = None, as_tuples: bool = False, raise_errors: bool = False
+) -> list:
     # ---
     logger.debug("start _sql_connect_pymysql:")
     # ---
@@ -54,37 +236,32 @@ def _sql_connect_pymysql(query: str, db: str = "", host: str = "", values: tuple
     if values:
         params = values
     # ---
-    # connect to the database server without error
-    # ---
-    DB_CONFIG = load_db_config(db, host)
-    # ---
-    try:
-        connection = pymysql.connect(**DB_CONFIG)
-    except pymysql.Error as e:
-        logger.exception(e)
-        return []
+    pool = get_pool()
     # ---
-    with connection as conn, conn.cursor() as cursor:
-        # ---
-        # skip sql errors
+    # retry once on a fresh connection if the server dropped the pooled one
+    for attempt in range(2):
         try:
-            cursor.execute(query, params)
-
-        except pymysql.Error as e:
-            logger.exception(e)
-            return []
-        # ---
-        results = []
+            with pool.connection(db, host) as conn, conn.cursor(Cursor if as_tuples else None) as cursor:
+                cursor.execute(query, params)
+                # ---
+                if as_tuples:
+                    return decode_columns(cursor.fetchall(), binary_columns(cursor))
+                # ---
+                return cursor.fetchall()
         # ---
-        try:
-            results = cursor.fetchall()
-
-        except Exception as e:
+        except pymysql.Error as e:
+            if attempt == 0 and is_gone_away(e):
+                logger.warning(f"<<yellow>> {host}: {e}, reconnecting")
+                continue
+            # ---
+            if raise_errors:
+                raise
+            # ---
+            # skip sql errors
             logger.exception(e)
             return []
-        # ---
-        # yield from cursor
-        return results
+    # ---
+    return []
 
 
 def decode_value(value: bytes) -> str:
@@ -112,7 +289,112 @@ def decode_bytes_in_list(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
     return decoded_rows
 
 
-def make_sql_connect(query: str, db: str = "", host: str = "", values=None):
+def iter_sql_rows(
+    query: str,
+    db: str = "",
+    host: str = "",
+    values=None,
+    batch_size: int = 1000,
+    as_tuples: bool = False,
+    raise_errors: bool = False,
+) -> Iterator:
+    """
+    Stream rows from an unbuffered server-side cursor, ``batch_size`` rows at a time.
+
+    Bytes of dict rows are decoded in place; tuple rows (``as_tuples``, in SELECT order)
+    are rebuilt batch by batch by decode_columns, so only one batch is held at a time.
+    SQL errors are logged and end the stream, like make_sql_connect returning [], or are
+    raised with ``raise_errors``.
+    """
+    # ---
+    if not query:
+        logger.debug("query == ''")
+        return
+    # ---
+    params = values or None
+    pool = get_pool()
+    # ---
+    for attempt in range(2):
+        # ---
+        started = False
+        # ---
+        try:
+            with pool.connection(db, host) as conn:
+                cursor = conn.cursor(SSCursor if as_tuples else SSDictCursor)
+                try:
+                    cursor.execute(query, params)
+                    # ---
+                    columns = binary_columns(cursor) if as_tuples else None
+                    # ---
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        # ---
+                        started = True
+                        # ---
+                        if as_tuples:
+                            yield from decode_columns(rows, columns)
+                            continue
+                        # ---
+                        for row in rows:
+                            yield decode_bytes_in_row(row)
+                finally:
+                    # reads what is left of the result, so the connection can be reused
+                    cursor.close()
+            return
+        # ---
+        except pymysql.Error as e:
+            if attempt == 0 and not started and is_gone_away(e):
+                logger.warning(f"<<yellow>> {host}: {e}, reconnecting")
+                continue
+            # ---
+            if raise_errors:
+                raise
+            # ---
+            logger.exception(e)
+            return
+
+
+def decode_bytes_in_row(row: dict[str, Any]) -> dict[str, Any]:
+    for key, value in row.items():
+        if isinstance(value, bytes):
+            row[key] = decode_value(value)
+    return row
+
+
+def binary_columns(cursor) -> list[int]:
+    """Indexes of the result columns that hold bytes, from the column types of the cursor."""
+    # ---
+    fields = getattr(getattr(cursor, "_result", None), "fields", None) or []
+    # ---
+    return [i for i, field in enumerate(fields) if field.charsetnr == BINARY_CHARSET and field.type_code in BYTES_TYPES]
+
+
+def decode_columns(rows, columns: list[int]) -> list[tuple]:
+    # ---
+    if not columns:
+        return list(rows)
+    # ---
+    decoded_rows = []
+    # ---
+    for row in rows:
+        row = list(row)
+        for i in columns:
+            value = row[i]
+            if isinstance(value, bytes):
+                try:
+                    row[i] = value.decode("utf-8")
+                except UnicodeDecodeError:
+                    row[i] = decode_value(value)
+        decoded_rows.append(tuple(row))
+    # ---
+    return decoded_rows
+
+
+def make_sql_connect(
+    query: str, db: str = "", host: str = "", values=None, as_tuples: bool = False, raise_errors: bool = False
+):
     # ---
     if not query:
         logger.debug("query == ''")
@@ -120,7 +402,13 @@ def make_sql_connect(query: str, db: str = "", host: str = "", values=None):
     # ---
     logger.debug("<<lightyellow>> newsql::")
     # ---
-    rows = _sql_connect_pymysql(query, db=db, host=host, values=values)
+    rows = _sql_connect_pymysql(
+        query, db=db, host=host, values=values, as_tuples=as_tuples, raise_errors=raise_errors
+    )
+    # ---
+    if as_tuples:
+        # already decoded column-wise
+        return rows
     # ---
     rows = decode_bytes_in_list(rows)
     # ---
@@ -128,7 +416,10 @@ def make_sql_connect(query: str, db: str = "", host: str = "", values=None):
 
 
 __all__ = [
+    "get_pool",
+    "replica_key",
     "make_sql_connect",
+    "iter_sql_rows",
     "decode_value",
     "decode_bytes_in_list",
 ]
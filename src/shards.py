@@ -0,0 +1,256 @@
+"""
+Sharded runs: the sites split over N independent jobs, and the merge of their results.
+
+python3 -m src plan shards:4                # first, once: shards/plan.json, the sites of each shard
+python3 -m src count shard:1/4 --jobs 4     # one job per shard (tfj run stats-1 ..., stats-2 ...)
+python3 -m src merge shards                 # once every shard is done: store, pages, all page, publish
+
+The planner expects each site to take as long as its last counting run (the per-site
+seconds of the run reports), and a site never timed its titles at the median seconds
+per title of the others. Sites are then given out longest first, each to the shard with
+the least work so far (LPT), so the shards finish close together.
+
+A shard job stops without a current plan (for its N shards, of the current site files,
+made within STAGE_MAX_AGE), so every job of a run counts the same split. It counts its
+sites like by_site: the counts go to the per-site files of editors/ as usual, its store,
+outbox and report to shards/I (see config.job_path), and what it did to shards/I/shard.json.
+The merge loads the counts of every site into the main store, moves the queued pages of
+each shard to the main outbox, then builds the all page.
+"""
+import heapq
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import time
+
+from . import all2, by_site
+from .config import SHARD_COUNT, SHARD_INDEX, STAGE_MAX_AGE, editors_dump_path, ensure_dir, main_dump_path, shards_path
+from .editors import load_dump
+from .services import metrics
+from .services.local_store import get_store
+from .wiki import outbox
+
+logger = logging.getLogger(__name__)
+
+plan_file = shards_path / "plan.json"
+
+last_year = by_site.last_year
+
+
+def _load(file, default=None):
+    # ---
+    if not os.path.exists(file):
+        return default
+    # ---
+    with open(file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _dump(file, data) -> None:
+    # other jobs may read it at any time: write aside, then rename
+    ensure_dir(file.parent)
+    tmp_file = file.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(data, f, sort_keys=True, indent=1)
+    os.replace(tmp_file, file)
+
+
+def shard_path(index):
+    return shards_path / str(index)
+
+
+def past_runtimes() -> dict:
+    """{site: seconds} of the last counting run of each site, from the run reports (sharded or not)."""
+    # ---
+    files = [main_dump_path / "reports" / "run_report.json"]
+    files += sorted(shards_path.glob("*/reports/run_report.json"))
+    # ---
+    reports = [report for report in (_load(file) for file in files) if report]
+    runtimes = {}
+    # ---
+    # oldest first: the latest run of a site wins
+    for report in sorted(reports, key=lambda r: r.get("started", "")):
+        for site, values in report.get("sites", {}).items():
+            if values.get("seconds"):
+                runtimes[f"{site}wiki"] = values["seconds"]
+    # ---
+    return runtimes
+
+
+def site_costs(titles, runtimes) -> dict:
+    """
+    Expected seconds per site: its last runtime, else its number of titles at the median
+    seconds per title of the sites that have both (one second per title with no history).
+    """
+    # ---
+    rates = [runtimes[site] / n for site, n in titles.items() if n and site in runtimes]
+    rate = statistics.median(rates) if rates else 1.0
+    # ---
+    return {site: runtimes.get(site, n * rate) for site, n in titles.items()}
+
+
+def balance(costs, count) -> list:
+    """Longest processing time first: each site, biggest first, goes to the least loaded shard."""
+    # ---
+    heap = [(0.0, index) for index in range(count)]
+    shards = [[] for _ in range(count)]
+    # ---
+    for site, cost in sorted(costs.items(), key=lambda x: (-x[1], x[0])):
+        load, index = heapq.heappop(heap)
+        shards[index].append(site)
+        heapq.heappush(heap, (load + cost, index))
+    # ---
+    return shards
+
+
+def make_plan(count) -> dict:
+    """Split the sites of the site files over ``count`` shards; written to shards/plan.json."""
+    # ---
+    sites = {site: file for site, file in by_site.list_site_files()}
+    titles = {site: len(by_site.load_site_links(file)) for site, file in sites.items()}
+    # ---
+    costs = site_costs(titles, past_runtimes())
+    shards = balance(costs, count)
+    # ---
+    plan = {
+        "count": count,
+        "created": time.time(),
+        "sites": sorted(sites),
+        "shards": shards,
+        "costs": {site: round(cost, 3) for site, cost in costs.items()},
+    }
+    # ---
+    _dump(plan_file, plan)
+    # ---
+    for index, shard in enumerate(shards, start=1):
+        expected = sum(costs[site] for site in shard)
+        logger.info(f"<<green>> shard {index}/{count}: {len(shard)} sites, {expected:.0f} s expected")
+    # ---
+    return plan
+
+
+def get_plan(count) -> dict:
+    """The plan on disk while it is for ``count`` shards and fits the site files, else {}."""
+    # ---
+    plan = _load(plan_file, {})
+    # ---
+    # the jobs of one run start within minutes and must share a plan; the next run makes a new one
+    if (
+        plan.get("count") == count
+        and time.time() - plan.get("created", 0) < STAGE_MAX_AGE
+        and plan.get("sites") == sorted(site for site, _ in by_site.list_site_files())
+    ):
+        return plan
+    # ---
+    return {}
+
+
+def run_shard(index=SHARD_INDEX, count=SHARD_COUNT) -> list:
+    """Count the sites of shard ``index`` of ``count`` (no publishing); returns the failed sites."""
+    # ---
+    # a job making its own plan could split the sites unlike the others: the plan comes first, once
+    plan = get_plan(count)
+    # ---
+    if not plan:
+        logger.info(f"<<red>> shard {index}/{count}: no current plan, run: python3 -m src plan shards:{count}")
+        raise RuntimeError(f"no current plan for {count} shards in {plan_file}")
+    # ---
+    mine = set(plan["shards"][index - 1])
+    others = set(plan["sites"]) - mine
+    # ---
+    logger.info(f"<<green>> shard {index}/{count}: {len(mine)} sites")
+    # ---
+    started = time.time()
+    failed = by_site.work_in_all_sites(jobs=by_site.get_jobs_arg(), publish=False, skip=others)
+    # ---
+    _dump(
+        shard_path(index) / "shard.json",
+        {"plan": plan["created"], "sites": sorted(mine), "failed": failed, "started": started, "finished": time.time()},
+    )
+    # ---
+    metrics.write_report()
+    # ---
+    return failed
+
+
+def merge_shards(publish=True, year=None) -> dict:
+    """
+    Bring the counts and the pages of every shard of the current plan into the main store
+    and outbox, and queue the all page. Returns {"sites": n, "pages": n}, or {} when a
+    shard has not finished (its sites would be missing from the all page).
+    """
+    # ---
+    year = year or last_year
+    plan = _load(plan_file, {})
+    # ---
+    statuses = [_load(shard_path(index) / "shard.json", {}) for index in range(1, plan.get("count", 0) + 1)]
+    waiting = [index for index, status in enumerate(statuses, start=1) if status.get("plan") != plan.get("created")]
+    # ---
+    if not plan or waiting:
+        logger.info(f"<<red>> shards not finished: {', '.join(map(str, waiting)) or 'no plan'}")
+        return {}
+    # ---
+    store = get_store()
+    sites = 0
+    pages = 0
+    # ---
+    for index, status in enumerate(statuses, start=1):
+        # ---
+        path = shard_path(index)
+        # ---
+        # a failed site keeps the counts of its last good run
+        for site in status["sites"]:
+            if site not in status["failed"] and os.path.exists(editors_dump_path / f"{site[:-4]}.json"):
+                store.replace_editor_counts(site[:-4], year, load_dump(site[:-4]))
+                sites += 1
+        # ---
+        manifest = _load(path / "outbox" / "manifest.json", {})
+        for title, item in manifest.items():
+            if item.get("status") != "done":
+                with open(path / "outbox" / item["file"], "r", encoding="utf-8") as f:
+                    outbox.put(title, f.read(), summary=item.get("summary", "update"))
+                pages += 1
+        # ---
+        # moved to the main outbox
+        shutil.rmtree(path / "outbox", ignore_errors=True)
+    # ---
+    logger.info(f"<<green>> merged {sites} sites and {pages} pages of {len(statuses)} shards")
+    # ---
+    # a site with no editors, or that never counted, has no dump
+    files = [f"{site[:-4]}.json" for site in plan["sites"] if os.path.exists(editors_dump_path / f"{site[:-4]}.json")]
+    # ---
+    with metrics.stage("merge"):
+        all_editors = all2.get_all_editors(files)
+    all2.work_all_editors(all_editors, publish=False)
+    # ---
+    if publish:
+        outbox.drain()
+    # ---
+    metrics.write_report()
+    # ---
+    return {"sites": sites, "pages": pages + 1}
+
+
+def get_shards_arg(argv=None) -> int:
+    """N of ``shards:N`` on the command line, 0 when not given."""
+    # ---
+    argv = sys.argv if argv is None else argv
+    # ---
+    return next((int(arg[7:]) for arg in argv if arg.startswith("shards:") and arg[7:].isdigit()), 0)
+
+
+def start():
+    # ---
+    if SHARD_INDEX:
+        run_shard()
+    elif "merge" in sys.argv:
+        merge_shards()
+    else:
+        make_plan(get_shards_arg() or 2)
+
+
+if __name__ == "__main__":
+    start()
@@ -3,85 +3,445 @@
 # ---
 import json
 import logging
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-from .wiki import wikidataapi_post
-from .config import sites_path
+from .wiki import ids_limit, limit_of, wikidataapi_post
+from .config import (
+    WIKIDATA_BATCH_MAX,
+    WIKIDATA_BATCH_MIN,
+    WIKIDATA_MAXLAG,
+    WIKIDATA_WORKERS,
+    editors_dump_path,
+    ensure_dir,
+    main_dump_path,
+    site_qids_path,
+    sites_path,
+    skip_sites,
+)
 from .qids import load_qids_from_file
+from .services import metrics
+from .services.local_store import get_store
 
 logger = logging.getLogger(__name__)
 
+# {qid: {"lastrevid": .., "sitelinks": {site: title}}} of the last run
+sitelinks_cache_file = main_dump_path / "sitelinks_cache.json"
 
-def get_sitelinks(qs_list, lena=300):
+# tries of a wbgetentities batch that cannot be split any further
+BATCH_TRIES = 3
+
+
+def is_processed_site(site) -> bool:
+    # only Wikipedias are counted (sites/*wiki.json), minus the skipped ones
+    return site.endswith("wiki") and site not in skip_sites
+
+
+def iter_entity_batches(qs_list, params, lena=WIKIDATA_BATCH_MAX, workers=WIKIDATA_WORKERS, failed=None):
+    """
+    Run the wbgetentities batches ``workers`` at a time and yield each batch's
+    entities as it completes.
+
+    At most ``2 * workers`` batches are in flight, so only a handful of
+    responses are held in memory at any time.
+
+    Batches start at ``lena`` ids, or the most the account may ask for (ids_limit), and
+    are cut to the limit a "too many values" reply names. A batch that fails is split and
+    retried: down to WIKIDATA_BATCH_MIN ids after network errors (which also halve the
+    next batches), down to single ids after API errors, then BATCH_TRIES times as it is;
+    ids a reply leaves out are asked again once. Ids that still fail are logged and added
+    to ``failed``, for the caller to keep what it had for them.
+    """
     # ---
     qs_list = list(qs_list)
+    workers = max(1, workers)
     # ---
-    params_wd = {
-        "action": "wbgetentities",
-        "format": "json",
-        # "ids": ,
-        "redirects": "yes",
-        "props": "sitelinks",
-        "utf8": 1,
-    }
+    ceiling = max(1, min(lena, ids_limit()))
+    size = ceiling
     # ---
-    all_entities = {}
+    i = 0
+    # failed batches (or their parts) and left-out ids, asked for before the next new batch
+    retry = []
+    asked_again = set()
+    tries = {}
+    failed = [] if failed is None else failed
+    calls = 0
+    # successful batches in a row: the size doubles back after ten
+    streak = 0
     # ---
-    for i in range(0, len(qs_list), lena):
+    def next_batch():
+        nonlocal i
         # ---
-        qids = qs_list[i : i + lena]
+        if retry:
+            return retry.pop()
         # ---
-        params_wd["ids"] = "|".join(qids)
+        qids = qs_list[i : i + size]
+        i += len(qids)
         # ---
-        logger.info(f"<<green>> done:{len(all_entities)} from {len(qs_list)}, get sitelinks for {len(qids)} qids.")
+        return qids
+    # ---
+    def fetch(qids):
+        return qids, wikidataapi_post({**params, "ids": "|".join(qids)})
+    # ---
+    def fill(running):
+        while len(running) < 2 * workers:
+            qids = next_batch()
+            if not qids:
+                break
+            running.add(executor.submit(fetch, qids))
+    # ---
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wbgetentities") as executor:
         # ---
-        json1 = wikidataapi_post(params_wd)
+        running = set()
+        fill(running)
         # ---
-        if json1:
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
             # ---
-            entities = json1.get("entities", {})
+            for future in done:
+                # ---
+                qids, json1 = future.result()
+                calls += 1
+                error = json1.get("error") if json1 else {"code": "no reply"}
+                # ---
+                if error:
+                    streak = 0
+                    limit = limit_of(error)
+                    # ---
+                    if limit:
+                        ceiling = max(1, min(ceiling, limit))
+                        size = min(size, ceiling)
+                        part = ceiling
+                    elif not json1:
+                        # no reply after wikidataapi_post's own tries: smaller batches for a while
+                        size = max(WIKIDATA_BATCH_MIN, min(size, len(qids) // 2))
+                        part = size
+                    else:
+                        # an error of the API is about the ids themselves: split down to the one it refuses
+                        part = max(1, len(qids) // 2)
+                    # ---
+                    if part >= len(qids):
+                        # ---
+                        # as small as it gets: asked again as it is, a few times
+                        tries[qids[0]] = tries.get(qids[0], 1) + 1
+                        if tries[qids[0]] <= BATCH_TRIES:
+                            retry.append(qids)
+                            continue
+                        # ---
+                        logger.error(f"<<red>> wbgetentities failed for {len(qids)} qids: {error}")
+                        failed += qids
+                        continue
+                    # ---
+                    retry += [qids[j : j + part] for j in range(0, len(qids), part)]
+                    logger.warning(f"<<yellow>> wbgetentities: {len(qids)} qids failed ({error}), retrying by {part}")
+                    continue
+                # ---
+                entities = json1.get("entities", {})
+                # ---
+                # a reply trimmed to the account's limit keeps a warning and leaves ids out
+                if limit_of(json1.get("warnings")):
+                    ceiling = max(1, min(ceiling, limit_of(json1.get("warnings"))))
+                    size = min(size, ceiling)
+                # ---
+                answered = set(entities) | {requested_id(qid, kk) for qid, kk in entities.items()}
+                left_out = [qid for qid in qids if qid not in answered]
+                # ---
+                if left_out:
+                    failed += [qid for qid in left_out if qid in asked_again]
+                    left_out = [qid for qid in left_out if qid not in asked_again]
+                    asked_again.update(left_out)
+                    retry += [left_out[j : j + size] for j in range(0, len(left_out), size)]
+                # ---
+                streak += 1
+                if streak >= 10 and size < ceiling:
+                    size, streak = min(ceiling, size * 2), 0
+                # ---
+                yield entities
             # ---
-            all_entities = {**all_entities, **entities}
+            fill(running)
+    # ---
+    logger.debug(f"wbgetentities: {len(qs_list)} ids in {calls} requests, last batch size {size}")
+    # ---
+    if failed:
+        logger.error(f"<<red>> wbgetentities: {len(failed)} ids failed: {', '.join(failed[:10])}")
+
+
+def get_sitelinks_by_qid(qs_list, lena=300, sites=None, failed=None) -> dict:
+    """
+    Return {site: {qid: title}} for the given items.
+
+    Sitelinks are added to the per-site dicts as each batch arrives, and only for
+    the sites we process (or ``sites`` when given), so memory follows the number
+    of titles kept rather than the size of the entity JSON.
+    """
+    # ---
+    qs_list = list(qs_list)
+    # ---
+    params_wd = {
+        "action": "wbgetentities",
+        "format": "json",
+        "redirects": "yes",
+        "props": "sitelinks",
+        "utf8": 1,
+        "maxlag": WIKIDATA_MAXLAG,
+    }
+    # ---
+    # the API can trim the sitelinks itself for short site lists (multi-value limit 50)
+    if sites and len(sites) <= 50:
+        params_wd["sitefilter"] = "|".join(sites)
+    # ---
+    keep_site = set(sites).__contains__ if sites else is_processed_site
     # ---
     sitelinks = {}
+    done = 0
     # ---
-    for _qid_1, kk in all_entities.items():
+    for entities in iter_entity_batches(qs_list, params_wd, lena=lena, failed=failed):
         # ---
-        # "abwiki": {"site": "abwiki","title": "Обама, Барак","badges": []}
-        # ---
-        for _, tab in kk.get("sitelinks", {}).items():
+        for qid, kk in entities.items():
             # ---
-            title = tab.get("title", "")
-            site = tab.get("site", "")
+            # "abwiki": {"site": "abwiki","title": "Обама, Барак","badges": []}
             # ---
-            if site not in sitelinks:
-                sitelinks[site] = []
+            for _, tab in kk.get("sitelinks", {}).items():
+                # ---
+                title = tab.get("title", "")
+                site = tab.get("site", "")
+                # ---
+                if not keep_site(site):
+                    continue
+                # ---
+                if site not in sitelinks:
+                    sitelinks[site] = {}
+                # ---
+                sitelinks[site][qid] = title
+        # ---
+        done += len(entities)
+        logger.info(f"<<green>> done:{done} from {len(qs_list)}, sites: {len(sitelinks)}.")
+    # ---
+    return sitelinks
+
+
+def get_sitelinks(qs_list, lena=300) -> dict:
+    # ---
+    by_qid = get_sitelinks_by_qid(qs_list, lena=lena)
+    # ---
+    return {site: list(links.values()) for site, links in by_qid.items()}
+
+
+def requested_id(qid, entity) -> str:
+    # with redirects=yes a merged item comes back as its target, keep the id we asked for
+    return entity.get("redirects", {}).get("from") or qid
+
+
+def get_lastrevids(qs_list, lena=500) -> dict:
+    """Return {qid: lastrevid} using the small ``props=info`` payload."""
+    # ---
+    params_wd = {
+        "action": "wbgetentities",
+        "format": "json",
+        "redirects": "yes",
+        "props": "info",
+        "utf8": 1,
+        "maxlag": WIKIDATA_MAXLAG,
+    }
+    # ---
+    revisions = {}
+    # ---
+    for entities in iter_entity_batches(list(qs_list), params_wd, lena=lena):
+        for qid, kk in entities.items():
+            if "lastrevid" in kk:
+                revisions[requested_id(qid, kk)] = kk["lastrevid"]
+    # ---
+    return revisions
+
+
+def load_sitelinks_cache() -> dict:
+    # ---
+    if not os.path.exists(sitelinks_cache_file):
+        return {}
+    # ---
+    with open(sitelinks_cache_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def dump_sitelinks_cache(cache) -> None:
+    # ---
+    ensure_dir(sitelinks_cache_file.parent)
+    tmp_file = sitelinks_cache_file.with_suffix(".tmp")
+    # ---
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(cache, f, sort_keys=True)
+    # ---
+    os.replace(tmp_file, sitelinks_cache_file)
+
+
+def refresh_sitelinks_cache(qids_list, lena=500, failed=None) -> dict:
+    """
+    Bring the local {qid: {"lastrevid": .., "sitelinks": {site: title}}} cache up to date.
+
+    A revision-only pass finds the items that are new or changed since they were
+    cached; only those are downloaded again. Items no longer in ``qids_list`` are dropped.
+    """
+    # ---
+    qids_list = list(dict.fromkeys(qids_list))
+    # ---
+    cache = {} if "nocache" in sys.argv else load_sitelinks_cache()
+    # ---
+    revisions = get_lastrevids(qids_list, lena=lena) if cache else {}
+    # ---
+    stale = [qid for qid in qids_list if qid not in cache or cache[qid].get("lastrevid") != revisions.get(qid)]
+    # ---
+    logger.info(f"<<green>> sitelinks cache: {len(qids_list) - len(stale)} unchanged, {len(stale)} to fetch.")
+    metrics.record_cache("sitelinks", hit=True, count=len(qids_list) - len(stale))
+    metrics.record_cache("sitelinks", hit=False, count=len(stale))
+    # ---
+    params_wd = {
+        "action": "wbgetentities",
+        "format": "json",
+        "redirects": "yes",
+        "props": "info|sitelinks",
+        "utf8": 1,
+        "maxlag": WIKIDATA_MAXLAG,
+    }
+    # ---
+    # an item that fails keeps its cached sitelinks (new items have none yet) and is fetched again next time
+    for entities in iter_entity_batches(stale, params_wd, lena=lena, failed=failed):
+        for qid, kk in entities.items():
             # ---
-            sitelinks[site].append(title)
+            if "lastrevid" not in kk:
+                continue
+            # ---
+            cache[requested_id(qid, kk)] = {
+                "lastrevid": kk["lastrevid"],
+                "sitelinks": {
+                    tab["site"]: tab.get("title", "")
+                    for tab in kk.get("sitelinks", {}).values()
+                    if is_processed_site(tab.get("site", ""))
+                },
+            }
+    # ---
+    cache = {qid: cache[qid] for qid in qids_list if qid in cache}
+    # ---
+    dump_sitelinks_cache(cache)
+    # ---
+    return cache
+
+
+def sitelinks_from_cache(cache) -> dict:
+    # ---
+    sitelinks = {}
+    # ---
+    for qid, item in cache.items():
+        for site, title in item["sitelinks"].items():
+            sitelinks.setdefault(site, {})[qid] = title
     # ---
     return sitelinks
 
 
-def save_sitelink_data(sitelink_data):
+def dump_if_changed(file, data) -> bool:
+    """Write data to file unless it already holds the same (a list: the same set of values)."""
+    # ---
+    if os.path.exists(file):
+        with open(file, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        # ---
+        if old == data if isinstance(data, dict) else sorted(old) == sorted(data):
+            return False
+    # ---
+    ensure_dir(file.parent)
+    with open(file, "w", encoding="utf-8") as f:
+        json.dump(data, f, sort_keys=True)
+    # ---
+    return True
+
+
+def save_sitelink_data(sitelink_data, site_qids=None):
+    # ---
+    changed = 0
+    # ---
     for site, links in sitelink_data.items():
         # ---
-        with open(sites_path / f"{site}.json", "w", encoding="utf-8") as f:
-            json.dump(links, f, sort_keys=True)
+        if dump_if_changed(sites_path / f"{site}.json", links):
+            changed += 1
             logger.info(f"dump <<green>> {site} of {len(links)}")
+    # ---
+    # {qid: title} of each site, for the by_qid counting mode and the store
+    for site, links in (site_qids or {}).items():
+        dump_if_changed(site_qids_path / f"{site}.json", links)
+    # ---
+    logger.info(f"<<green>> {changed} of {len(sitelink_data)} site files changed.")
+
+
+def prune_site_files(sites) -> list:
+    """
+    Delete the files of the sites not in ``sites`` (none of the articles is linked there
+    anymore): the site files, and the counts dump so the all page drops the wiki too.
+    Returns the removed sites.
+    """
+    # ---
+    files = os.listdir(ensure_dir(sites_path))
+    gone = sorted({file[:-5] for file in files if file.endswith(".json")} - set(sites))
+    # ---
+    for site in gone:
+        # ---
+        files = [sites_path / f"{site}.json", site_qids_path / f"{site}.json", editors_dump_path / f"{site[:-4]}.json"]
+        # ---
+        for file in files:
+            if os.path.exists(file):
+                os.remove(file)
+        # ---
+        logger.info(f"<<yellow>> {site}: no sitelinks left, its files are removed")
+    # ---
+    return gone
+
 
+def load_sitelink_data(qids_list, sites=None, failed=None) -> dict:
+    """
+    Refresh the sitelinks of the items and write the site files; returns {site: [title]}.
 
-def load_sitelink_data(qids_list) -> dict:
+    The ids Wikidata still fails on are added to ``failed``: on a full refresh they keep
+    their cached sitelinks, a single-site run keeps the old site files.
+    """
     # ---
-    sitelink_data = get_sitelinks(qids_list, lena=500)
+    failed = [] if failed is None else failed
+    # ---
+    if sites:
+        # single-site runs go straight to the API and leave the cache alone
+        by_qid = get_sitelinks_by_qid(qids_list, lena=500, sites=sites, failed=failed)
+    else:
+        by_qid = sitelinks_from_cache(refresh_sitelinks_cache(qids_list, lena=500, failed=failed))
+    # ---
+    sitelink_data = {site: list(links.values()) for site, links in by_qid.items()}
+    # ---
+    # without a cache to fall back on, a partial single-site list would drop titles
+    if sites and failed:
+        logger.info(f"<<red>> {len(failed)} items failed, the files of {', '.join(sites)} are left as they were")
+        return sitelink_data
     # ---
     # dump each site to file
-    save_sitelink_data(sitelink_data)
+    save_sitelink_data(sitelink_data, by_qid)
+    # ---
+    store = get_store()
+    store.replace_sitelinks(by_qid)
+    # ---
+    # a single-site run only knows its own sites; items that failed could be a site's last links
+    if not sites and not failed:
+        for site in prune_site_files(by_qid):
+            store.replace_site_links(site, {})
     # ---
     return sitelink_data
 
 
 def start():
+    # ---
+    sites = []
+    for arg in sys.argv:
+        arg, _, value = arg.partition(":")
+        if arg == "site":
+            sites.append(f"{value}wiki")
+    # ---
     qids_list = load_qids_from_file()
-    load_sitelink_data(qids_list)
+    load_sitelink_data(qids_list, sites=sites)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,107 @@
+"""
+Classify actor names: IP editors, temporary accounts, bots and configured exclusions.
+
+"""
+import functools
+import ipaddress
+import logging
+
+from ..api_sql import iter_sql_results
+from ..config import excluded_actors, home_wiki_actors
+
+logger = logging.getLogger(__name__)
+
+IP = "ip"
+TEMP = "temp"
+EXCLUDED = "excluded"
+
+_excluded = frozenset(excluded_actors)
+
+
+def _is_ip(name) -> bool:
+    try:
+        ipaddress.ip_address(name)
+        return True
+    except ValueError:
+        return False
+
+
+@functools.lru_cache(maxsize=2**18)
+def classify(name) -> str:
+    """
+    Return IP, TEMP or EXCLUDED for names that are never counted, "" otherwise.
+
+    Results are memoized, so a name seen on many wikis is classified once per run.
+    """
+    # ---
+    if name in _excluded:
+        return EXCLUDED
+    # ---
+    # temporary accounts: ~2025-12345-67
+    if name.startswith("~"):
+        return TEMP
+    # ---
+    # only names that can be an address are parsed: IPv4 starts with a digit, IPv6 has ":"
+    if (name[:1].isdigit() or ":" in name) and _is_ip(name):
+        return IP
+    # ---
+    return ""
+
+
+def is_excluded(name, site="") -> bool:
+    # ---
+    if classify(name):
+        return True
+    # ---
+    # some accounts are only listed on their home wiki (Mr. Ibrahem on ar)
+    home = home_wiki_actors.get(name)
+    # ---
+    return bool(site and home and home != site)
+
+
+@functools.lru_cache(maxsize=1)
+def get_global_bots() -> frozenset:
+    """Names of the accounts in the global-bot group, bots on every wiki."""
+    # ---
+    query = """
+        SELECT gu_name from globaluser
+            join global_user_groups on gug_user = gu_id
+            WHERE gug_group = 'global-bot'
+    """
+    # ---
+    # an SQL error is raised, and never cached
+    bots = frozenset(row[0] for row in iter_sql_results(query, "centralauth", as_tuples=True, raise_errors=True))
+    # ---
+    logger.debug(f"get_global_bots: {len(bots)} bots")
+    # ---
+    return bots
+
+
+@functools.lru_cache(maxsize=None)
+def get_bots(site) -> frozenset:
+    """
+    Names of the accounts that have, or had, the bot flag on the wiki, and the global bots.
+
+    An SQL error is raised, so the site fails rather than counting its bots, and is not cached.
+    """
+    # ---
+    query = """
+        SELECT actor_name from actor
+            join user_groups on ug_user = actor_user
+            WHERE ug_group = 'bot'
+        UNION
+        SELECT actor_name from actor
+            join user_former_groups on ufg_user = actor_user
+            WHERE ufg_group = 'bot'
+    """
+    # ---
+    bots = frozenset(row[0] for row in iter_sql_results(query, site, as_tuples=True, raise_errors=True))
+    # ---
+    logger.debug(f"get_bots site:{site}: {len(bots)} bots")
+    # ---
+    return bots | get_global_bots()
+
+
+def drop_excluded(editors, site="", bots=frozenset()) -> dict:
+    """Return {name: value} without the excluded names and the given bots."""
+    return {name: value for name, value in editors.items() if name not in bots and not is_excluded(name, site)}
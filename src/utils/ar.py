@@ -1,35 +1,50 @@
 """
 
 """
-from datetime import datetime
-
 from ..api_sql import retrieve_sql_results
-
-last_year = datetime.now().year - 1
+from .actors import drop_excluded, get_bots
+from .periods import period_sql, timestamp_filter
 
 
-def get_ar_results():
+def get_ar_results(ts_from=None, ts_to=None, period=None):
+    """
+    Top editors of the medicine project articles of arwiki in last_year (or the
+    ``ts_from``..``ts_to`` window). With ``period`` ("year", "month") every editor of the window
+    is counted, per period: {period: {actor: count}}.
+    """
+    # ---
+    bots = get_bots("ar")
+    # ---
+    timestamps = timestamp_filter(ts_from, ts_to)
+    # ---
+    period_column, period_group = period_sql(period)
+    # ---
+    # bots are dropped here, leave room for them in the top 100; per period every editor is kept
+    limit = "" if period else f"limit {100 + len(bots)}"
+    # ---
     qua = f"""
-    SELECT actor_name, count(*) as count from revision
+    SELECT actor_name, {period_column}count(*) as count from revision
         join actor on rev_actor = actor_id
         join page on rev_page = page_id
-        WHERE lower(cast(actor_name as CHAR)) NOT LIKE '%bot%' AND page_namespace = 0 AND rev_timestamp like '{last_year}%'
+        WHERE page_namespace = 0 AND {timestamps}
         and page_id in (
         select DISTINCT pa_page_id
         from page_assessments, page_assessments_projects
         where pa_project_id = pap_project_id
         and pap_project_title = "طب"
         )
-        group by actor_id
+        group by actor_id{period_group}
         order by count(*) desc
-    limit 100;
+    {limit};
     """
     # ---
-    editors = {}
+    periods = {}
     # ---
     result = retrieve_sql_results(qua, "arwiki")
     # ---
     for x in result:
+        # ---
+        editors = periods.setdefault(str(x["period"]) if period else "", {})
         # ---
         actor_name = x["actor_name"]
         # ---
@@ -39,4 +54,7 @@ def get_ar_results():
         editors[actor_name] += x["count"]
         # ---
     # ---
-    return editors
+    if period:
+        return {key: drop_excluded(editors, bots=bots) for key, editors in periods.items()}
+    # ---
+    return drop_excluded(periods.get("", {}), bots=bots)
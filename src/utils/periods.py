@@ -0,0 +1,32 @@
+"""
+Time windows and periods of the count queries (editors, utils.ar): rev_timestamp filters
+and the GROUP BY that splits counts per year or month.
+
+"""
+from datetime import datetime
+
+last_year = datetime.now().year - 1
+
+# counts grouped by period: characters of rev_timestamp that name the period
+PERIODS = {"year": 4, "month": 6}
+
+
+def year_window(year) -> tuple:
+    return f"{year}0101000000", f"{int(year) + 1}0101000000"
+
+
+def timestamp_filter(ts_from=None, ts_to=None, percent="%") -> str:
+    # ---
+    if not ts_from and not ts_to:
+        return f"rev_timestamp like '{last_year}{percent}'"
+    # ---
+    return f"rev_timestamp >= '{ts_from}' AND rev_timestamp < '{ts_to}'"
+
+
+def period_sql(period=None) -> tuple:
+    """The SELECT column and the GROUP BY addition that split the counts by ``period`` ("" when None)."""
+    # ---
+    if not period:
+        return "", ""
+    # ---
+    return f"LEFT(rev_timestamp, {PERIODS[period]}) as period, ", ", period"
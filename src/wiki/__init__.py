@@ -1,9 +1,14 @@
 
 
-from .wikidata import wikidataapi_post
+from .wikidata import ids_limit, limit_of, wikidataapi_post
+from .mdwiki_page_mwclient import get_pages_texts, get_site
 from .mdwiki_page_mwclient import page_mwclient as page
 
 __all__ = [
     "page",
+    "get_site",
+    "get_pages_texts",
     "wikidataapi_post",
+    "ids_limit",
+    "limit_of",
 ]
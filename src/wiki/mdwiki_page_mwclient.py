@@ -2,36 +2,150 @@
 
 """
 # ---
+import functools
 import logging
-
-import mwclient
+import threading
+from typing import TYPE_CHECKING
 
 from ..config import mdwiki_pass, my_username
+from ..services import metrics
+
+if TYPE_CHECKING:
+    import mwclient
 
 logger = logging.getLogger(__name__)
 
+_site_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def _logged_in_site() -> "mwclient.Site":
+    # imported on first use: only the commands that read or save pages pay for mwclient
+    import mwclient
+
+    site_mw = mwclient.Site("www.mdwiki.org")
+    # ---
+    try:
+        site_mw.login(my_username, mdwiki_pass)
+    except mwclient.errors.LoginError as e:
+        logger.error(f"Error logging in: {e}")
+    # ---
+    return site_mw
+
+
+def get_site() -> "mwclient.Site":
+    """Return the shared mdwiki session, creating and logging it in on first use."""
+    with _site_lock:
+        return _logged_in_site()
 
-class page_mwclient:
-    def __init__(self, title: str):
-        self.site_mw = mwclient.Site("www.mdwiki.org")
-        self.username = my_username
-        self.password = mdwiki_pass
 
-        try:
-            self.site_mw.login(self.username, self.password)
-        except mwclient.errors.LoginError as e:
-            logger.error(f"Error logging in: {e}")
+def get_pages_texts(titles, batch_size=50) -> dict:
+    """
+    Fetch the current text of many pages with multi-title ``prop=revisions`` queries.
 
-        self.page = self.site_mw.pages[title]
+    Returns a dict keyed by the requested titles; missing pages map to "" (as
+    ``Page.text()`` does).
+    """
+    # ---
+    site_mw = get_site()
+    # ---
+    titles = list(dict.fromkeys(titles))
+    texts = {}
+    # ---
+    for i in range(0, len(titles), batch_size):
+        # ---
+        batch = titles[i : i + batch_size]
+        # ---
+        with metrics.http_call("mdwiki", "query:revisions"):
+            result = site_mw.post(
+                "query",
+                prop="revisions",
+                rvprop="content",
+                rvslots="main",
+                titles="|".join(batch),
+                formatversion=2,
+            )
+        # ---
+        query = result.get("query", {})
+        # ---
+        # map normalized titles ("A_b" -> "A b") back to the requested ones
+        requested = {title: title for title in batch}
+        for norm in query.get("normalized", []):
+            requested[norm["to"]] = requested.pop(norm["from"], norm["from"])
+        # ---
+        for page_info in query.get("pages", []):
+            # ---
+            title = requested.get(page_info.get("title"), page_info.get("title"))
+            revisions = page_info.get("revisions") or []
+            # ---
+            texts[title] = revisions[0]["slots"]["main"].get("content", "") if revisions else ""
+    # ---
+    logger.debug(f"get_pages_texts: {len(texts)} texts for {len(titles)} titles")
+    # ---
+    return texts
+
+
+def get_pages_revids(titles, batch_size=50) -> dict:
+    """Return {title: id of the current revision} (0 for missing pages) with ``prop=info`` batches."""
+    # ---
+    site_mw = get_site()
+    # ---
+    titles = list(dict.fromkeys(titles))
+    revids = {}
+    # ---
+    for i in range(0, len(titles), batch_size):
+        # ---
+        batch = titles[i : i + batch_size]
+        # ---
+        with metrics.http_call("mdwiki", "query:info"):
+            result = site_mw.post("query", prop="info", titles="|".join(batch), formatversion=2)
+        # ---
+        query = result.get("query", {})
+        # ---
+        requested = {title: title for title in batch}
+        for norm in query.get("normalized", []):
+            requested[norm["to"]] = requested.pop(norm["from"], norm["from"])
+        # ---
+        for page_info in query.get("pages", []):
+            title = requested.get(page_info.get("title"), page_info.get("title"))
+            revids[title] = page_info.get("lastrevid", 0)
+    # ---
+    return revids
+
+
+class page_mwclient:
+    def __init__(self, title: str, text: str = None):
+        self.site_mw = get_site()
+        self.title = title
+        # text already fetched in bulk by get_pages_texts, if any
+        self._text = text
+        self._page = None
+
+    @property
+    def page(self):
+        if self._page is None:
+            self._page = self.site_mw.pages[self.title]
+        return self._page
 
     def get_text(self):
-        return self.page.text()
+        if self._text is None:
+            with metrics.http_call("mdwiki", "query:text"):
+                self._text = self.page.text()
+        return self._text
 
     def exists(self):
         return self.page.exists
 
-    def save(self, newtext: str, summary: str, minor: bool = False):
-        self.page.save(newtext, summary=summary)
+    def revision(self):
+        return self.page.revision
+
+    def save(self, newtext: str, summary: str, minor: bool = False, nocreate: int = 0):
+        # nocreate is a flag parameter: sending it at all (even "0") forbids creating the page
+        kwargs = {"nocreate": 1} if nocreate else {}
+        with metrics.http_call("mdwiki", "edit"):
+            result = self.page.save(newtext, summary=summary, **kwargs)
+        self._text = newtext
+        return result
 
     def create(self, newtext: str, summary: str):
-        self.page.save(newtext, summary=summary)
+        return self.save(newtext, summary=summary)
@@ -0,0 +1,189 @@
+"""
+Outbox of rendered pages and the publisher that drains it.
+
+Rendering writes each page's wikitext to outbox/ and lists it in outbox/manifest.json
+as "pending". drain() then saves the pending pages through the shared mdwiki session
+with a few workers, a token-bucket rate limit and retries with backoff. The manifest is
+updated after every page, so a crashed run resumes where it stopped.
+
+python3 -m src.wiki.outbox        # publish what is pending
+python3 -m src.wiki.outbox dry    # list it only
+
+"""
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ..config import PUBLISH_MAX_TRIES, PUBLISH_RATE, PUBLISH_WORKERS, ensure_dir, outbox_path
+from ..services import metrics
+from .publish import prefetch_pages, publish_page, text_hash
+
+logger = logging.getLogger(__name__)
+
+manifest_file = outbox_path / "manifest.json"
+
+_manifest_lock = threading.Lock()
+
+
+def dry_run() -> bool:
+    """Render to the outbox but publish nothing ("dump" is the old name of this switch)."""
+    return "dry" in sys.argv or "dump" in sys.argv
+
+
+def load_manifest() -> dict:
+    # ---
+    if not os.path.exists(manifest_file):
+        return {}
+    # ---
+    with open(manifest_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _dump_manifest(manifest) -> None:
+    # ---
+    ensure_dir(manifest_file.parent)
+    tmp_file = manifest_file.with_suffix(".tmp")
+    # ---
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, sort_keys=True, indent=1)
+    # ---
+    os.replace(tmp_file, manifest_file)
+
+
+def _update(title, **fields) -> None:
+    with _manifest_lock:
+        manifest = load_manifest()
+        manifest.setdefault(title, {}).update(fields)
+        _dump_manifest(manifest)
+
+
+def page_file(title) -> str:
+    return hashlib.sha1(title.encode("utf-8")).hexdigest() + ".wiki"
+
+
+def put(title, text, summary="update") -> None:
+    """Queue the rendered text of a page for publishing."""
+    # ---
+    file = page_file(title)
+    # ---
+    with open(ensure_dir(outbox_path) / file, "w", encoding="utf-8") as f:
+        f.write(text)
+    # ---
+    _update(title, file=file, sha1=text_hash(text), summary=summary, status="pending", tries=0, error="")
+
+
+def read_text(title) -> str:
+    with open(outbox_path / load_manifest()[title]["file"], "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class TokenBucket:
+    """Allow ``rate`` acquisitions per second on average, with bursts of up to ``burst``."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        # ---
+        if self.rate <= 0:
+            return
+        # ---
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                # ---
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                # ---
+                wait = (1 - self._tokens) / self.rate
+            # ---
+            time.sleep(wait)
+
+
+def _publish_one(title, item, prefetched, bucket, max_tries) -> bool:
+    # ---
+    text = read_text(title)
+    # ---
+    for attempt in range(1, max_tries + 1):
+        # ---
+        bucket.acquire()
+        # ---
+        try:
+            publish_page(title, text, prefetched=prefetched, summary=item.get("summary", "update"))
+        except Exception as e:
+            logger.warning(f"<<yellow>> publish {title} failed (try {attempt}/{max_tries}): {e}")
+            _update(title, tries=item.get("tries", 0) + attempt, error=str(e))
+            # ---
+            if attempt < max_tries:
+                time.sleep(min(60, 2**attempt))
+                # the page may have changed under us, compare again
+                prefetched = None
+            continue
+        # ---
+        _update(title, status="done", tries=item.get("tries", 0) + attempt, error="")
+        os.remove(outbox_path / item["file"])
+        return True
+    # ---
+    _update(title, status="failed")
+    return False
+
+
+def drain(workers=PUBLISH_WORKERS, rate=PUBLISH_RATE, max_tries=PUBLISH_MAX_TRIES) -> dict:
+    """Publish every page not yet done; returns {"done": n, "failed": n}."""
+    # ---
+    pending = {title: item for title, item in load_manifest().items() if item.get("status") != "done"}
+    # ---
+    logger.info(f"<<green>> outbox: {len(pending)} pages to publish")
+    # ---
+    if not pending or dry_run():
+        return {"done": 0, "failed": 0}
+    # ---
+    with metrics.stage("publish"):
+        # ---
+        try:
+            prefetched = prefetch_pages(pending)
+        except Exception as e:
+            logger.warning(f"<<yellow>> prefetch of pages failed, checking one by one: {e}")
+            prefetched = {}
+        # ---
+        bucket = TokenBucket(rate, burst=workers)
+        # ---
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="publish") as executor:
+            results = list(
+                executor.map(
+                    lambda title: _publish_one(title, pending[title], prefetched.get(title), bucket, max_tries),
+                    pending,
+                )
+            )
+    # ---
+    stats = {"done": results.count(True), "failed": results.count(False)}
+    # ---
+    logger.info(f"<<green>> outbox: {stats['done']} published, {stats['failed']} failed")
+    # ---
+    return stats
+
+
+def start():
+    # ---
+    if dry_run():
+        for title, item in load_manifest().items():
+            logger.info(f"{item.get('status')}: {title}")
+        return
+    # ---
+    drain()
+
+
+if __name__ == "__main__":
+    start()
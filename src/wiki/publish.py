@@ -0,0 +1,114 @@
+"""
+Save rendered pages to mdwiki, skipping the ones that did not change.
+
+A ledger (publish_ledger.json) keeps, per title, the hash of the last text we saved
+and the revision it produced. When the page is still at that revision, a rendered
+text with the same hash is skipped without any request, and a different one is
+saved without fetching the current text first. Without a revision to compare (the
+prefetch failed, or a retry), the page is always fetched and compared.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from ..config import ensure_dir, main_dump_path
+from ..services import metrics
+from .mdwiki_page_mwclient import get_pages_revids, get_pages_texts
+from .mdwiki_page_mwclient import page_mwclient as page
+
+logger = logging.getLogger(__name__)
+
+ledger_file = main_dump_path / "publish_ledger.json"
+
+_ledger_lock = threading.Lock()
+_ledger = None
+
+
+def text_hash(text) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def load_ledger() -> dict:
+    # ---
+    global _ledger
+    # ---
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = {}
+            if os.path.exists(ledger_file):
+                with open(ledger_file, "r", encoding="utf-8") as f:
+                    _ledger = json.load(f)
+        return _ledger
+
+
+def record(title, text, revid) -> None:
+    # ---
+    ledger = load_ledger()
+    # ---
+    with _ledger_lock:
+        ledger[title] = {"sha1": text_hash(text), "revid": revid}
+        # ---
+        ensure_dir(ledger_file.parent)
+        tmp_file = ledger_file.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(ledger, f, sort_keys=True)
+        os.replace(tmp_file, ledger_file)
+
+
+def is_current(title, revid) -> bool:
+    """True when the page is known to be at the revision we last saved (revid None: unknown, so not current)."""
+    # ---
+    entry = load_ledger().get(title)
+    # ---
+    return bool(entry) and revid is not None and entry["revid"] == revid
+
+
+def prefetch_pages(titles) -> dict:
+    """
+    Return {title: {"revid": .., "text": ..}} for the pages a run may publish.
+
+    Revision ids are checked in batches for every title; texts are only fetched
+    (also in batches) for pages that were edited on-wiki or are not in the ledger.
+    """
+    # ---
+    titles = list(titles)
+    # ---
+    revids = get_pages_revids(titles)
+    # ---
+    texts = get_pages_texts([title for title in titles if not is_current(title, revids.get(title))])
+    # ---
+    return {title: {"revid": revids.get(title), "text": texts.get(title)} for title in titles}
+
+
+def publish_page(title, text, prefetched=None, summary="update") -> bool:
+    """Save text to the page when it differs from what is there, returns True when saved."""
+    # ---
+    prefetched = prefetched or {}
+    revid = prefetched.get("revid")
+    # ---
+    if is_current(title, revid):
+        # ---
+        if load_ledger()[title]["sha1"] == text_hash(text):
+            logger.info("<<green>> no changes (ledger)")
+            metrics.record_cache("publish_ledger", hit=True)
+            return False
+        # ---
+        # the page still holds our last text, which differs: save without fetching it
+        page_obj = page(title)
+    else:
+        metrics.record_cache("publish_ledger", hit=False)
+        page_obj = page(title, text=prefetched.get("text"))
+        # ---
+        if page_obj.get_text() == text:
+            logger.info("<<green>> no changes")
+            record(title, text, revid or page_obj.revision())
+            return False
+    # ---
+    result = page_obj.save(newtext=text, summary=summary, nocreate=0, minor="") or {}
+    # ---
+    # a null edit has no newrevid, the page stays at its current revision
+    record(title, text, result.get("newrevid") or page_obj.revision())
+    # ---
+    return True
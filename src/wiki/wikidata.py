@@ -1,12 +1,23 @@
 import functools
-import requests
 import logging
+import re
+import time
+from typing import TYPE_CHECKING
+
+from ..config import USER_AGENT, WIKIDATA_BATCH_MAX
+from ..services import metrics
+
+if TYPE_CHECKING:
+    import requests
 
 logger = logging.getLogger(__name__)
 
 
 @functools.lru_cache(maxsize=1)
-def initialize_session() -> requests.Session:
+def initialize_session() -> "requests.Session":
+    # imported on first use, like mwclient: commands that never call Wikidata don't load requests
+    import requests
+
     session = requests.Session()
     adapter = requests.adapters.HTTPAdapter(
         pool_connections=100,
@@ -19,20 +30,115 @@ def initialize_session() -> requests.Session:
     return session
 
 
-def wikidataapi_post(params):
+def retry_after(response, default: float) -> float:
+    try:
+        return max(float(response.headers.get("Retry-After", default)), 1.0)
+    except (TypeError, ValueError):
+        return default
+
+
+def backoff(attempt, response=None) -> float:
+    """Seconds to wait after try ``attempt``: doubling from 2 up to 60, and never less than the Retry-After."""
+    # ---
+    wait = min(60.0, 2.0**attempt)
     # ---
+    if response is not None:
+        wait = max(wait, retry_after(response, default=wait))
+    # ---
+    return wait
+
+
+def wikidataapi_post(params, max_tries=5):
+    """
+    POST to the Wikidata API; the decoded reply, or None once ``max_tries`` tries failed.
+
+    Throttling (HTTP 429, 502-504), maxlag errors and network errors are retried after backoff();
+    errors the API gives for the request itself are returned for the caller to handle.
+    """
+    # ---
+    import requests
+
     session = initialize_session()
     # ---
     url = "https://www.wikidata.org/w/api.php"
     # ---
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
-    }
+    # replies are MBs of repetitive JSON per batch: ask for them compressed
+    headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "gzip"}
     # ---
-    try:
-        response = session.post(url, data=params, headers=headers, timeout=30)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
-        logger.error(f"Error in wikidataapi_post: {e}")
-        return None
+    for attempt in range(1, max_tries + 1):
+        # ---
+        start = time.perf_counter()
+        response = None
+        # ---
+        try:
+            response = session.post(url, data=params, headers=headers, timeout=30)
+            # ---
+            metrics.record_http(
+                "wikidata",
+                params.get("action", ""),
+                time.perf_counter() - start,
+                status=response.status_code,
+                nbytes=len(response.content),
+            )
+            # ---
+            # throttled or servers busy: wait at least as long as we are told to
+            if response.status_code in (429, 502, 503, 504) and attempt < max_tries:
+                wait = backoff(attempt, response)
+                logger.warning(f"<<yellow>> wikidataapi_post: HTTP {response.status_code}, retrying in {wait:.0f}s")
+                time.sleep(wait)
+                continue
+            # ---
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            if response is None:
+                metrics.record_http("wikidata", params.get("action", ""), time.perf_counter() - start, error=str(e))
+            # ---
+            # timeouts, dropped connections, cut replies; a 4xx would fail the same way again
+            client_error = response is not None and 400 <= response.status_code < 500
+            if attempt < max_tries and not client_error:
+                wait = backoff(attempt)
+                logger.warning(f"<<yellow>> wikidataapi_post: {e}, retrying in {wait:.0f}s")
+                time.sleep(wait)
+                continue
+            # ---
+            logger.error(f"Error in wikidataapi_post: {e}")
+            return None
+        # ---
+        error = data.get("error", {})
+        # ---
+        # replication lag above the maxlag parameter: the API sends Retry-After with it
+        if error.get("code") == "maxlag" and attempt < max_tries:
+            wait = backoff(attempt, response)
+            logger.warning(f"<<yellow>> wikidataapi_post: {error.get('info', 'maxlag')}, retrying in {wait:.0f}s")
+            time.sleep(wait)
+            continue
+        # ---
+        return data
+    # ---
+    logger.error(f"Error in wikidataapi_post: giving up after {max_tries} tries")
+    return None
+
+
+@functools.lru_cache(maxsize=1)
+def ids_limit() -> int:
+    """The most ids one wbgetentities request may ask for: WIKIDATA_BATCH_MAX with apihighlimits, else 50."""
+    # ---
+    data = wikidataapi_post({"action": "query", "meta": "userinfo", "uiprop": "rights", "format": "json"})
+    # ---
+    # unknown: start high, a "too many values" error brings it down
+    if not data or "query" not in data:
+        return WIKIDATA_BATCH_MAX
+    # ---
+    if "apihighlimits" in data["query"].get("userinfo", {}).get("rights", []):
+        return WIKIDATA_BATCH_MAX
+    # ---
+    return min(WIKIDATA_BATCH_MAX, 50)
+
+
+def limit_of(error) -> int:
+    """N of a "too many values ... The limit is N." error (or warning) of the API; 0 for other errors."""
+    # ---
+    match = re.search(r"limit is (\d+)", str(error or ""))
+    # ---
+    return int(match.group(1)) if match else 0
@@ -1,32 +1,20 @@
 """
 tfj run stats --image python3.9 --command "$HOME/local/bin/python3 ~/pybot/editor_stats/start.py"
+python3 start.py --jobs 8
+python3 start.py stage:sites --jobs 8
+python3 start.py force
 
-"""
-import os
+Stages that are up to date are skipped and the site loop resumes after the last finished
+site, so rerunning after a job time limit only does what is left (see src/pipeline.py).
+Each run writes reports/run_report.json and reports/editors_stats.prom (see src/services/metrics.py).
+One stage or one site on its own: python3 -m src count site:ar (see src/cli.py).
 
-from src.all2 import get_all_editors, work_all_editors
-from src.by_site import work_in_all_sites
-from src.config import editors_dump_path
-from src.qids import get_qids_list
-from src.sitelinks import load_sitelink_data
+"""
+from src.pipeline import run
 
 
 def start():
-    qids_list = get_qids_list()
-    print(f"len qids_list: {len(qids_list)}")
-
-    sitelinks = load_sitelink_data(qids_list)
-    print(f"len sitelinks: {len(sitelinks)}")
-
-    work_in_all_sites()
-    # ---
-    files = os.listdir(editors_dump_path)
-    print(f"len files: {len(files)}")
-    # ---
-    all_editors = get_all_editors(files)
-    print(f"len all_editors: {len(all_editors)}")
-    # ---
-    work_all_editors(all_editors)
+    run()
 
 
 if __name__ == "__main__":
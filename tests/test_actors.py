@@ -0,0 +1,47 @@
+"""
+Tests for src.utils.actors
+"""
+import pymysql
+import pytest
+
+from src.utils import actors
+
+
+def test_classify() -> None:
+    assert actors.classify("127.0.0.1") == actors.IP
+    assert actors.classify("2001:db8::1") == actors.IP
+    assert actors.classify("~2025-12345-67") == actors.TEMP
+    assert actors.classify("CommonsDelinker") == actors.EXCLUDED
+    assert actors.classify("2pac fan") == ""
+    assert actors.classify("Abbott") == ""
+
+
+def test_drop_excluded() -> None:
+    editors = {"Doc": 50, "10.0.0.1": 40, "Mr._Ibrahem": 30, "MedBot": 20}
+
+    assert actors.drop_excluded(editors, "fr", bots={"MedBot"}) == {"Doc": 50}
+    assert actors.drop_excluded(editors, "ar") == {"Doc": 50, "Mr._Ibrahem": 30, "MedBot": 20}
+
+
+def test_get_bots_adds_global_bots_and_never_caches_a_failure(monkeypatch) -> None:
+    replies = {"centralauth": [[("GlobalBot",)]], "fr": [pymysql.OperationalError(2013, "lost"), [("MedBot",)]]}
+
+    def fake_iter_sql_results(query, wiki, as_tuples=False, raise_errors=False):
+        assert as_tuples and raise_errors
+        reply = replies[wiki].pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return iter(reply)
+
+    monkeypatch.setattr(actors, "iter_sql_results", fake_iter_sql_results)
+    actors.get_bots.cache_clear()
+    actors.get_global_bots.cache_clear()
+
+    with pytest.raises(pymysql.Error):
+        actors.get_bots("fr")
+    assert actors.get_bots("fr") == {"MedBot", "GlobalBot"}
+    # cached once it worked
+    assert actors.get_bots("fr") == {"MedBot", "GlobalBot"}
+
+    actors.get_bots.cache_clear()
+    actors.get_global_bots.cache_clear()
@@ -0,0 +1,62 @@
+"""
+Tests for src.all2
+"""
+import json
+
+import pytest
+
+from src import all2
+from src.services.local_store import LocalStore
+
+
+def test_all_page_keeps_home_wiki_accounts_on_any_wiki() -> None:
+    editors = {
+        "Mr._Ibrahem": {"count": 50, "site": "en"},
+        "10.0.0.1": {"count": 40, "site": "fr"},
+        "Doc": {"count": 30, "site": "fr"},
+    }
+
+    assert list(all2.filter_editors(editors, "all")) == ["Mr._Ibrahem", "Doc"]
+
+
+@pytest.fixture
+def dumps(monkeypatch, tmp_path):
+    (tmp_path / "editors").mkdir()
+    monkeypatch.setattr(all2, "editors_dump_path", tmp_path / "editors")
+    store = LocalStore(tmp_path / "store.sqlite")
+    monkeypatch.setattr(all2, "get_store", lambda: store)
+
+    counts = {
+        "fr": {"Doc": 30, "Nurse": 12, "Pharm": 9},
+        "de": {"Doc": 30, "Nurse": 15, "Surgeon": 20},
+        "ar": {"Nurse": 15, "Pharm": 11},
+    }
+    for site, editors in counts.items():
+        (tmp_path / "editors" / f"{site}.json").write_text(json.dumps(editors), encoding="utf-8")
+
+    return counts, store
+
+
+def test_store_and_files_give_the_same_merge(dumps) -> None:
+    counts, store = dumps
+    # the files in an order that would put fr before de
+    files = ["fr.json", "de.json", "ar.json"]
+
+    from_files = all2.get_all_editors(files)
+    top_files = all2.get_all_editors(files, top=2)
+    min_files = all2.get_all_editors(files, min_count=16)
+
+    for site, editors in counts.items():
+        store.replace_editor_counts(site, all2.last_year, editors)
+
+    assert all2.get_all_editors(files) == from_files
+    assert all2.get_all_editors(files, top=2) == top_files
+    assert all2.get_all_editors(files, min_count=16) == min_files
+    assert from_files == {
+        "Doc": {"count": 30, "site": "de"},
+        "Surgeon": {"count": 20, "site": "de"},
+        "Nurse": {"count": 15, "site": "ar"},
+        "Pharm": {"count": 11, "site": "ar"},
+    }
+    assert list(top_files) == ["Doc", "Surgeon"]
+    assert list(min_files) == ["Doc", "Surgeon"]
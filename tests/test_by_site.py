@@ -0,0 +1,73 @@
+"""
+Tests for src.by_site
+"""
+import sys
+import threading
+import time
+
+from src import by_site
+
+
+def test_get_jobs_arg() -> None:
+    assert by_site.get_jobs_arg(["start.py"]) == 1
+    assert by_site.get_jobs_arg(["start.py", "site:ar", "--jobs", "8"]) == 8
+    assert by_site.get_jobs_arg(["start.py", "--jobs=4"]) == 4
+
+
+def test_parallel_sites_respect_host_limit_and_isolate_errors(monkeypatch) -> None:
+    lock = threading.Lock()
+    active = {"s1": 0, "s2": 0}
+    peak = {"s1": 0, "s2": 0}
+    replicas = {"enwiki": "s1", "frwiki": "s1", "dewiki": "s1", "arwiki": "s2", "eswiki": "s2"}
+
+    def fake_run(site, file, years=None, since=""):
+        key = replicas[site]
+        with lock:
+            active[key] += 1
+            peak[key] = max(peak[key], active[key])
+        time.sleep(0.01)
+        with lock:
+            active[key] -= 1
+        if site == "dewiki":
+            raise RuntimeError("replica down")
+        return {"user": 10}
+
+    monkeypatch.setattr(by_site, "_run_one_site", fake_run)
+    monkeypatch.setattr(by_site, "_site_replica", lambda site: replicas[site])
+
+    sites = [(site, f"{site}.json") for site in replicas]
+    results = by_site.work_in_sites_parallel(sites, jobs=4, per_host=1)
+
+    assert peak == {"s1": 1, "s2": 1}
+    assert results["dewiki"] is None
+    assert results["arwiki"] == {"user": 10}
+    assert len(results) == 5
+
+
+def test_years_arg() -> None:
+    assert by_site.get_years_arg(["site:ar", "years:2019-2021"]) == [2019, 2020, 2021]
+    assert by_site.get_years_arg(["years:2022"]) == [2022]
+    assert by_site.get_years_arg(["years:x", "--jobs", "4"]) == []
+
+
+def test_by_qid_reads_the_site_qids_and_falls_back_to_titles(monkeypatch, tmp_path) -> None:
+    (tmp_path / "sites").mkdir()
+    (tmp_path / "site_qids").mkdir()
+    monkeypatch.setattr(by_site, "sites_path", tmp_path / "sites")
+    monkeypatch.setattr(by_site, "site_qids_path", tmp_path / "site_qids")
+    (tmp_path / "sites" / "frwiki.json").write_text('["Asthme", "Toux"]', encoding="utf-8")
+    (tmp_path / "sites" / "dewiki.json").write_text('["Asthma"]', encoding="utf-8")
+    (tmp_path / "site_qids" / "frwiki.json").write_text('{"Q1": "Asthme", "Q2": "Toux"}', encoding="utf-8")
+
+    runs = []
+    monkeypatch.setattr(by_site, "work_in_one_site", lambda site, links, qids=None, **kwargs: runs.append((site, qids)))
+
+    monkeypatch.setattr(sys, "argv", ["start.py"])
+    by_site._run_one_site("frwiki", "frwiki.json")
+
+    monkeypatch.setattr(sys, "argv", ["start.py", "by_qid"])
+    by_site._run_one_site("frwiki", "frwiki.json")
+    # no qids file: counted by titles
+    by_site._run_one_site("dewiki", "dewiki.json")
+
+    assert runs == [("frwiki", None), ("frwiki", ["Q1", "Q2"]), ("dewiki", None)]
@@ -0,0 +1,18 @@
+"""
+Tests for src.cli
+"""
+import sys
+
+from src import cli
+
+
+def test_command_among_the_stage_arguments(monkeypatch) -> None:
+    calls = []
+    monkeypatch.setitem(cli.COMMANDS, "count", lambda: calls.append(list(sys.argv)))
+    monkeypatch.setattr(sys, "argv", ["src", "site:ar", "count", "--jobs", "2"])
+    # ---
+    assert cli.main() == 0
+    assert calls == [["src", "site:ar", "count", "--jobs", "2"]]
+    # ---
+    assert cli.get_command(["site:ar", "dry"]) == ""
+    assert cli.main(["site:ar"]) == 2
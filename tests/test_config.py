@@ -6,7 +6,16 @@ from _pytest.monkeypatch import MonkeyPatch
 
 
 def test_parallelism_default(monkeypatch: MonkeyPatch) -> None:
-    from src.config import sites_path
+    from src.config import ensure_dir, sites_path
 
     monkeypatch.setattr(sys, "argv", ["script.py"])
-    assert sites_path.exists()
+    assert ensure_dir(sites_path).exists()
+
+
+def test_dirs_created_on_first_use(tmp_path) -> None:
+    from src.config import ensure_dir
+
+    path = tmp_path / "dump" / "editors"
+    assert not path.exists()
+    assert ensure_dir(path) == path
+    assert path.is_dir()
@@ -0,0 +1,129 @@
+"""
+Tests for src.editors
+"""
+import re
+
+import pymysql
+import pytest
+
+from src import editors
+from src.services.local_store import LocalStore
+
+
+@pytest.fixture
+def replica(monkeypatch, tmp_path):
+    (tmp_path / "editors").mkdir()
+    (tmp_path / "checkpoints").mkdir()
+    monkeypatch.setattr(editors, "editors_dump_path", tmp_path / "editors")
+    monkeypatch.setattr(editors, "checkpoints_path", tmp_path / "checkpoints")
+    monkeypatch.setattr(editors, "get_store", lambda: LocalStore(tmp_path / "store.sqlite"))
+
+    queries = []
+
+    def fake_iter(query, site, values=None, as_tuples=False, chunk=None, raise_errors=False):
+        window = re.findall(r"rev_timestamp >= '(\d+)' AND rev_timestamp < '(\d+)'", query)[0]
+        titles = re.findall(r'"(\w+)"', query)
+        queries.append((window, titles))
+        return [("Doc", len(titles)), ("10.0.0.1", 5)]
+
+    monkeypatch.setattr(editors, "iter_sql_results", fake_iter)
+    return queries
+
+
+def test_rerun_only_counts_new_titles(replica) -> None:
+    assert editors.get_editors(["A", "B"], "fr", year=2020) == {"Doc": 2}
+    assert editors.get_editors(["A", "B"], "fr", year=2020) == {"Doc": 2}
+    assert len(replica) == 1
+
+    assert editors.get_editors(["A", "B", "C"], "fr", year=2020) == {"Doc": 3}
+    assert replica[-1] == (("20200101000000", "20210101000000"), ["C"])
+
+
+def test_removed_titles_trigger_a_full_recount(replica) -> None:
+    editors.get_editors(["A", "B"], "fr", year=2020)
+    editors.get_editors(["A"], "fr", year=2020)
+
+    assert replica[-1][1] == ["A"]
+
+
+def test_ar_counts_the_asked_year(replica, monkeypatch) -> None:
+    windows = []
+
+    def fake_ar(ts_from=None, ts_to=None):
+        windows.append((ts_from, ts_to))
+        return {"Doc": 12}
+
+    monkeypatch.setattr(editors, "get_ar_results", fake_ar)
+
+    assert editors.get_editors([], "ar", year=2020) == {"Doc": 12}
+    assert windows == [("20200101000000", "20210101000000")]
+
+
+def test_qids_are_counted_in_chunks_with_having_on_a_single_one(monkeypatch) -> None:
+    queries = []
+
+    def fake_iter(query, site, values=None, as_tuples=False, chunk=None, raise_errors=False):
+        queries.append(("HAVING count(*) >= 10" in query, values))
+        return [("Doc", len(values)), ("10.0.0.1", 3)]
+
+    monkeypatch.setattr(editors, "iter_sql_results", fake_iter)
+    monkeypatch.setattr(editors, "get_bots", lambda site: frozenset())
+
+    # sorted, deduplicated, split; the partial counts are summed here, no HAVING
+    assert editors.get_editors_by_qids(["Q10", "Q2", "Q1", "Q2"], "fr", split_by=2) == {"Doc": 3}
+    assert queries == [(False, ("Q1", "Q2")), (False, ("Q10",))]
+
+    queries.clear()
+    assert editors.get_editors_by_qids(["Q2", "Q1"], "fr", split_by=2) == {"Doc": 2}
+    assert queries == [(True, ("Q1", "Q2"))]
+
+
+def test_chunks_that_time_out_are_split_and_retried(monkeypatch) -> None:
+    monkeypatch.setattr(editors, "get_bots", lambda site: frozenset())
+    monkeypatch.setitem(editors._chunk_sizes, "xx", 4)
+    sizes = []
+
+    def fake_iter(query, site, values=None, as_tuples=False, chunk=None, raise_errors=False):
+        titles = re.findall(r'"(\w+)"', query)
+        sizes.append(len(titles))
+        if len(titles) > 2:
+            raise pymysql.OperationalError(1969, "Query execution was interrupted (max_statement_time exceeded)")
+        return [(title, 1) for title in titles]
+
+    monkeypatch.setattr(editors, "iter_sql_results", fake_iter)
+
+    counts = editors.get_editors_sql([f"T_{n}" for n in range(7)], "xx")
+
+    assert counts == {f"T_{n}": 1 for n in range(7)}
+    assert sizes[:3] == [4, 2, 2]
+    assert max(sizes[1:]) < 4
+
+
+def test_chunk_size_follows_query_time(monkeypatch) -> None:
+    monkeypatch.setattr(editors, "SQL_CHUNK_SECONDS", 10)
+
+    assert editors.next_chunk_size(100, 1) == 200
+    assert editors.next_chunk_size(100, 40) == 50
+    assert editors.next_chunk_size(100, 12.5) == 80
+    assert editors.chunk_end(['"aaaa"'] * 10, 2, size=5, budget=15) == 4
+
+
+def test_years_are_counted_in_one_grouped_pass(monkeypatch, tmp_path) -> None:
+    store = LocalStore(tmp_path / "store.sqlite")
+    monkeypatch.setattr(editors, "get_store", lambda: store)
+    monkeypatch.setattr(editors, "get_bots", lambda site: frozenset({"Bot"}))
+    queries = []
+
+    def fake_iter(query, site, values=None, as_tuples=False, chunk=None, raise_errors=False):
+        queries.append(query)
+        assert "LEFT(rev_timestamp, 4) as period" in query and "group by actor_id, period" in query
+        return [("Doc", "2021", 12), ("Doc", "2022", 3), ("Bot", "2022", 50), ("Nurse", "2023", 11)]
+
+    monkeypatch.setattr(editors, "iter_sql_results", fake_iter)
+
+    by_year = editors.get_editors_years(["A", "B"], "fr", [2023, 2021, 2022])
+
+    assert len(queries) == 1
+    assert "rev_timestamp >= '20210101000000' AND rev_timestamp < '20240101000000'" in queries[0]
+    assert by_year == {2021: {"Doc": 12}, 2022: {"Doc": 3}, 2023: {"Nurse": 11}}
+    assert store.site_editors("fr", 2022) == {"Doc": 3}
@@ -0,0 +1,49 @@
+"""
+Tests for src.services.local_store
+"""
+from src.services import local_store
+from src.services.local_store import LocalStore
+
+
+def test_top_editors_and_site_sizes(tmp_path) -> None:
+    store = LocalStore(tmp_path / "store.sqlite")
+
+    store.replace_sitelinks({"frwiki": {"Q1": "Asthme", "Q2": "Toux"}, "arwiki": {"Q1": "ربو"}})
+    store.replace_editor_counts("fr", 2024, {"Doc": 20, "Nurse": 5})
+    store.replace_editor_counts("ar", 2024, {"Doc": 40, "Pharm": 12})
+    store.replace_editor_counts("ar", 2024, {"Doc": 30, "Pharm": 12})
+
+    assert store.site_sizes() == [("frwiki", 2), ("arwiki", 1)]
+    assert store.site_links("frwiki") == {"Asthme": "Q1", "Toux": "Q2"}
+    assert store.top_editors(2024) == [("Doc", 30, "ar"), ("Pharm", 12, "ar")]
+    assert store.top_editors(2024, sites=["fr"]) == [("Doc", 20, "fr")]
+    assert store.top_editors(2024, limit=1) == [("Doc", 30, "ar")]
+
+
+def test_month_windows_are_sums_of_months(tmp_path) -> None:
+    store = LocalStore(tmp_path / "store.sqlite")
+
+    store.replace_editor_months("fr", "202501", {"202501": {"Doc": 6}, "202502": {"Doc": 6, "Nurse": 3}})
+    store.replace_editor_months("ar", "202501", {"202502": {"Doc": 20}, "202603": {"Pharm": 15}})
+    store.replace_editor_months("ar", "202601", {"202601": {"Pharm": 11}})
+
+    assert store.month_editors("fr", "202501", "202512") == {"Doc": 12, "Nurse": 3}
+    assert store.month_editors("ar", "202601", "202612") == {"Pharm": 11}
+    assert sorted(store.month_sites("202501", "202502")) == ["ar", "fr"]
+    assert store.top_month_editors("202501", "202512") == [("Doc", 20, "ar")]
+
+
+def test_json_layout_keeps_each_title_with_its_qid(monkeypatch, tmp_path) -> None:
+    for name in ("main_dump_path", "sites_path", "site_qids_path", "editors_dump_path"):
+        monkeypatch.setattr(local_store, name, tmp_path / name)
+
+    store = LocalStore(tmp_path / "store.sqlite")
+    store.replace_sitelinks({"frwiki": {"Q1": "Asthme", "Q2": "Toux"}})
+    store.export_json(2024)
+
+    # the titles listed in another order than the qids file
+    (tmp_path / "sites_path" / "frwiki.json").write_text('["Toux", "Asthme"]', encoding="utf-8")
+
+    copy = LocalStore(tmp_path / "copy.sqlite")
+    copy.import_json(2024)
+    assert copy.site_links("frwiki") == {"Asthme": "Q1", "Toux": "Q2"}
@@ -0,0 +1,68 @@
+"""
+Tests for src.wiki.mdwiki_page_mwclient
+"""
+import pytest
+
+from src.wiki import mdwiki_page_mwclient
+
+
+class FakeSite:
+    """The ``query`` API of mwclient.Site (formatversion=2) over a {title: (revid, text)} wiki."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.batches = []
+
+    def post(self, action, titles="", prop="", **params):
+        # ---
+        batch = titles.split("|")
+        self.batches.append(batch)
+        # ---
+        normalized = [{"from": title, "to": title.replace("_", " ")} for title in batch if "_" in title]
+        pages = []
+        # ---
+        for title in dict.fromkeys(title.replace("_", " ") for title in batch):
+            if title not in self.pages:
+                pages.append({"title": title, "missing": True})
+                continue
+            revid, text = self.pages[title]
+            if prop == "revisions":
+                pages.append({"title": title, "revisions": [{"slots": {"main": {"content": text}}}]})
+            else:
+                pages.append({"title": title, "lastrevid": revid})
+        # ---
+        query = {"pages": pages}
+        if normalized:
+            query["normalized"] = normalized
+        # ---
+        return {"batchcomplete": True, "query": query}
+
+
+@pytest.fixture
+def site(monkeypatch):
+    fake = FakeSite({f"Page {n}": (100 + n, f"text {n}") for n in range(1, 6)})
+    monkeypatch.setattr(mdwiki_page_mwclient, "get_site", lambda: fake)
+    return fake
+
+
+def test_get_pages_texts_batches_and_keeps_the_requested_titles(site) -> None:
+    titles = ["Page_1", "Page 2", "Page 3", "Page 2", "Page_4", "Missing page"]
+
+    texts = mdwiki_page_mwclient.get_pages_texts(titles, batch_size=2)
+
+    # duplicates asked once, in batches of 2
+    assert site.batches == [["Page_1", "Page 2"], ["Page 3", "Page_4"], ["Missing page"]]
+    assert texts == {
+        "Page_1": "text 1",
+        "Page 2": "text 2",
+        "Page 3": "text 3",
+        "Page_4": "text 4",
+        "Missing page": "",
+    }
+
+
+def test_get_pages_revids(site) -> None:
+    revids = mdwiki_page_mwclient.get_pages_revids(["Page_5", "Page 1", "Missing page"], batch_size=50)
+
+    assert site.batches == [["Page_5", "Page 1", "Missing page"]]
+    assert revids == {"Page_5": 105, "Page 1": 101, "Missing page": 0}
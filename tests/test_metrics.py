@@ -0,0 +1,53 @@
+"""
+Tests for src.services.metrics
+"""
+import json
+
+import pytest
+
+from src.services import metrics
+
+
+@pytest.fixture(autouse=True)
+def fresh_run(monkeypatch, tmp_path):
+    monkeypatch.setattr(metrics, "reports_path", tmp_path)
+    monkeypatch.setattr(metrics, "PROM_FILE", "")
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_report_ranks_sites_and_counts_calls(tmp_path) -> None:
+    with metrics.stage("count", site="fr"):
+        metrics.record_sql("fr", rows=3, nbytes=30, seconds=0.2, chunk=0)
+        metrics.record_sql("fr", rows=1, nbytes=10, seconds=0.1, chunk=1)
+    with metrics.stage("count", site="de"):
+        metrics.record_sql("de", rows=1, nbytes=5, seconds=0.01, chunk=0)
+    metrics.record_http("wikidata", "wbgetentities", 0.3, status=200, nbytes=100)
+    metrics.record_cache("checkpoints", hit=True)
+    metrics.record_cache("checkpoints", hit=False)
+
+    data = metrics.write_report()
+
+    assert data["stages"]["count"]["calls"] == 2
+    assert data["sql"]["calls"] == 3 and data["sql"]["rows"] == 5 and data["sql"]["bytes"] == 45
+    assert data["sites"]["fr"]["sql_calls"] == 2
+    assert data["http"]["wikidata"]["calls"] == 1
+    assert data["cache"] == {"checkpoints": {"hits": 1, "misses": 1}}
+
+    with open(tmp_path / "run_report.json", encoding="utf-8") as f:
+        assert json.load(f)["sql"]["calls"] == 3
+
+
+def test_prometheus_histograms_are_cumulative(tmp_path) -> None:
+    for seconds in (0.005, 0.2, 400):
+        metrics.record_sql("fr", rows=0, nbytes=0, seconds=seconds)
+
+    metrics.write_report()
+    text = (tmp_path / "editors_stats.prom").read_text(encoding="utf-8")
+
+    assert "# TYPE editors_stats_sql_query_seconds histogram" in text
+    assert 'editors_stats_sql_query_seconds_bucket{le="0.01"} 1' in text
+    assert 'editors_stats_sql_query_seconds_bucket{le="0.25"} 2' in text
+    assert 'editors_stats_sql_query_seconds_bucket{le="+Inf"} 3' in text
+    assert "editors_stats_sql_query_seconds_count 3" in text
@@ -0,0 +1,29 @@
+"""
+Tests for src.months
+"""
+from datetime import date
+
+from src import months, render
+
+
+def test_windows_of_the_stored_months() -> None:
+    today = date(2026, 1, 18)
+
+    assert months.shift("202601", -12) == "202501"
+    assert months.shift("202412", 1) == "202501"
+    assert months.year_to_date(today) == ("2026_to_date", "202601", "202601", "2026, up to January 2026")
+    assert months.trailing_12(today) == ("last_12_months", "202501", "202512", "January 2025 to December 2025")
+
+    # the calendar years keep their own pages
+    assert [w.token for w in months.windows("202501", today)] == ["2026_to_date", "last_12_months"]
+    assert [w.token for w in months.windows("202506", today)] == ["2026_to_date"]
+
+
+def test_window_pages_do_not_take_the_year_pages() -> None:
+    window = months.trailing_12(date(2026, 10, 18))
+    text = render.site_page("fr", {"Doc": 12}, 5, window.token, caption=window.caption)
+
+    assert render.site_title("fr", window.token) != render.site_title("fr", 2025)
+    assert "Top medical editors by lang" not in text
+    assert "Numbers of October 2025 to September 2026." in text
+    assert "Top medical editors by lang|2025" in render.site_page("fr", {"Doc": 12}, 5, 2025)
@@ -0,0 +1,169 @@
+"""
+Tests for src.services.mysql_client
+"""
+import contextlib
+import threading
+
+import pymysql
+import pytest
+
+from src.services import mysql_client
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        if self.conn.fail_with:
+            error, self.conn.fail_with = self.conn.fail_with, None
+            raise error
+        self.conn.queries.append((self.conn.db, query))
+
+    def fetchall(self):
+        return [{"db": self.conn.db}]
+
+    def fetchmany(self, size=None):
+        rows, self.conn.rows = self.conn.rows[:size], self.conn.rows[size:]
+        return rows
+
+    def close(self):
+        self.conn.rows = []
+
+
+class FakeConnection:
+    def __init__(self, database="", **kwargs):
+        self.db = database
+        self.queries = []
+        self.fail_with = None
+        self.closed = False
+        self.rows = []
+
+    def cursor(self, cursor=None):
+        return FakeCursor(self)
+
+    def select_db(self, db):
+        self.db = db
+
+    def ping(self, reconnect=False):
+        return True
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def fake_connect(**kwargs):
+        conn = FakeConnection(**kwargs)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(pymysql, "connect", fake_connect)
+    monkeypatch.setattr(mysql_client, "replica_key", lambda host: "s3")
+    mysql_client.get_pool.cache_clear()
+    yield opened
+    mysql_client.get_pool().close_all()
+    mysql_client.get_pool.cache_clear()
+
+
+def test_connection_is_reused_across_wikis_of_one_section(connections):
+    rows1 = mysql_client.make_sql_connect("SELECT 1", db="arwiki_p", host="arwiki.analytics.db.svc.wikimedia.cloud")
+    rows2 = mysql_client.make_sql_connect("SELECT 1", db="frwiki_p", host="frwiki.analytics.db.svc.wikimedia.cloud")
+
+    assert len(connections) == 1
+    assert rows1 == [{"db": "arwiki_p"}]
+    assert rows2 == [{"db": "frwiki_p"}]
+
+
+def test_reconnects_when_server_has_gone_away(connections):
+    mysql_client.make_sql_connect("SELECT 1", db="arwiki_p", host="h")
+    connections[0].fail_with = pymysql.OperationalError(2006, "MySQL server has gone away")
+
+    rows = mysql_client.make_sql_connect("SELECT 1", db="arwiki_p", host="h")
+
+    assert rows == [{"db": "arwiki_p"}]
+    assert len(connections) == 2
+    assert connections[0].closed
+
+
+def test_pool_caps_connections_per_host(connections):
+    pool = mysql_client.ConnectionPool(max_per_host=1)
+
+    with pool.connection("arwiki_p", "h"):
+        assert pool._open["s3"] == 1
+    with pool.connection("frwiki_p", "h"):
+        assert pool._open["s3"] == 1
+
+    assert len(connections) == 1
+
+
+def test_pool_checkout_waits_for_a_released_connection(connections):
+    pool = mysql_client.ConnectionPool(max_per_host=2)
+    got = []
+    checked_out = threading.Event()
+
+    def checkout():
+        with pool.connection("frwiki_p", "h") as conn:
+            got.append(conn)
+            checked_out.set()
+
+    with contextlib.ExitStack() as first:
+        first_conn = first.enter_context(pool.connection("arwiki_p", "h"))
+        with pool.connection("enwiki_p", "h"):
+            waiting = threading.Thread(target=checkout)
+            waiting.start()
+
+            # both connections of the section are held: the checkout waits
+            assert not checked_out.wait(0.2)
+            assert got == []
+
+            first.close()
+            assert checked_out.wait(5)
+            waiting.join(5)
+
+    # the released connection, switched to the waiting caller's wiki; no third one opened
+    assert got == [first_conn]
+    assert first_conn.db == "frwiki_p"
+    assert len(connections) == 2
+    assert pool._open["s3"] == 2
+
+def test_iter_sql_rows_streams_and_decodes_in_batches(connections):
+    mysql_client.make_sql_connect("SELECT 1", db="enwiki_p", host="h")
+    connections[0].rows = [{"page_title": f"T{i}".encode(), "count": i} for i in range(5)]
+
+    rows = mysql_client.iter_sql_rows("SELECT 2", db="enwiki_p", host="h", batch_size=2)
+    first = next(rows)
+
+    assert first == {"page_title": "T0", "count": 0}
+    assert len(connections[0].rows) == 3
+    assert [row["page_title"] for row in rows] == ["T1", "T2", "T3", "T4"]
+
+
+def test_tuple_rows_decode_only_binary_columns():
+    class Field:
+        def __init__(self, type_code, charsetnr):
+            self.type_code = type_code
+            self.charsetnr = charsetnr
+
+    class Result:
+        fields = [Field(mysql_client.FIELD_TYPE.VAR_STRING, 63), Field(mysql_client.FIELD_TYPE.LONGLONG, 63)]
+
+    class Cursor:
+        _result = Result()
+
+    columns = mysql_client.binary_columns(Cursor())
+
+    assert columns == [0]
+    assert mysql_client.decode_columns([(b"Mr._Ibrahem", 12), (b"\xd8\xb7\xd8\xa8", 3)], columns) == [
+        ("Mr._Ibrahem", 12),
+        ("طب", 3),
+    ]
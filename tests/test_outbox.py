@@ -0,0 +1,53 @@
+"""
+Tests for src.wiki.outbox
+"""
+import sys
+
+import pytest
+
+from src.wiki import outbox
+
+
+@pytest.fixture
+def box(monkeypatch, tmp_path):
+    monkeypatch.setattr(outbox, "outbox_path", tmp_path)
+    monkeypatch.setattr(outbox, "manifest_file", tmp_path / "manifest.json")
+    monkeypatch.setattr(outbox, "prefetch_pages", lambda titles: {})
+    monkeypatch.setattr(outbox.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(sys, "argv", ["start.py"])
+    return tmp_path
+
+
+def test_drain_retries_and_resumes(box, monkeypatch) -> None:
+    failures = {"Stats/fr": 1, "Stats/de": 10}
+    published = []
+
+    def fake_publish(title, text, prefetched=None, summary="update"):
+        if failures.get(title, 0) > 0:
+            failures[title] -= 1
+            raise ConnectionError("timeout")
+        published.append((title, text))
+        return True
+
+    monkeypatch.setattr(outbox, "publish_page", fake_publish)
+
+    outbox.put("Stats/fr", "fr text")
+    outbox.put("Stats/de", "de text")
+
+    assert outbox.drain(workers=2, rate=0, max_tries=2) == {"done": 1, "failed": 1}
+    assert published == [("Stats/fr", "fr text")]
+    assert outbox.load_manifest()["Stats/de"]["status"] == "failed"
+
+    failures["Stats/de"] = 0
+    assert outbox.drain(workers=2, rate=0, max_tries=2) == {"done": 1, "failed": 0}
+    assert published[-1] == ("Stats/de", "de text")
+
+
+def test_dry_run_publishes_nothing(box, monkeypatch) -> None:
+    monkeypatch.setattr(sys, "argv", ["start.py", "dry"])
+    monkeypatch.setattr(outbox, "publish_page", lambda *args, **kwargs: pytest.fail("published"))
+
+    outbox.put("Stats/fr", "fr text")
+
+    assert outbox.drain() == {"done": 0, "failed": 0}
+    assert outbox.read_text("Stats/fr") == "fr text"
@@ -0,0 +1,108 @@
+"""
+Tests for src.pipeline
+"""
+import pytest
+
+from src import pipeline
+
+
+@pytest.fixture
+def calls(monkeypatch, tmp_path):
+    (tmp_path / "sites").mkdir()
+    (tmp_path / "editors").mkdir()
+    monkeypatch.setattr(pipeline, "state_file", tmp_path / "pipeline.json")
+    monkeypatch.setattr(pipeline, "sites_path", tmp_path / "sites")
+    monkeypatch.setattr(pipeline, "editors_dump_path", tmp_path / "editors")
+    monkeypatch.setattr(pipeline.qids, "qids_file", tmp_path / "qids.json")
+    monkeypatch.setattr(pipeline.metrics, "write_report", lambda: {})
+
+    calls = []
+    failing = {"dewiki"}
+
+    def fake_sites(p_site="", jobs=1, publish=True, skip=(), on_done=None):
+        failed = []
+        for site in ["frwiki", "dewiki", "eswiki"]:
+            if site in skip:
+                continue
+            calls.append(site)
+            error = RuntimeError("replica down") if site in failing else None
+            on_done(site, error)
+            if error:
+                failed.append(site)
+        return failed
+
+    monkeypatch.setattr(pipeline.qids, "get_qids_list", lambda: calls.append("qids") or ["Q1"])
+    monkeypatch.setattr(pipeline.qids, "load_qids_from_file", lambda: ["Q1"])
+    monkeypatch.setattr(
+        pipeline.sitelinks, "load_sitelink_data", lambda qids, failed=None: calls.append("sitelinks") or {}
+    )
+    monkeypatch.setattr(pipeline.by_site, "work_in_all_sites", fake_sites)
+    monkeypatch.setattr(pipeline.all2, "get_all_editors", lambda files: calls.append("merge") or {})
+    monkeypatch.setattr(pipeline.all2, "work_all_editors", lambda editors, publish=True: None)
+    monkeypatch.setattr(pipeline.outbox, "drain", lambda: calls.append("publish") or {"done": 0, "failed": 0})
+
+    return calls, failing
+
+
+def test_rerun_resumes_after_the_finished_sites(calls) -> None:
+    calls, failing = calls
+
+    statuses = pipeline.run(["start.py"])
+    assert calls == ["qids", "sitelinks", "frwiki", "dewiki", "eswiki", "merge", "publish"]
+    assert statuses["sites"] == "incomplete"
+
+    calls.clear()
+    failing.clear()
+    statuses = pipeline.run(["start.py"])
+    assert calls == ["dewiki", "publish"]
+    assert statuses == {
+        "qids": "skipped",
+        "sitelinks": "skipped",
+        "sites": "done",
+        "merge": "skipped",
+        "publish": "done",
+    }
+
+
+def test_sites_stage_twice_in_a_row_counts_every_site(calls) -> None:
+    calls, failing = calls
+    failing.clear()
+    pipeline.run(["start.py"])
+
+    # site files unchanged: same fingerprint, yet a finished run is not resumed
+    for _ in range(2):
+        calls.clear()
+        assert pipeline.run(["start.py", "stage:sites"]) == {"sites": "done"}
+        assert calls == ["frwiki", "dewiki", "eswiki"]
+
+
+def test_sitelinks_stage_is_incomplete_when_items_fail(calls, monkeypatch) -> None:
+    monkeypatch.setattr(pipeline.sitelinks, "load_sitelink_data", lambda qids, failed=None: failed.append("Q1") or {})
+
+    assert pipeline.run(["start.py", "stage:sitelinks"]) == {"sitelinks": "incomplete"}
+
+
+def test_single_stage_and_force(calls) -> None:
+    calls, failing = calls
+    failing.clear()
+    pipeline.run(["start.py"])
+
+    calls.clear()
+    pipeline.run(["start.py", "stage:qids"])
+    assert calls == ["qids"]
+
+    calls.clear()
+    pipeline.run(["start.py", "force"])
+    assert calls == ["qids", "sitelinks", "frwiki", "dewiki", "eswiki", "merge", "publish"]
+
+    with pytest.raises(ValueError):
+        pipeline.run(["start.py", "stage:nope"])
+
+
+def test_external_stages_go_stale() -> None:
+    stage = pipeline.Stage("qids", None, lambda: "", external=True)
+    last = {"fingerprint": "", "finished": 1000.0}
+
+    assert pipeline.is_fresh(stage, last, "", now=1000.0 + pipeline.STAGE_MAX_AGE - 1)
+    assert not pipeline.is_fresh(stage, last, "", now=1000.0 + pipeline.STAGE_MAX_AGE + 1)
+    assert not pipeline.is_fresh(stage, last, "other", now=1000.0)
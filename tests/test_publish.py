@@ -0,0 +1,88 @@
+"""
+Tests for src.wiki.publish
+"""
+import pytest
+
+from src.wiki import publish
+
+
+class FakePage:
+    """What publish_page needs of page_mwclient, over a {title: (revid, text)} wiki."""
+
+    def __init__(self, wiki, saves, title, text=None):
+        self.wiki = wiki
+        self.saves = saves
+        self.title = title
+        self.text = text
+
+    def get_text(self):
+        if self.text is None:
+            self.text = self.wiki.get(self.title, (0, ""))[1]
+        return self.text
+
+    def revision(self):
+        return self.wiki.get(self.title, (0, ""))[0]
+
+    def save(self, newtext, summary, nocreate=0, minor=""):
+        revid = max(revid for revid, _ in self.wiki.values()) + 1
+        self.wiki[self.title] = (revid, newtext)
+        self.saves.append(self.title)
+        return {"newrevid": revid}
+
+
+@pytest.fixture
+def wiki(monkeypatch, tmp_path):
+    monkeypatch.setattr(publish, "ledger_file", tmp_path / "publish_ledger.json")
+    monkeypatch.setattr(publish, "_ledger", None)
+
+    wiki = {"Stats/fr": (5, "old")}
+    saves = []
+    pages = []
+
+    def fake_page(title, text=None):
+        pages.append(title)
+        return FakePage(wiki, saves, title, text)
+
+    monkeypatch.setattr(publish, "page", fake_page)
+    return wiki, saves, pages
+
+
+def test_ledger_skips_unchanged_pages_at_our_revision(wiki) -> None:
+    wiki, saves, pages = wiki
+
+    assert publish.publish_page("Stats/fr", "new", prefetched={"revid": 5, "text": "old"})
+    assert saves == ["Stats/fr"]
+    assert publish.load_ledger()["Stats/fr"] == {"sha1": publish.text_hash("new"), "revid": 6}
+
+    # still at our revision, same text: no request at all
+    pages.clear()
+    assert not publish.publish_page("Stats/fr", "new", prefetched={"revid": 6})
+    assert pages == []
+
+
+def test_pages_without_a_known_revision_are_compared(wiki) -> None:
+    wiki, saves, pages = wiki
+    publish.record("Stats/fr", "new", 5)
+
+    # the prefetch failed: the ledger says our text is there, but the page is fetched
+    assert publish.publish_page("Stats/fr", "new", prefetched=None)
+    assert wiki["Stats/fr"] == (6, "new")
+
+    # edited on-wiki after our save: fetched and saved again
+    wiki["Stats/fr"] = (7, "vandalism")
+    assert publish.publish_page("Stats/fr", "new", prefetched={"revid": 7})
+    assert saves == ["Stats/fr", "Stats/fr"]
+
+
+def test_prefetch_fetches_texts_of_changed_or_unknown_pages(wiki, monkeypatch) -> None:
+    fetched = []
+    monkeypatch.setattr(publish, "get_pages_revids", lambda titles: {"Stats/fr": 5, "Stats/de": 9})
+    monkeypatch.setattr(publish, "get_pages_texts", lambda titles: fetched.extend(titles) or {})
+    publish.record("Stats/fr", "old", 5)
+    publish.record("Stats/de", "old", 8)
+
+    prefetched = publish.prefetch_pages(["Stats/fr", "Stats/de", "Stats/es"])
+
+    assert fetched == ["Stats/de", "Stats/es"]
+    assert prefetched["Stats/fr"] == {"revid": 5, "text": None}
+    assert prefetched["Stats/es"]["revid"] is None
@@ -0,0 +1,23 @@
+"""
+Tests for src.qids
+"""
+import pytest
+
+from src import qids
+
+
+def test_broken_stream_keeps_the_old_list(monkeypatch, tmp_path) -> None:
+    monkeypatch.setattr(qids, "qids_file", tmp_path / "qids.json")
+    monkeypatch.setattr(qids, "get_store", lambda: pytest.fail("store replaced"))
+    (tmp_path / "qids.json").write_text('["Q1", "Q2"]', encoding="utf-8")
+
+    def fake_results(query, wiki, raise_errors=False):
+        yield {"page_title": "Aspirin", "pp_value": "Q1"}
+        if raise_errors:
+            raise ConnectionError("lost connection to the replica")
+
+    monkeypatch.setattr(qids, "iter_sql_results", fake_results)
+
+    with pytest.raises(ConnectionError):
+        qids.get_qids_list()
+    assert qids.load_qids_from_file() == ["Q1", "Q2"]
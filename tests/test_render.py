@@ -0,0 +1,28 @@
+"""
+Tests for src.render
+"""
+from src import render
+
+
+def test_ranked_breaks_ties_by_name() -> None:
+    assert render.ranked({"b": 5, "a": 5, "c": 9}) == [("c", 9), ("a", 5), ("b", 5)]
+
+
+def test_site_page_keeps_the_top_rows() -> None:
+    editors = dict(render.ranked({f"U_{n}": n + 10 for n in range(150)}))
+
+    text = render.site_page("fr", editors, 1234, 2023)
+
+    assert "There are 1,234 articles in fr" in text
+    assert "\n|-\n!1\n|[[:w:fr:user:U 149|U 149]]\n|159" in text
+    assert "!100\n" in text and "!101\n" not in text
+    assert text.endswith("\n|}")
+
+
+def test_all_page_lists_targets() -> None:
+    editors = {"A_b": {"count": 40, "site": "ar"}, "C": {"count": 12, "site": "en"}}
+
+    text = render.all_page(editors, 2023)
+
+    assert "#{{#target:User:A b|ar.wikipedia.org}}\n#{{#target:User:C|en.wikipedia.org}}\n" in text
+    assert "|-\n!2\n|[[:w:en:user:C|C]]\n|12\n|en\n" in text
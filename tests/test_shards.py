@@ -0,0 +1,85 @@
+"""
+Tests for src.shards
+"""
+import json
+import time
+
+import pytest
+
+from src import all2, editors, shards
+from src.config import get_shard_arg
+from src.services.local_store import LocalStore
+
+
+def test_longest_sites_first_to_the_least_loaded_shard() -> None:
+    costs = {"a": 7, "b": 5, "c": 4, "d": 3, "e": 3, "f": 2}
+
+    plan = shards.balance(costs, 2)
+
+    assert plan == [["a", "d", "f"], ["b", "c", "e"]]
+    assert [sum(costs[site] for site in shard) for shard in plan] == [12, 12]
+    assert shards.balance({"a": 1}, 3) == [["a"], [], []]
+
+
+def test_sites_without_history_cost_their_titles() -> None:
+    titles = {"arwiki": 100, "frwiki": 400, "dewiki": 50}
+    runtimes = {"arwiki": 25.0, "dewiki": 25.0}
+
+    # median of 0.25 and 0.5 seconds per title
+    assert shards.site_costs(titles, runtimes) == {"arwiki": 25.0, "frwiki": 150.0, "dewiki": 25.0}
+    assert shards.site_costs({"arwiki": 3}, {}) == {"arwiki": 3.0}
+
+
+def test_shard_args() -> None:
+    assert get_shard_arg(["count", "shard:2/4"]) == (2, 4)
+    assert get_shard_arg(["count", "shard:5/4"]) == (0, 0)
+    assert shards.get_shards_arg(["plan", "shards:3"]) == 3
+
+
+def test_merge_skips_planned_sites_without_a_dump(monkeypatch, tmp_path) -> None:
+    (tmp_path / "editors").mkdir()
+    (tmp_path / "shards" / "1").mkdir(parents=True)
+    store = LocalStore(tmp_path / "store.sqlite")
+    for module in (shards, all2, editors):
+        monkeypatch.setattr(module, "editors_dump_path", tmp_path / "editors")
+    monkeypatch.setattr(shards, "shards_path", tmp_path / "shards")
+    monkeypatch.setattr(shards, "plan_file", tmp_path / "shards" / "plan.json")
+    monkeypatch.setattr(shards, "get_store", lambda: store)
+    monkeypatch.setattr(all2, "get_store", lambda: store)
+    monkeypatch.setattr(shards.metrics, "write_report", lambda: {})
+    pages = []
+    monkeypatch.setattr(all2, "work_all_editors", lambda editors_, publish=True: pages.append(editors_))
+
+    # xxwiki counted no editors: no dump
+    plan = {"count": 1, "created": 1.0, "sites": ["frwiki", "xxwiki"], "shards": [["frwiki", "xxwiki"]], "costs": {}}
+    (tmp_path / "shards" / "plan.json").write_text(json.dumps(plan), encoding="utf-8")
+    status = {"plan": 1.0, "sites": ["frwiki", "xxwiki"], "failed": [], "started": 1.0, "finished": 2.0}
+    (tmp_path / "shards" / "1" / "shard.json").write_text(json.dumps(status), encoding="utf-8")
+    (tmp_path / "editors" / "fr.json").write_text('{"Doc": 12}', encoding="utf-8")
+
+    assert shards.merge_shards(publish=False) == {"sites": 1, "pages": 1}
+    assert pages == [{"Doc": {"count": 12, "site": "fr"}}]
+
+    # the files path skips a missing dump too
+    monkeypatch.setattr(all2, "get_store", lambda: LocalStore(tmp_path / "empty.sqlite"))
+    assert all2.get_all_editors(["fr.json", "xx.json"]) == {"Doc": {"count": 12, "site": "fr"}}
+
+
+def test_shard_needs_a_current_plan(monkeypatch, tmp_path) -> None:
+    monkeypatch.setattr(shards, "plan_file", tmp_path / "plan.json")
+    monkeypatch.setattr(shards.by_site, "list_site_files", lambda: [("frwiki", "fr.json")])
+    counted = []
+    monkeypatch.setattr(shards.by_site, "work_in_all_sites", lambda **kwargs: counted.append(kwargs))
+
+    with pytest.raises(RuntimeError):
+        shards.run_shard(1, 2)
+
+    # a plan for another number of shards, or of other site files, is not reused
+    plan = {"count": 3, "created": time.time(), "sites": ["frwiki"], "shards": [["frwiki"], [], []], "costs": {}}
+    (tmp_path / "plan.json").write_text(json.dumps(plan), encoding="utf-8")
+    with pytest.raises(RuntimeError):
+        shards.run_shard(1, 2)
+    assert shards.get_plan(3) == plan
+    monkeypatch.setattr(shards.by_site, "list_site_files", lambda: [("dewiki", "de.json"), ("frwiki", "fr.json")])
+    assert shards.get_plan(3) == {}
+    assert counted == []
@@ -0,0 +1,81 @@
+"""
+Tests for src.api_sql.sql_cache
+"""
+import os
+import sys
+import time
+
+import pymysql
+import pytest
+
+from src.api_sql import sql_cache, wiki_sql
+
+
+@pytest.fixture
+def replica(monkeypatch, tmp_path):
+    monkeypatch.setattr(sql_cache, "cache_path", tmp_path)
+    monkeypatch.setattr(sql_cache, "_size", None)
+    monkeypatch.setattr(wiki_sql, "GET_SQL", lambda: True)
+
+    calls = []
+
+    def fake_connect(query, db="", host="", values=None, as_tuples=False, raise_errors=False):
+        calls.append(query)
+        if "broken" in query:
+            raise pymysql.OperationalError(1054, "Unknown column")
+        return [("Doc", len(calls))] if as_tuples else [{"actor_name": "Doc", "count": len(calls)}]
+
+    def fake_iter(query, db="", host="", values=None, batch_size=1000, as_tuples=False, raise_errors=False):
+        yield from fake_connect(query, db, host, values, as_tuples)
+
+    monkeypatch.setattr(wiki_sql.mysql_client, "make_sql_connect", fake_connect)
+    monkeypatch.setattr(wiki_sql.mysql_client, "iter_sql_rows", fake_iter)
+    return calls
+
+
+def test_results_are_reused_until_refreshed(replica) -> None:
+    query = "SELECT actor_name, count(*) FROM revision"
+
+    assert wiki_sql.retrieve_sql_results(query, "fr", cache=True) == [{"actor_name": "Doc", "count": 1}]
+    # same query, other whitespace: served from the cache
+    assert wiki_sql.retrieve_sql_results(f"  {query}\n", "fr", cache=True) == [{"actor_name": "Doc", "count": 1}]
+    assert list(wiki_sql.iter_sql_results(query, "fr", as_tuples=True, cache=True)) == [("Doc", 2)]
+    assert list(wiki_sql.iter_sql_results(query, "fr", as_tuples=True, cache=True)) == [("Doc", 2)]
+    assert len(replica) == 2
+
+    assert wiki_sql.retrieve_sql_results(query, "fr", cache=True, refresh=True) == [{"actor_name": "Doc", "count": 3}]
+    assert wiki_sql.retrieve_sql_results(query, "de", cache=True) == [{"actor_name": "Doc", "count": 4}]
+    assert wiki_sql.retrieve_sql_results(query, "fr", cache=False) == [{"actor_name": "Doc", "count": 5}]
+
+
+def test_errors_are_not_cached(replica) -> None:
+    assert wiki_sql.retrieve_sql_results("SELECT broken", "fr", cache=True) == []
+    assert list(wiki_sql.iter_sql_results("SELECT broken", "fr", cache=True)) == []
+    assert wiki_sql.retrieve_sql_results("SELECT broken", "fr", cache=True) == []
+    assert len(replica) == 3
+
+
+def test_expired_and_oldest_entries_go(replica, monkeypatch, tmp_path) -> None:
+    wiki_sql.retrieve_sql_results("SELECT 1", "fr", cache=True)
+    old = time.time() - 2 * sql_cache.SQL_CACHE_TTL
+    for entry in os.scandir(tmp_path):
+        os.utime(entry.path, (old, old))
+
+    wiki_sql.retrieve_sql_results("SELECT 1", "fr", cache=True)
+    assert len(replica) == 2
+
+    # over the size limit: the oldest entries are removed first
+    monkeypatch.setattr(sql_cache, "SQL_CACHE_MAX_MB", 0.0002)
+    for n in range(2, 8):
+        wiki_sql.retrieve_sql_results(f"SELECT {n}", "fr", cache=True)
+        time.sleep(0.01)
+    assert 0 < len(os.listdir(tmp_path)) < 7
+    assert wiki_sql.retrieve_sql_results("SELECT 7", "fr", cache=True) == [{"actor_name": "Doc", "count": 8}]
+
+
+def test_only_nosqlcache_refreshes_the_sql_cache(monkeypatch) -> None:
+    monkeypatch.setattr(sys, "argv", ["start.py", "nocache"])
+    assert not sql_cache.refreshing()
+
+    monkeypatch.setattr(sys, "argv", ["start.py", "nosqlcache"])
+    assert sql_cache.refreshing()
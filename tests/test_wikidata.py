@@ -0,0 +1,99 @@
+"""
+Tests for src.wiki.wikidata
+"""
+import json
+
+import pytest
+import requests
+
+from src.wiki import wikidata
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, data=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = json.dumps(data or {}).encode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}", response=self)
+
+
+class FakeSession:
+    """Replies with the given responses in turn."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.posts = 0
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        self.posts += 1
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def session(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(wikidata.time, "sleep", sleeps.append)
+
+    def make(*responses):
+        fake = FakeSession(*responses)
+        monkeypatch.setattr(wikidata, "initialize_session", lambda: fake)
+        return fake, sleeps
+
+    return make
+
+
+MAXLAG = {"error": {"code": "maxlag", "info": "Waiting for a database server: 6 seconds lagged."}}
+OK = {"entities": {"Q1": {}}}
+
+
+def test_maxlag_backs_off(session) -> None:
+    fake, sleeps = session(FakeResponse(data=MAXLAG), FakeResponse(data=MAXLAG), FakeResponse(data=OK))
+
+    assert wikidata.wikidataapi_post({"action": "wbgetentities"}) == OK
+    assert fake.posts == 3
+    assert sleeps == [2.0, 4.0]
+
+
+def test_retry_after_wins_over_backoff(session) -> None:
+    fake, sleeps = session(
+        FakeResponse(data=MAXLAG, headers={"Retry-After": "5"}),
+        FakeResponse(429, headers={"Retry-After": "7"}),
+        # shorter than the backoff: the backoff is kept
+        FakeResponse(503, headers={"Retry-After": "1"}),
+        FakeResponse(data=OK),
+    )
+
+    assert wikidata.wikidataapi_post({"action": "wbgetentities"}) == OK
+    assert sleeps == [5.0, 7.0, 8.0]
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_throttling_and_server_errors_are_retried(session, status) -> None:
+    fake, sleeps = session(FakeResponse(status), FakeResponse(data=OK))
+
+    assert wikidata.wikidataapi_post({"action": "wbgetentities"}) == OK
+    assert fake.posts == 2
+    assert len(sleeps) == 1
+
+
+@pytest.mark.parametrize("status", [400, 403, 404])
+def test_client_errors_are_not_retried(session, status) -> None:
+    fake, sleeps = session(FakeResponse(status), FakeResponse(data=OK))
+
+    assert wikidata.wikidataapi_post({"action": "wbgetentities"}) is None
+    assert fake.posts == 1
+    assert sleeps == []
+
+
+def test_gives_up_after_max_tries(session) -> None:
+    fake, sleeps = session(*[FakeResponse(503) for _ in range(3)])
+
+    assert wikidata.wikidataapi_post({"action": "wbgetentities"}, max_tries=3) is None
+    assert fake.posts == 3
+    assert sleeps == [2.0, 4.0]